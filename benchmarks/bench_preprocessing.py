@@ -0,0 +1,217 @@
+"""
+Benchmarks for the preprocessing pipelines on synthetic patients.
+
+Every case generates a phantom (see phantom.py), then runs one pipeline
+function in a fresh interpreter so its peak RSS is its own. The stage hooks in
+lizard/instrument.py split the wall time into load, align, clamp, mask,
+crop, resample, write, ... and the results are compared with baseline.json.
+
+    python benchmarks/bench_preprocessing.py                    # run and compare
+    python benchmarks/bench_preprocessing.py --update-baseline  # store new baseline
+    python benchmarks/bench_preprocessing.py -k misaligned -r 3
+
+Exits with status 1 if any case is slower (or uses more memory) than the
+baseline by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+REGRESSION_THRESHOLD = 0.25
+
+# name -> pipeline, phantom parameters and extra environment
+CASES = {
+    "preprocess_default": dict(pipeline="process_patient", num_slices=80),
+    "preprocess_thin_slices": dict(pipeline="process_patient", num_slices=200, spacing=(0.8, 0.8, 1.0)),
+    "preprocess_misaligned": dict(pipeline="process_patient", num_slices=80, misaligned=0.4),
+    "preprocess_empty_mask": dict(pipeline="process_patient", num_slices=80, empty_mask=True),
+    "preprocess_resample_budget": dict(pipeline="process_patient", num_slices=80,
+                                       env={"LIZARD_RESAMPLE_BUDGET_MB": "16"}),
+    "gold_standard_default": dict(pipeline="process_nnunet_gold_standard", num_slices=80),
+    "gold_standard_misaligned": dict(pipeline="process_nnunet_gold_standard", num_slices=80, misaligned=0.4),
+    "liver_only_default": dict(pipeline="process_and_save_liver_only", num_slices=80),
+    "liver_stats_default": dict(pipeline="get_liver_stats", num_slices=80),
+    "liver_stats_thin_slices": dict(pipeline="get_liver_stats", num_slices=200, spacing=(0.8, 0.8, 1.0)),
+    "dcm_to_nii_default": dict(pipeline="dcm_to_nii", num_slices=80),
+}
+PHANTOM_KEYS = ("num_slices", "size", "spacing", "misaligned", "empty_mask", "regions")
+
+
+def load_pipeline(pipeline, row, data_root, out_dir):
+    """
+    Imports the script behind pipeline and returns a no-argument callable that
+    runs it on the phantom patient described by row (imports are not timed).
+    """
+    pid = row["Patient_ID"].replace("Lizard_ID", "")
+    series_root = os.path.join(data_root, row["Patient_ID"], f"STL_DICOM_{row['Patient_ID']}")
+    if pipeline == "process_patient":
+        from lizard import nnunet_preprocessing
+        return lambda: nnunet_preprocessing.process_patient(dict(row, pid_str=pid), data_root, out_dir)
+    if pipeline == "process_nnunet_gold_standard":
+        from lizard import extract_from_mask
+        from lizard.roi_reading import liver_z_range
+        z_range = liver_z_range(row) if extract_from_mask.ROI_READING else None
+        return lambda: extract_from_mask.process_nnunet_gold_standard(pid, data_root, out_dir, z_range)
+    if pipeline == "process_and_save_liver_only":
+        from lizard import extract_and_resample
+        return lambda: extract_and_resample.process_and_save_liver_only(pid, data_root, out_dir)
+    if pipeline == "get_liver_stats":
+        from lizard import liver_stats
+        return lambda: liver_stats.get_liver_stats(os.path.join(series_root, "Liver"))
+    if pipeline == "dcm_to_nii":
+        from lizard import dcm_to_nii
+        return lambda: dcm_to_nii.convert_patient(row["Patient_ID"], data_root)
+    raise ValueError(f"Unknown pipeline: {pipeline}")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_case(case, data_root, out_dir):
+    """Child process: runs one case and prints its measurements as JSON."""
+    sys.path.insert(0, REPO_DIR)
+    from lizard.instrument import add_listener
+
+    with open(os.path.join(data_root, "row.json")) as f:
+        row = json.load(f)
+    params = CASES[case]
+
+    run = load_pipeline(params["pipeline"], row, data_root, out_dir)
+    # The package imports its dependencies on first use; keep that out of the timing
+    import numpy, pandas, pydicom, SimpleITK  # noqa: F401
+    stages = defaultdict(float)
+    add_listener(lambda name, seconds, fields: stages.__setitem__(name, stages[name] + seconds))
+
+    start = time.perf_counter()
+    run()
+    wall = time.perf_counter() - start
+
+    size = params.get("size", 96)
+    voxels = size * size * params["num_slices"]
+    print(json.dumps({
+        "wall_s": wall,
+        "voxels": voxels,
+        "voxels_per_s": voxels / wall if wall > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": dict(stages),
+    }))
+
+
+def run_case(case, work_dir, repeat):
+    """Generates the phantom once and keeps the fastest of repeat runs."""
+    sys.path.insert(0, BENCH_DIR)
+    from phantom import make_patient
+
+    data_root = os.path.join(work_dir, case, "data")
+    phantom_args = {k: v for k, v in CASES[case].items() if k in PHANTOM_KEYS}
+    row = make_patient(data_root, 1, **phantom_args)
+    with open(os.path.join(data_root, "row.json"), 'w') as f:
+        json.dump(row, f)
+
+    env = dict(os.environ)
+    # Benchmarks measure decoding, so no persistent DICOM cache unless asked for
+    if not env.get("LIZARD_BENCH_CACHE"):
+        env.pop("LIZARD_CACHE_DIR", None)
+    env.update(CASES[case].get("env", {}))
+
+    best = None
+    for i in range(repeat):
+        out_dir = os.path.join(work_dir, case, f"out{i}")
+        os.makedirs(out_dir, exist_ok=True)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", case, data_root, out_dir],
+                              capture_output=True, text=True, env=env, cwd=out_dir)
+        if proc.returncode != 0:
+            return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["wall_s"] < best["wall_s"]:
+            best = result
+    return best
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of 'case: metric a -> b' strings for every regression."""
+    regressions = []
+    for case, result in results.items():
+        ref = baseline.get(case)
+        if not ref or "error" in result or "error" in ref:
+            continue
+        for metric in ("wall_s", "peak_rss_mb"):
+            if result[metric] > ref[metric] * (1.0 + threshold):
+                regressions.append(f"{case}: {metric} {ref[metric]:.3f} -> {result[metric]:.3f}")
+    return regressions
+
+
+def print_report(results, baseline):
+    stage_names = sorted({s for r in results.values() for s in r.get("stages", {})})
+    print(f"{'case':<28}{'wall s':>9}{'vs base':>9}{'Mvox/s':>9}{'RSS MB':>9}  " + "".join(f"{s:>9}" for s in stage_names))
+    for case, r in results.items():
+        if "error" in r:
+            print(f"{case:<28}  ERROR: {r['error']}")
+            continue
+        ref = baseline.get(case, {})
+        delta = f"{(r['wall_s'] / ref['wall_s'] - 1) * 100:+.0f}%" if ref.get("wall_s") else "-"
+        stages = "".join(f"{r['stages'].get(s, 0.0):>9.3f}" for s in stage_names)
+        print(f"{case:<28}{r['wall_s']:>9.3f}{delta:>9}{r['voxels_per_s'] / 1e6:>9.2f}{r['peak_rss_mb']:>9.1f}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", "--keyword", help="only run cases whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="keep the generated phantoms and outputs")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure_case(*args.child)
+        return 0
+
+    cases = [c for c in CASES if not args.keyword or args.keyword in c]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix="lizard_bench_")
+    try:
+        results = {case: run_case(case, work_dir, args.repeat) for case in cases}
+    finally:
+        if args.keep:
+            print(f"Phantoms and outputs kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results, baseline)
+
+    if args.update_baseline:
+        baseline.update({c: r for c, r in results.items() if "error" not in r})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Start-up time of the lizard package: what `lizard --help`, a spawned pool
+worker or a notebook pays before any work is done.
+
+Every case runs in a fresh interpreter; the fastest of --repeat runs is kept
+and compared with startup_baseline.json. The report also lists which heavy
+dependencies each case ended up importing (none, for everything but the
+eager reference case).
+
+    python benchmarks/bench_startup.py                    # run and compare
+    python benchmarks/bench_startup.py --update-baseline  # store new baseline
+    python benchmarks/bench_startup.py -r 20
+
+Exits with status 1 if any case is slower than the baseline by more than
+--threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "startup_baseline.json")
+# Start-up times are small and noisy: only flag large slowdowns
+REGRESSION_THRESHOLD = 0.5
+HEAVY = ("SimpleITK", "numpy", "pandas", "pydicom", "dicom2nifti")
+
+# name -> Python statement run by the child interpreter
+CASES = {
+    "interpreter": "pass",
+    "cli_help": "import sys; sys.argv = ['lizard', '--help']; from lizard.cli import main; main()",
+    "cli_subcommand_help": "import sys; sys.argv = ['lizard', 'nnunet', '--help']; from lizard.cli import main; main()",
+    "import_package": "import lizard",
+    "import_worker_module": "import lizard.nnunet_preprocessing",
+    "import_all_modules": "import lizard.nnunet_preprocessing, lizard.preprocess_service, lizard.patch_sampler, "
+                          "lizard.dcm_to_nii, lizard.liver_stats, lizard.extract_from_mask, lizard.nnunet_Lizard",
+    # What every start cost when the dependencies were imported eagerly
+    "eager_dependencies": "import SimpleITK, numpy, pandas, pydicom",
+}
+
+# Appended to a case to report the heavy modules it imported, from an exit hook
+REPORT = """
+import atexit
+@atexit.register
+def _report():
+    import sys, json
+    loaded = [m for m in {heavy!r} if m in sys.modules]
+    sys.stderr.write("LOADED " + json.dumps(loaded) + "\\n")
+"""
+
+
+def _run(statement, env):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", statement], capture_output=True, text=True, env=env, cwd=REPO_DIR)
+    return time.perf_counter() - start, proc
+
+
+def run_case(case, repeat):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    statement = CASES[case]
+    best = None
+    for _ in range(repeat):
+        seconds, proc = _run(statement, env)
+        if proc.returncode != 0:
+            return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        best = seconds if best is None else min(best, seconds)
+    _, proc = _run(REPORT.format(heavy=HEAVY) + statement, env)
+    loaded = [json.loads(line[7:]) for line in proc.stderr.splitlines() if line.startswith("LOADED ")]
+    return {"wall_ms": best * 1000.0, "loaded": loaded[-1] if loaded else []}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, result in results.items():
+        ref = baseline.get(case)
+        if not ref or "error" in result or "error" in ref:
+            continue
+        if result["wall_ms"] > ref["wall_ms"] * (1.0 + threshold):
+            regressions.append(f"{case}: wall_ms {ref['wall_ms']:.1f} -> {result['wall_ms']:.1f}")
+    return regressions
+
+
+def print_report(results, baseline):
+    print(f"{'case':<24}{'wall ms':>9}{'vs base':>9}  heavy modules imported")
+    for case, r in results.items():
+        if "error" in r:
+            print(f"{case:<24}  ERROR: {r['error']}")
+            continue
+        ref = baseline.get(case, {})
+        delta = f"{(r['wall_ms'] / ref['wall_ms'] - 1) * 100:+.0f}%" if ref.get("wall_ms") else "-"
+        print(f"{case:<24}{r['wall_ms']:>9.1f}{delta:>9}  {', '.join(r['loaded']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", "--keyword", help="only run cases whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="runs per case; the fastest is kept")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {case: run_case(case, args.repeat) for case in CASES if not args.keyword or args.keyword in case}
+    print_report(results, baseline)
+
+    if args.update_baseline:
+        baseline.update({c: r for c, r in results.items() if "error" not in r})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
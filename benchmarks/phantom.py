@@ -0,0 +1,90 @@
+"""
+Synthetic Lizard patients for the benchmarks.
+
+make_patient() writes DICOM series in the layout the preprocessing scripts expect:
+
+    Lizard_ID<pid>/STL_DICOM_Lizard_ID<pid>/{CorrespImage,Liver,Portal,Vein,Region1..}
+
+The CT is random noise in the -300..400 HU range, the liver an ellipsoid in the
+middle of the volume, Portal and Vein two thin tubes through it and the Region*
+masks split the liver along x. Masks can be shifted against the CT (the
+"Patient 54" case) or left empty.
+"""
+import os
+import time
+
+import numpy as np
+import SimpleITK as sitk
+
+DEFAULT_SPACING = (0.8, 0.8, 2.5)
+DEFAULT_ORIGIN = (-40.0, -40.0, -100.0)
+
+
+def write_series(arr, spacing, origin, path, series_uid, modality="CT"):
+    """Writes a (z, y, x) int16 array as one DICOM file per slice."""
+    os.makedirs(path, exist_ok=True)
+    img = sitk.GetImageFromArray(arr)
+    img.SetSpacing(spacing)
+    img.SetOrigin(origin)
+    writer = sitk.ImageFileWriter()
+    writer.KeepOriginalImageUIDOn()
+    study_date = time.strftime("%Y%m%d")
+    for i in range(img.GetDepth()):
+        s = img[:, :, i]
+        s.SetMetaData("0008|0020", study_date)
+        s.SetMetaData("0008|0060", modality)
+        s.SetMetaData("0020|000d", "1.2.826.0.1.3680043.2.1125.1")
+        s.SetMetaData("0020|000e", series_uid)
+        s.SetMetaData("0008|0018", f"{series_uid}.{i + 1}")
+        s.SetMetaData("0020|0013", str(i + 1))
+        s.SetMetaData("0020|0032", "\\".join(map(str, img.TransformIndexToPhysicalPoint((0, 0, i)))))
+        s.SetMetaData("0020|0037", "1\\0\\0\\0\\1\\0")
+        s.SetMetaData("0028|0030", f"{spacing[1]}\\{spacing[0]}")
+        s.SetMetaData("0018|0050", str(spacing[2]))
+        writer.SetFileName(os.path.join(path, f"IMG{i:04d}.dcm"))
+        writer.Execute(s)
+
+
+def make_patient(root, pid, num_slices=60, size=96, spacing=DEFAULT_SPACING, origin=DEFAULT_ORIGIN,
+                 misaligned=0.0, empty_mask=False, regions=2, seed=0):
+    """
+    Writes one synthetic patient below root.
+    misaligned shifts every mask series by that many mm along x.
+    Returns a liver_slice.csv style dict (Patient_ID, First/Last_Liver_Slice, ...).
+    """
+    rng = np.random.default_rng(seed)
+    base = os.path.join(root, f"Lizard_ID{pid}", f"STL_DICOM_Lizard_ID{pid}")
+    nz, n = num_slices, size
+
+    ct = rng.integers(-300, 400, size=(nz, n, n)).astype(np.int16)
+    zz, yy, xx = np.ogrid[:nz, :n, :n]
+    liver = (((zz - nz / 2) / (nz / 4)) ** 2 + ((yy - n / 2) / (n / 4)) ** 2
+             + ((xx - n / 2) / (n / 3)) ** 2 < 1)
+    if empty_mask:
+        liver = np.zeros_like(liver)
+    portal = np.broadcast_to((abs(yy - n / 2) < 2) & (abs(xx - n / 2) < 2), liver.shape) & liver
+    vein = np.broadcast_to((abs(yy - n / 2 - 6) < 2) & (abs(zz - nz / 2) < 2), liver.shape) & liver
+
+    uid = f"1.2.826.0.1.3680043.2.1125.{pid}"
+    mask_origin = (origin[0] + misaligned, origin[1], origin[2])
+    write_series(ct, spacing, origin, os.path.join(base, "CorrespImage"), uid + ".1")
+    write_series(liver.astype(np.int16) * 255, spacing, mask_origin, os.path.join(base, "Liver"), uid + ".2")
+    write_series(portal.astype(np.int16), spacing, mask_origin, os.path.join(base, "Portal"), uid + ".3")
+    write_series(vein.astype(np.int16), spacing, mask_origin, os.path.join(base, "Vein"), uid + ".4")
+    for r in range(regions):
+        half = (xx < n / 2) if r % 2 == 0 else (xx >= n / 2)
+        region = (liver & half).astype(np.int16) * 255
+        write_series(region, spacing, mask_origin, os.path.join(base, f"Region{r + 1}"), uid + f".{5 + r}")
+
+    z_idx = np.flatnonzero(liver.any(axis=(1, 2)))
+    if z_idx.size:
+        first, last = int(z_idx[0]), int(z_idx[-1])
+    else:
+        first, last = nz // 4, 3 * nz // 4
+    return {
+        "Patient_ID": f"Lizard_ID{pid}",
+        "First_Liver_Slice": first,
+        "Last_Liver_Slice": last,
+        "Centroid_Slice": (first + last) // 2,
+        "Total_Slices_with_Liver": last - first + 1,
+    }
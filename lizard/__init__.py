@@ -0,0 +1,46 @@
+"""
+LIZARD liver vessel preprocessing.
+
+The pipeline modules are submodules (lizard.nnunet_preprocessing, ...); the
+helpers most often used on their own are available at the top level:
+
+    from lizard import load_dicom_series, process_patient
+
+Importing the package loads nothing but this file: a top-level name imports
+its submodule on first access, and SimpleITK, numpy, pandas and pydicom are
+only imported when first used (see lazy.py).
+"""
+import importlib
+
+__version__ = "0.1.0"
+
+# Top-level name -> submodule defining it
+_EXPORTS = {
+    "load_dicom_series": "dicom_cache",
+    "load_dicom_slab": "dicom_cache",
+    "write_image": "nii_writer",
+    "run_patients": "patient_pool",
+    "resample_iso": "nnunet_Lizard",
+    "resample_letterbox": "nnunet_preprocessing",
+    "process_patient": "nnunet_preprocessing",
+    "load_study": "nnunet_preprocessing",
+    "resample_to_1mm_isotropic": "resample_isometric",
+    "open_letterbox": "letterbox",
+    "PatchSampler": "patch_sampler",
+    "open_pyramid": "pyramid",
+}
+
+__all__ = ["__version__"] + sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
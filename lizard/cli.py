@@ -0,0 +1,114 @@
+"""
+`lizard` command line: one entry point for the batch pipelines.
+
+    lizard stats                        mask statistics of every patient -> CSV
+    lizard convert [--engine sitk]      DICOM series -> NIfTI next to them
+    lizard extract {slices,liver-only,gold}
+    lizard nnunet [--iso]               nnU-Net raw dataset (256^3 letterbox, or 1 mm isotropic)
+    lizard index | telemetry | service  (the tools' own options follow)
+
+Paths default to the cluster layout in paths.py (LIZARD_DATA_ROOT, ...); the
+LIZARD_* switches of the pipelines keep working as environment variables.
+Nothing but argparse is imported until a subcommand runs, so --help and shell
+completion stay instant.
+"""
+import os
+import sys
+import argparse
+import importlib
+
+from . import __version__
+from .paths import DATA_ROOT, NNUNET_RAW_DIR, OUTPUT_ROOT, SLICE_CSV, STATS_CSV
+
+# Subcommands handing their arguments to the module's own main(argv)
+DELEGATED = {
+    "index": ("series_index", "build or refresh the DICOM header index"),
+    "telemetry": ("telemetry_summary", "per-stage summary of a LIZARD_TELEMETRY file"),
+    "service": ("preprocess_service", "local preprocessing service for inference studies"),
+}
+EXTRACT_OUTPUTS = {"slices": "Processed_Livers", "liver-only": "Processed_Livers_Only", "gold": "Processed_nnUNet"}
+
+
+def _module(name):
+    return importlib.import_module(f".{name}", __package__)
+
+
+def _options(args, **names):
+    # Only the options given on the command line; the rest keep the module defaults
+    return {param: getattr(args, option) for param, option in names.items() if getattr(args, option) is not None}
+
+
+def cmd_stats(args):
+    _module("liver_stats").run(args.data_root, args.output)
+
+
+def cmd_convert(args):
+    _module("dcm_to_nii").run(args.data_root, **_options(args, num_workers="workers", engine="engine",
+                                                          force="force"))
+
+
+def cmd_extract(args):
+    output_dir = args.output_dir or os.path.join(OUTPUT_ROOT, EXTRACT_OUTPUTS[args.variant])
+    csv_path = args.csv or STATS_CSV
+    if args.variant == "slices":
+        _module("extract_liver").run(csv_path, args.data_root, output_dir)
+    elif args.variant == "liver-only":
+        _module("extract_and_resample").run(csv_path, args.data_root, output_dir)
+    else:
+        _module("extract_from_mask").run(csv_path, args.data_root, output_dir, **_options(args, num_workers="workers"))
+
+
+def cmd_nnunet(args):
+    csv_path = args.csv or SLICE_CSV
+    if args.iso:
+        _module("nnunet_Lizard").run(csv_path, args.data_root, args.raw_dir, **_options(args, num_workers="workers"))
+    else:
+        _module("nnunet_preprocessing").run(csv_path, args.data_root, args.raw_dir,
+                                            **_options(args, num_workers="workers", force="force"))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="lizard", description="LIZARD liver vessel preprocessing")
+    parser.add_argument("-V", "--version", action="version", version=f"%(prog)s {__version__}")
+    sub = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    def add(name, func, help):
+        p = sub.add_parser(name, help=help, description=help)
+        p.set_defaults(func=func)
+        p.add_argument("--data-root", default=DATA_ROOT, help="Mainz_LIZARD folder (default: %(default)s)")
+        return p
+
+    p = add("stats", cmd_stats, "liver/vessel mask statistics of every patient")
+    p.add_argument("-o", "--output", default="liver_slice_stats.csv", help="CSV to write (default: %(default)s)")
+
+    p = add("convert", cmd_convert, "convert every DICOM series to NIfTI")
+    p.add_argument("--engine", choices=("dicom2nifti", "sitk"), help="default: LIZARD_DCM2NII_ENGINE or dicom2nifti")
+    p.add_argument("--workers", type=int, help="parallel series (default: LIZARD_WORKERS or 1)")
+    p.add_argument("--force", action="store_true", default=None, help="reconvert up-to-date series")
+
+    p = add("extract", cmd_extract, "liver crops at 1 mm (slices, liver-only or nnU-Net gold standard)")
+    p.add_argument("variant", choices=sorted(EXTRACT_OUTPUTS))
+    p.add_argument("--csv", help=f"liver slice statistics (default: {STATS_CSV})")
+    p.add_argument("--output-dir", help=f"default: {OUTPUT_ROOT}/<Processed_* folder of the variant>")
+    p.add_argument("--workers", type=int, help="parallel patients, gold only (default: LIZARD_WORKERS or 1)")
+
+    p = add("nnunet", cmd_nnunet, "build the nnU-Net raw dataset")
+    p.add_argument("--csv", help=f"liver slices per patient (default: {SLICE_CSV})")
+    p.add_argument("--raw-dir", default=NNUNET_RAW_DIR, help="nnU-Net raw dataset folder (default: %(default)s)")
+    p.add_argument("--workers", type=int, help="parallel patients (default: LIZARD_WORKERS or 1)")
+    p.add_argument("--force", action="store_true", default=None, help="reprocess up-to-date patients")
+    p.add_argument("--iso", action="store_true", help="1 mm isotropic crops instead of the 256^3 letterbox")
+
+    for name, (_, help) in DELEGATED.items():
+        sub.add_parser(name, help=help, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] in DELEGATED:
+        module, _ = DELEGATED[argv[0]]
+        return _module(module).main(argv[1:], prog=f"lizard {argv[0]}") or 0
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
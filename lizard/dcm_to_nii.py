@@ -0,0 +1,125 @@
+#script to :
+# 1. Convert dicom to nii.
+# 2. Organize files in nnunet format.
+#
+# Every (patient, anatomy) series is one job on the worker pool (LIZARD_WORKERS).
+# Series whose NIfTI output is newer than all their DICOM files are skipped
+# (LIZARD_FORCE=1 reconverts everything).
+# LIZARD_DCM2NII_ENGINE picks the converter:
+#   "dicom2nifti"  dicom2nifti.convert_directory(..., reorient=True) as before
+#   "sitk"         SimpleITK, one <anatomy>.nii.gz per series; Vein/Portal are
+#                  written on the CorrespImage grid (nearest neighbour if a mask
+#                  series has its own geometry), so nothing is reoriented per series
+
+import os
+
+from .dicom_cache import load_dicom_series, series_geometry
+from .instrument import set_patient, stage
+from .lazy import lazy_import
+from .nii_writer import nii_suffix, write_image
+from .paths import DATA_ROOT, study_path
+from .patient_pool import run_patients
+from .separable_resample import execute
+from .series_index import list_patients, list_series, series_file_names
+from .volume_ops import image_grid, same_grid
+
+sitk = lazy_import("SimpleITK")
+
+interested_anatomy = ("Vein", "Portal", "CorrespImage")
+
+NUM_WORKERS = int(os.environ.get("LIZARD_WORKERS", 1))
+ENGINE = os.environ.get("LIZARD_DCM2NII_ENGINE", "dicom2nifti")
+FORCE_REBUILD = os.environ.get("LIZARD_FORCE") == "1"
+
+def load_dicom2nifti():
+    # Imported on first use only: the sitk engine does not need it
+    try:
+        import dicom2nifti
+        import dicom2nifti.settings as settings
+    except ImportError:
+        return None
+    settings.disable_validate_slicecount()
+    return dicom2nifti
+
+def is_converted(dicom_dir, nii_dir):
+    """
+    True if nii_dir holds NIfTI files that are all newer than every DICOM file.
+    A missing or empty series folder is not converted; convert_series then
+    reports it as failed.
+    """
+    try:
+        outputs = [os.path.join(nii_dir, f) for f in os.listdir(nii_dir) if f.endswith((".nii", ".nii.gz"))]
+        with os.scandir(dicom_dir) as entries:
+            input_mtimes = [e.stat().st_mtime for e in entries if e.is_file()]
+        if not outputs or not input_mtimes:
+            return False
+        return min(os.path.getmtime(f) for f in outputs) > max(input_mtimes)
+    except FileNotFoundError:
+        return False
+
+def to_ct_grid(img, ct_geometry):
+    """Nearest-neighbour resample of a mask series onto the CT grid (no-op if already on it)."""
+    if same_grid(image_grid(img), ct_geometry):
+        return img
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetSize(ct_geometry["size"])
+    resampler.SetOutputSpacing(ct_geometry["spacing"])
+    resampler.SetOutputOrigin(ct_geometry["origin"])
+    resampler.SetOutputDirection(ct_geometry["direction"])
+    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+    resampler.SetTransform(sitk.Transform())
+    return execute(resampler, img)
+
+def convert_series(patient, anatomy, data_root, engine=None, force=FORCE_REBUILD):
+    """Converts one anatomy series of one patient. Returns "converted", "skipped" or "failed"."""
+    engine = engine or ENGINE
+    set_patient(patient)
+    dicom_base_input_path = study_path(data_root, patient)
+    anatomy_dicom_path = os.path.join(dicom_base_input_path, anatomy)
+    anatomy_nii_output_path = os.path.join(data_root, patient, "NII_" + patient, anatomy + "/")
+
+    if not force and is_converted(anatomy_dicom_path, anatomy_nii_output_path):
+        return "skipped"
+    os.makedirs(anatomy_nii_output_path, exist_ok=True)
+
+    try:
+        with stage("convert"):
+            if engine == "sitk":
+                img = load_dicom_series(anatomy_dicom_path)
+                if anatomy != "CorrespImage":
+                    # Header-only geometry of the CT; the CT voxels are not needed
+                    ct_names = series_file_names(os.path.join(dicom_base_input_path, "CorrespImage"))
+                    if ct_names:
+                        img = to_ct_grid(img, series_geometry(ct_names))
+                write_image(img, os.path.join(anatomy_nii_output_path, anatomy + nii_suffix()),
+                            is_label=anatomy != "CorrespImage")
+            elif engine == "dicom2nifti":
+                dicom2nifti = load_dicom2nifti()
+                if dicom2nifti is None:
+                    raise ImportError("dicom2nifti is not installed (or use LIZARD_DCM2NII_ENGINE=sitk)")
+                dicom2nifti.convert_directory(anatomy_dicom_path, anatomy_nii_output_path, compression=True, reorient=True)
+            else:
+                raise ValueError(f"Unknown conversion engine: {engine}")
+    except Exception as e:
+        print(f"Failed {patient} - {anatomy}: {e}")
+        return "failed"
+    print(f"Converted DICOM to NIfTI for {patient} - {anatomy} and saved to {anatomy_nii_output_path}")
+    return "converted"
+
+#create a new folder inside each patient folder to store nii files
+def series_jobs(patient, data_root):
+    dicom_base_input_path = study_path(data_root, patient)
+    anatomy_dirs = [d for d in list_series(dicom_base_input_path) if d.startswith(interested_anatomy)]
+    return [(patient, anatomy, data_root) for anatomy in sorted(anatomy_dirs)]
+
+def convert_patient(patient, data_root):
+    return [convert_series(*job) for job in series_jobs(patient, data_root)]
+
+def run(data_root=DATA_ROOT, num_workers=NUM_WORKERS, engine=None, force=FORCE_REBUILD):
+    jobs = [job + (engine, force) for patient in list_patients(data_root) for job in series_jobs(patient, data_root)]
+    results = run_patients(convert_series, jobs, num_workers, failed="failed")
+    print(f"Converted {results.count('converted')}, up to date {results.count('skipped')}, "
+          f"failed {results.count('failed')} of {len(jobs)} series")
+
+if __name__ == "__main__":
+    run()
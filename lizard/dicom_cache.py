@@ -0,0 +1,220 @@
+"""
+Persistent cache of decoded DICOM series.
+
+Every script decodes the same CorrespImage / Liver / Portal / Vein / Region*
+folders on every run. load_dicom_series() stores each decoded series once as an
+uncompressed .npy volume plus a small JSON file with its geometry, and later
+runs memory-map that volume instead of going through GDCM again.
+
+The cache is enabled by pointing LIZARD_CACHE_DIR at a directory (ideally on
+local disk). Its total size is bounded by LIZARD_CACHE_MAX_GB (default 50);
+the least recently used entries are evicted first.
+"""
+import os
+import json
+import math
+import hashlib
+
+from .instrument import timed
+from .lazy import lazy_import
+from .series_index import indexed_geometry, series_file_names
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+CACHE_DIR = os.environ.get("LIZARD_CACHE_DIR")
+CACHE_MAX_BYTES = int(float(os.environ.get("LIZARD_CACHE_MAX_GB", 50)) * 1024**3)
+
+
+def series_key(dicom_names, z_range=None):
+    """Cache key of a series: its ordered file list with sizes and mtimes (and the slab, if any)."""
+    h = hashlib.sha1()
+    for name in dicom_names:
+        st = os.stat(name)
+        h.update(f"{os.path.abspath(name)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    if z_range is not None:
+        h.update(f"slab|{z_range[0]}|{z_range[1]}".encode())
+    return h.hexdigest()
+
+
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, key + ".npy"), os.path.join(cache_dir, key + ".json")
+
+
+def _cache_map(dicom_names, cache_dir, z_range):
+    cache_dir = cache_dir or CACHE_DIR
+    if not cache_dir:
+        return None, None
+    vol_path, meta_path = _entry_paths(cache_dir, series_key(dicom_names, z_range))
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arr = np.load(vol_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None, None
+    # Touch the entry so eviction sees it as recently used
+    os.utime(meta_path)
+    return arr, meta
+
+
+def cache_lookup(dicom_names, cache_dir=None, z_range=None):
+    """Returns the cached image for this file list, or None on a miss."""
+    arr, meta = _cache_map(dicom_names, cache_dir, z_range)
+    if arr is None:
+        return None
+    img = sitk.GetImageFromArray(arr)
+    img.SetSpacing(meta["spacing"])
+    img.SetOrigin(meta["origin"])
+    img.SetDirection(meta["direction"])
+    return img
+
+
+def cache_store(dicom_names, img, cache_dir=None, max_bytes=None, z_range=None):
+    """Saves a decoded series and evicts old entries beyond the size budget."""
+    cache_dir = cache_dir or CACHE_DIR
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    vol_path, meta_path = _entry_paths(cache_dir, series_key(dicom_names, z_range))
+    meta = {
+        "spacing": img.GetSpacing(),
+        "origin": img.GetOrigin(),
+        "direction": img.GetDirection(),
+        "files": len(dicom_names),
+    }
+
+    # Write to temporary names first so concurrent workers never see half an entry
+    tmp_suffix = f".tmp{os.getpid()}"
+    with open(vol_path + tmp_suffix, 'wb') as f:
+        np.save(f, sitk.GetArrayViewFromImage(img))
+    with open(meta_path + tmp_suffix, 'w') as f:
+        json.dump(meta, f)
+    os.replace(vol_path + tmp_suffix, vol_path)
+    os.replace(meta_path + tmp_suffix, meta_path)
+
+    evict(cache_dir, CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+
+
+def evict(cache_dir, max_bytes):
+    """Deletes least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-len(".json")]
+        vol_path, meta_path = _entry_paths(cache_dir, key)
+        try:
+            size = os.path.getsize(vol_path) + os.path.getsize(meta_path)
+            last_used = os.path.getmtime(meta_path)
+        except OSError:
+            continue
+        entries.append((last_used, size, vol_path, meta_path))
+        total += size
+
+    for _, size, vol_path, meta_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in (meta_path, vol_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+@timed("load")
+def load_dicom_series(directory, reader=None):
+    if reader is None:
+        reader = sitk.ImageSeriesReader()
+    dicom_names = series_file_names(directory, reader)
+    if not dicom_names:
+        raise FileNotFoundError(f"No DICOM files found in {directory}")
+
+    img = cache_lookup(dicom_names)
+    if img is not None:
+        return img
+
+    reader.SetFileNames(dicom_names)
+    img = reader.Execute()
+    cache_store(dicom_names, img)
+    return img
+
+
+def _read_header(path):
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    return reader
+
+
+def series_geometry(dicom_names):
+    """Geometry of the full series from the header index (LIZARD_INDEX) or from its headers."""
+    return indexed_geometry(dicom_names) or header_geometry(dicom_names)
+
+
+def header_geometry(dicom_names):
+    """
+    Size, spacing, origin and direction the ImageSeriesReader gives the full
+    series, computed from the first and last headers only (no pixel decoding).
+    Like ITK, the slice spacing is the first-to-last distance over n - 1.
+    """
+    first = _read_header(dicom_names[0])
+    spacing = list(first.GetSpacing())
+    if len(dicom_names) > 1:
+        last = _read_header(dicom_names[-1])
+        d = [b - a for a, b in zip(first.GetOrigin(), last.GetOrigin())]
+        spacing[2] = math.sqrt(d[0] * d[0] + d[1] * d[1] + d[2] * d[2]) / (len(dicom_names) - 1)
+    return {
+        "size": (first.GetSize()[0], first.GetSize()[1], len(dicom_names)),
+        "spacing": tuple(spacing),
+        "origin": first.GetOrigin(),
+        "direction": first.GetDirection(),
+    }
+
+
+def index_to_point(geometry, index):
+    """Physical point of a voxel index on a grid described by series_geometry()."""
+    # A one-voxel probe so the arithmetic is ITK's own (RegionOfInterest uses the same call)
+    probe = sitk.Image([1, 1, 1], sitk.sitkUInt8)
+    probe.SetSpacing(geometry["spacing"])
+    probe.SetOrigin(geometry["origin"])
+    probe.SetDirection(geometry["direction"])
+    return probe.TransformIndexToPhysicalPoint([int(i) for i in index])
+
+
+def clip_z_range(z_range, num_slices):
+    return max(0, int(z_range[0])), min(num_slices - 1, int(z_range[1]))
+
+
+@timed("load")
+def load_dicom_slab(directory, z_range, reader=None):
+    """
+    Decodes only slices z_range[0]..z_range[1] (inclusive, clipped to the series).
+    The slab gets exactly the spacing, direction and slab origin the full volume
+    would have, so it is indistinguishable from RegionOfInterest on a full read.
+    Returns (slab, clipped z_range, full-series geometry).
+    """
+    if reader is None:
+        reader = sitk.ImageSeriesReader()
+    dicom_names = series_file_names(directory, reader)
+    if not dicom_names:
+        raise FileNotFoundError(f"No DICOM files found in {directory}")
+    z_range = clip_z_range(z_range, len(dicom_names))
+    geometry = series_geometry(dicom_names)
+
+    # A cached full volume is sliced before it is copied, so nothing is decoded
+    full, _ = _cache_map(dicom_names, None, None)
+    if full is not None:
+        slab = sitk.GetImageFromArray(full[z_range[0]:z_range[1] + 1])
+    else:
+        slab = cache_lookup(dicom_names, z_range=z_range)
+        if slab is None:
+            reader.SetFileNames(dicom_names[z_range[0]:z_range[1] + 1])
+            slab = reader.Execute()
+            cache_store(dicom_names, slab, z_range=z_range)
+
+    slab.SetSpacing(geometry["spacing"])
+    slab.SetDirection(geometry["direction"])
+    slab.SetOrigin(index_to_point(geometry, (0, 0, z_range[0])))
+    return slab, z_range, geometry
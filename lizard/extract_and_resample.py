@@ -0,0 +1,108 @@
+import os
+
+from .dicom_cache import load_dicom_series
+from .instrument import set_patient, stage
+from .lazy import lazy_import
+from .nii_writer import nii_suffix, write_image
+from .paths import DATA_ROOT, OUTPUT_ROOT, STATS_CSV, patient_folder, patient_number, series_path
+from .separable_resample import execute
+from .series_index import has_series
+
+sitk = lazy_import("SimpleITK")
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+def process_and_save_liver_only(patient_id, root_dir, output_dir, target_size=(256, 256, 160)):
+    """
+    Standardizes CT volumes by masking everything except the liver, 
+    centering on the organ, and resampling to a uniform 1mm isotropic grid.
+    """
+    folder = patient_folder(patient_id)
+    set_patient(patient_id)
+    
+    # 1. SET UP FOLDER REFERENCES
+    image_dir = series_path(root_dir, patient_id, "CorrespImage")
+    mask_dir = series_path(root_dir, patient_id, "Liver")
+    
+    if not has_series(image_dir) or not has_series(mask_dir):
+        print(f"Skipping {folder}: Missing Image or Mask folder.")
+        return
+
+    # 2. LOAD 3D VOLUMES
+    reader = sitk.ImageSeriesReader()
+    try:
+        # Load CT Volume
+        ct_volume = load_dicom_series(image_dir, reader)
+        # Load Liver Mask Volume
+        mask_volume = load_dicom_series(mask_dir, reader)
+    except FileNotFoundError:
+        return
+
+    # # 3. INTENSITY WINDOWING (LIVER WINDOW)
+    # # Applying this before masking ensures the background is 0
+    # window_filter = sitk.IntensityWindowingImageFilter()
+    # window_filter.SetWindowMinimum(-100)
+    # window_filter.SetWindowMaximum(250)
+    # window_filter.SetOutputMinimum(0)
+    # window_filter.SetOutputMaximum(255)
+    # ct_volume = window_filter.Execute(ct_volume)
+
+    # 4. VOXEL MASKING (ISOLATE LIVER)
+    # Create a binary mask (ensuring only values 0 and 1)
+    with stage("mask", voxels_in=ct_volume.GetNumberOfPixels()):
+        mask_binary = sitk.BinaryThreshold(mask_volume, lowerThreshold=1, upperThreshold=255, insideValue=1, outsideValue=0)
+    
+        # Multiply CT by Mask to zero-out everything else
+        # We cast mask to float/int to match CT pixel type
+        ct_masked = sitk.Multiply(ct_volume, sitk.Cast(mask_binary, ct_volume.GetPixelID()))
+
+    # 5. FIND 3D CENTROID FOR STANDARDIZED CENTERING
+    label_stats = sitk.LabelShapeStatisticsImageFilter()
+    label_stats.Execute(mask_binary)
+    
+    available_labels = label_stats.GetLabels()
+    if not available_labels:
+        print(f"Skipping {folder}: Mask is empty.")
+        return
+    
+    target_label = 1 if 1 in available_labels else available_labels[0]
+    liver_centroid = label_stats.GetCentroid(target_label) 
+
+    # 6. ISOTROPIC RESAMPLING TO UNIFORM GRID
+    # This forces the output to target_size (e.g., 256x256x160)
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetSize(target_size) 
+    resampler.SetOutputSpacing([1.0, 1.0, 1.0]) 
+    resampler.SetOutputDirection(ct_masked.GetDirection())
+    
+    # Position the liver centroid in the middle of the new volume
+    new_origin = [
+        liver_centroid[i] - (target_size[i] * 1.0 / 2.0) for i in range(3)
+    ]
+    resampler.SetOutputOrigin(new_origin)
+    resampler.SetInterpolator(sitk.sitkLinear)
+    resampler.SetDefaultPixelValue(0) # All non-liver area remains black
+    
+    with stage("resample", voxels_in=ct_masked.GetNumberOfPixels()) as fields:
+        final_vol = execute(resampler, ct_masked)
+        fields["voxels_out"] = final_vol.GetNumberOfPixels()
+
+    # 7. SAVE AS NIFTI
+    save_path = os.path.join(output_dir, f"{folder}_liver_ONLY{nii_suffix()}")
+    write_image(final_vol, save_path)
+    print(f"Saved Liver-Only volume: {save_path}")
+
+# --- EXECUTION ---
+def run(csv_path=STATS_CSV, root_data_path=DATA_ROOT, output_path=os.path.join(OUTPUT_ROOT, "Processed_Livers_Only")):
+    os.makedirs(output_path, exist_ok=True)
+    df = pd.read_csv(csv_path) 
+
+    for _, row in df.iterrows():
+        p_num = patient_number(row['Patient_ID'])
+        try:
+            process_and_save_liver_only(p_num, root_data_path, output_path)
+        except Exception as e:
+            print(f"Error on {p_num}: {e}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,128 @@
+import os
+
+from .dicom_cache import load_dicom_series, load_dicom_slab
+from .instrument import set_patient
+from .lazy import lazy_import
+from .nii_writer import nii_suffix
+from .paths import DATA_ROOT, OUTPUT_ROOT, STATS_CSV, patient_folder, patient_number, series_path, study_path
+from .patient_cost import patient_memory_mb
+from .patient_pool import run_patients
+from .resample_plan import apply_plan, make_plan
+from .roi_reading import crop_slab, liver_z_range, load_label_slab, slab_crop_is_exact
+from .series_index import has_series
+from .volume_ops import align_to_reference, clamp_mask_fill
+
+sitk = lazy_import("SimpleITK")
+pd = lazy_import("pandas")
+
+NUM_WORKERS = int(os.environ.get("LIZARD_WORKERS", 1))
+# Decode only the slices around the liver (falls back to a full read when needed)
+ROI_READING = os.environ.get("LIZARD_ROI_READING", "1") == "1"
+
+def process_nnunet_gold_standard(patient_id, root_dir, output_dir, z_range=None):
+    """
+    Standardizes CT volumes for nnU-Net:
+    1. Aligns CT and Mask physical spaces.
+    2. Clips intensity to Liver Window (-100 to 250 HU).
+    3. Crops tightly to the liver bounding box.
+    4. Masks out non-liver anatomy (fills background with -100 HU).
+    5. Resamples to 1mm isotropic resolution.
+    With a z_range (liver slices plus margin) only that slab is decoded; the
+    result is the same as for a full read.
+    """
+    set_patient(patient_id)
+    image_dir = series_path(root_dir, patient_id, "CorrespImage")
+    mask_dir = series_path(root_dir, patient_id, "Liver")
+    
+    if not has_series(image_dir) or not has_series(mask_dir):
+        print(f"Skipping {patient_id}: Missing folder.")
+        return
+
+    # 1. LOAD VOLUMES
+    reader = sitk.ImageSeriesReader()
+    slab = None
+    try:
+        if z_range is None:
+            ct_vol = load_dicom_series(image_dir, reader)
+            mask_vol = load_dicom_series(mask_dir, reader)
+        else:
+            ct_vol, z_range, geometry = load_dicom_slab(image_dir, z_range, reader)
+            slab = (z_range, geometry)
+            mask_vol = load_label_slab(mask_dir, slab, reader)
+    except FileNotFoundError:
+        return
+
+    # 2. ALIGN PHYSICAL SPACES (Fixes the "Inputs do not occupy same physical space" error)
+    # This ensures the mask matches the CT's grid exactly.
+    mask_vol = align_to_reference(mask_vol, ct_vol)
+
+    # 3. INTENSITY CLAMPING (-100 to 250 HU)
+    # Standard liver range; preserves raw HU values for nnU-Net.
+    # Done together with the masking in step 6, on the cropped region only.
+
+    # 4. GET TIGHT BOUNDING BOX FROM MASK
+    label_stats = sitk.LabelShapeStatisticsImageFilter()
+    label_stats.Execute(mask_vol)
+    
+    available_labels = label_stats.GetLabels()
+    if not available_labels:
+        if slab is not None:
+            return process_nnunet_gold_standard(patient_id, root_dir, output_dir)
+        print(f"Skipping {patient_id}: Mask appears empty.")
+        return
+    
+    # Detect label (handles 1, 255, etc.)
+    target_label = 1 if 1 in available_labels else available_labels[0]
+    bbox = label_stats.GetBoundingBox(target_label)
+    
+    # 5. CROP BOTH CT AND MASK
+    # Buffer of 3 voxels to provide a tiny bit of context
+    buffer = 3
+    if slab is not None and not slab_crop_is_exact(bbox, buffer, slab):
+        # Liver reaches the slab edge: decode the whole series instead
+        return process_nnunet_gold_standard(patient_id, root_dir, output_dir)
+    size = [min(ct_vol.GetSize()[i] - bbox[i], bbox[i+3] + 2*buffer) for i in range(3)]
+    index = [max(0, bbox[i] - buffer) for i in range(3)]
+    
+    # Crop window + 1mm isotropic output grid, planned once from the bounding box
+    plan = make_plan(ct_vol, index, size, slab)
+    ct_crop = crop_slab(ct_vol, size, index, slab)
+    mask_crop = crop_slab(mask_vol, size, index, slab)
+
+    # 6. CLAMPING + MASKING (Set non-liver areas to -100 HU)
+    # Same as (CT * Mask) + (InverseMask * -100) with Mask = BinaryThreshold(1..255),
+    # in one pass over one float32 buffer
+    ct_masked = clamp_mask_fill(ct_crop, mask_crop, (-100, 250), -100.0, mask_range=(1, 255))
+
+    # 7. RESAMPLE TO 1mm ISOTROPIC + 8. SAVE IN nnU-Net FORMAT
+    # Prevents anatomy distortion and standardizes the "zoom" for the network.
+    save_path = os.path.join(output_dir, f"Lizard_{patient_id}_0000{nii_suffix()}")
+    final_size = apply_plan(plan, ct_masked, output_path=save_path, cropped=True)
+    print(f"Success: {patient_id} | Size: {final_size}")
+
+def process_row(p_num, root_dir, output_dir, z_range=None):
+    try:
+        process_nnunet_gold_standard(p_num, root_dir, output_dir, z_range)
+        return True
+    except Exception as e:
+        print(f"CRITICAL ERROR on {p_num}: {e}")
+        return False
+
+# --- EXECUTION ---
+def run(csv_path=STATS_CSV, root_data=DATA_ROOT, out_data=os.path.join(OUTPUT_ROOT, "Processed_nnUNet"),
+        num_workers=NUM_WORKERS):
+    os.makedirs(out_data, exist_ok=True)
+    df = pd.read_csv(csv_path)
+
+    print(f"Processing {len(df)} patients...")
+    jobs = [(patient_number(row['Patient_ID']), root_data, out_data,
+             liver_z_range(row) if ROI_READING else None) for _, row in df.iterrows()]
+    costs = [patient_memory_mb(study_path(root_data, p_num), z_range)
+             for p_num, _, _, z_range in jobs] if num_workers > 1 else None
+    run_patients(process_row, jobs, num_workers, costs=costs, names=[patient_folder(job[0]) for job in jobs],
+                 failed=False)
+
+    print("Preprocessing Complete.")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+import os
+
+from .dicom_cache import load_dicom_slab
+from .instrument import set_patient
+from .lazy import lazy_import
+from .nii_writer import nii_suffix
+from .paths import DATA_ROOT, OUTPUT_ROOT, STATS_CSV, patient_folder, patient_number, series_path
+from .resample_plan import apply_plan, whole_image_plan
+from .series_index import has_series
+
+pd = lazy_import("pandas")
+
+def process_and_save_liver(patient_id, first_slice, last_slice, root_dir, output_dir):
+    folder = patient_folder(patient_id)
+    set_patient(patient_id)
+    image_dir = series_path(root_dir, patient_id, "CorrespImage")
+    
+    if not has_series(image_dir):
+        print(f"Directory not found for {folder}")
+        return
+
+    # 2+3. Load only the liver slices of the series (Z-Axis Crop with 1-slice buffer)
+    # The slab has the same geometry as a RegionOfInterest of the full volume
+    cropped_vol, _, _ = load_dicom_slab(image_dir, (first_slice - 1, last_slice + 1))
+
+    # 4+5. Isotropic Resampling to 1mm^3, written straight to the output file
+    save_path = os.path.join(output_dir, f"{folder}_liver_1mm{nii_suffix()}")
+    apply_plan(whole_image_plan(cropped_vol), cropped_vol, output_path=save_path, cropped=True)
+    print(f"Saved: {save_path}")
+
+# --- Execution ---
+def run(csv_path=STATS_CSV, root_data=DATA_ROOT, output_path=os.path.join(OUTPUT_ROOT, "Processed_Livers")):
+    df = pd.read_csv(csv_path)
+    os.makedirs(output_path, exist_ok=True)
+
+    for _, row in df.iterrows():
+        # Extract ID number from 'Lizard_ID195' -> 195
+        p_num = patient_number(row['Patient_ID'])
+        process_and_save_liver(
+            p_num, 
+            row['First_Liver_Slice'], 
+            row['Last_Liver_Slice'], 
+            root_data, 
+            output_path
+        )
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,176 @@
+"""
+nnU-Net dataset fingerprint collected while the volumes are in memory.
+
+nnU-Net's plan_and_preprocess starts by reading every training image and label
+again only to extract dataset_fingerprint.json: spacings, shapes after
+cropping to the nonzero region, and the intensity statistics of the
+foreground (label > 0) voxels. CaseFingerprint gathers the same numbers from
+the output slabs as they are written and is saved next to the dataset, one
+file per patient, so skipped (up-to-date) patients keep theirs. Merging the
+per-case files gives the fingerprint.
+
+Intensities go into a fixed-bin histogram over the HU window (1/16 HU bins),
+which merges by addition across patients and workers. Count, mean, std, min
+and max are exact; the median and percentiles are interpolated within a bin.
+Unlike nnU-Net, which draws 10000 random foreground voxels per case, every
+foreground voxel is counted.
+"""
+import os
+import json
+
+from .lazy import lazy_import
+from .nii_writer import readback
+
+np = lazy_import("numpy")
+
+BINS_PER_HU = 16
+FINGERPRINT_NAME = "dataset_fingerprint.json"
+
+
+class IntensitySketch:
+    """Mergeable histogram of intensities in [lo, hi] plus exact moments and extremes."""
+
+    def __init__(self, lo, hi, bins_per_unit=BINS_PER_HU):
+        self.lo, self.hi = float(lo), float(hi)
+        self.counts = np.zeros(int(round((self.hi - self.lo) * bins_per_unit)), dtype=np.int64)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        bins = (values - self.lo) * (len(self.counts) / (self.hi - self.lo))
+        self.counts += np.bincount(np.clip(bins.astype(np.int64), 0, len(self.counts) - 1),
+                                   minlength=len(self.counts))
+        mean = float(values.mean())
+        self._combine(values.size, mean, float(((values - mean) ** 2).sum()),
+                      float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self._combine(other.n, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, n, mean, m2, lo, hi):
+        # Chan et al. pairwise update of count, mean and sum of squared deviations
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def percentile(self, p):
+        """np.percentile(values, p) up to the bin width."""
+        if self.n == 0:
+            return float("nan")
+        rank = p / 100.0 * (self.n - 1)
+        cumulative = np.cumsum(self.counts)
+        b = int(np.searchsorted(cumulative, rank, side="right"))
+        before = cumulative[b - 1] if b > 0 else 0
+        width = (self.hi - self.lo) / len(self.counts)
+        value = self.lo + (b + (rank - before + 0.5) / self.counts[b]) * width
+        return float(min(max(value, self.min), self.max))
+
+    def properties(self):
+        """nnU-Net's foreground_intensity_properties_per_channel entry."""
+        return {
+            "max": float(self.max),
+            "mean": float(self.mean),
+            "median": self.percentile(50),
+            "min": float(self.min),
+            "percentile_00_5": self.percentile(0.5),
+            "percentile_99_5": self.percentile(99.5),
+            "std": float(np.sqrt(self.m2 / self.n)) if self.n else float("nan"),
+        }
+
+    def state(self):
+        return {"range": np.array([self.lo, self.hi]), "counts": self.counts,
+                "moments": np.array([self.n, self.mean, self.m2, self.min, self.max])}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(*state["range"])
+        sketch.counts = np.array(state["counts"], dtype=np.int64)
+        sketch.n = int(state["moments"][0])
+        sketch.mean, sketch.m2, sketch.min, sketch.max = (float(v) for v in state["moments"][1:])
+        return sketch
+
+
+class CaseFingerprint:
+    """
+    Fingerprint of one training case, fed slab by slab with the written image
+    (z, y, x arrays starting at slice k0) and the full label array.
+    """
+
+    def __init__(self, shape, spacing, window):
+        self.shape = tuple(int(s) for s in shape)
+        # nnU-Net lists spacings in array (z, y, x) order
+        self.spacing = tuple(float(s) for s in spacing)
+        self.intensities = IntensitySketch(*window)
+        # Per-axis "has a nonzero voxel" flags: their extent is crop_to_nonzero's bounding box
+        self.nonzero = [np.zeros(s, dtype=bool) for s in self.shape]
+
+    def add_slab(self, k0, image, labels):
+        # What nnU-Net reads back from the file (compact int16 + scl_slope is quantized)
+        image = readback(image)
+        self.intensities.add(image[labels[k0:k0 + image.shape[0]] > 0])
+        nonzero = image != 0
+        self.nonzero[0][k0:k0 + image.shape[0]] |= nonzero.any(axis=(1, 2))
+        self.nonzero[1] |= nonzero.any(axis=(0, 2))
+        self.nonzero[2] |= nonzero.any(axis=(0, 1))
+
+    def shape_after_crop(self):
+        # Hole filling in crop_to_nonzero never grows the bounding box
+        extent = []
+        for flags in self.nonzero:
+            idx = np.flatnonzero(flags)
+            extent.append(int(idx[-1] - idx[0] + 1) if idx.size else 0)
+        return extent
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f".tmp{os.getpid()}.npz"
+        np.savez(tmp_path, shape=np.array(self.shape), spacing=np.array(self.spacing),
+                 shape_after_crop=np.array(self.shape_after_crop()), **self.intensities.state())
+        os.replace(tmp_path, path)
+
+
+def load_case(path):
+    with np.load(path) as f:
+        return {"shape": [int(s) for s in f["shape"]],
+                "spacing": [float(s) for s in f["spacing"]],
+                "shape_after_crop": [int(s) for s in f["shape_after_crop"]],
+                "intensities": IntensitySketch.from_state(f)}
+
+
+def dataset_fingerprint(case_paths):
+    """dataset_fingerprint.json content for the training cases saved at case_paths."""
+    cases = [load_case(p) for p in case_paths]
+    sketch = None
+    for case in cases:
+        if sketch is None:
+            sketch = case["intensities"]
+        else:
+            sketch.merge(case["intensities"])
+    relative_sizes = [np.prod(c["shape_after_crop"]) / np.prod(c["shape"]) for c in cases]
+    return {
+        "foreground_intensity_properties_per_channel": {"0": sketch.properties() if sketch else {}},
+        "median_relative_size_after_cropping": float(np.median(relative_sizes)) if cases else float("nan"),
+        "shapes_after_crop": [c["shape_after_crop"] for c in cases],
+        "spacings": [c["spacing"] for c in cases],
+    }
+
+
+def write_fingerprint(fingerprint, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, FINGERPRINT_NAME)
+    with open(path, 'w') as f:
+        json.dump(fingerprint, f, indent=4, sort_keys=True)
+    return path
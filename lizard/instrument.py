@@ -0,0 +1,162 @@
+"""
+Stage timing hooks for the preprocessing functions.
+
+The pipelines wrap their steps (load, align, clamp, mask, crop, resample,
+write, ...) in `with stage("name"):`. Nothing is measured unless a listener
+is registered, so the hooks cost nothing in normal runs. Nested stages are
+reported with exclusive time: a "load" inside an "align" is not counted twice.
+
+Every finished stage is reported as listener(name, seconds, fields). fields
+holds whatever the stage was given (voxels_in, voxels_out, ...) plus the
+current patient, the bytes read and written during the stage and the process
+RSS afterwards.
+
+Setting LIZARD_TELEMETRY to a file path appends one JSON line per stage to
+that file, from the main process and from every worker (see
+telemetry_summary.py for percentiles and outlier patients).
+
+The stage stack and the current patient are per thread, so the stages of a
+prefetch_pipeline run are attributed to the right patient. Bytes and RSS are
+per process and then include whatever the other stage threads did meanwhile.
+"""
+import os
+import json
+import time
+import socket
+import threading
+import functools
+from contextlib import contextmanager
+
+TELEMETRY_PATH = os.environ.get("LIZARD_TELEMETRY")
+
+_listeners = []
+_local = threading.local()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def add_listener(listener):
+    """listener(stage_name, seconds, fields) is called when a stage finishes."""
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def set_patient(patient_id):
+    """Tags the stages that follow in this thread with this patient."""
+    # "Lizard_ID12" and "12" are the same patient
+    _local.patient = None if patient_id is None else str(patient_id).replace("Lizard_ID", "")
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process so far, including page-cache hits."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def voxel_count(obj):
+    """Voxels in an image, an array, or a tuple/list of them (0 for anything else)."""
+    if hasattr(obj, "GetNumberOfPixels"):
+        return int(obj.GetNumberOfPixels())
+    if hasattr(obj, "size") and hasattr(obj, "dtype"):
+        return int(obj.size)
+    if isinstance(obj, (tuple, list)):
+        return sum(voxel_count(o) for o in obj)
+    return 0
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Times the block as stage name. Yields the fields dict, so the block can
+    add what is only known at the end (e.g. fields["voxels_out"]).
+    """
+    if not _listeners:
+        yield fields
+        return
+
+    stack = _stack()
+    frame = {"children": 0.0, "children_read": 0, "children_written": 0}
+    stack.append(frame)
+    read0, written0 = io_counters()
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        elapsed = time.perf_counter() - start
+        read1, written1 = io_counters()
+        stack.pop()
+        if stack:
+            stack[-1]["children"] += elapsed
+            stack[-1]["children_read"] += read1 - read0
+            stack[-1]["children_written"] += written1 - written0
+        # In-place steps (clamp, mask) only give voxels_in
+        if "voxels_in" in fields:
+            fields.setdefault("voxels_out", fields["voxels_in"])
+        fields["patient"] = getattr(_local, "patient", None)
+        fields["bytes_read"] = read1 - read0 - frame["children_read"]
+        fields["bytes_written"] = written1 - written0 - frame["children_written"]
+        fields["rss_mb"] = rss_bytes() / 1024**2
+        for listener in list(_listeners):
+            listener(name, elapsed - frame["children"], fields)
+
+
+def timed(name):
+    """
+    Decorator form of stage() for helpers that are one stage as a whole.
+    Voxels of image/array arguments and results are recorded as voxels_in/out.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _listeners:
+                return func(*args, **kwargs)
+            with stage(name, voxels_in=voxel_count(args)) as fields:
+                result = func(*args, **kwargs)
+                fields["voxels_out"] = voxel_count(result)
+                return result
+        return wrapper
+    return decorate
+
+
+class JsonlSink:
+    """Listener that appends one JSON record per stage to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.host = socket.gethostname()
+
+    def __call__(self, name, seconds, fields):
+        record = {"time": time.time(), "host": self.host, "pid": os.getpid(),
+                  "stage": name, "seconds": seconds}
+        record.update(fields)
+        # One write() per line on an O_APPEND file, so workers never interleave records
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record, default=str) + "\n").encode())
+        finally:
+            os.close(fd)
+
+
+if TELEMETRY_PATH:
+    add_listener(JsonlSink(TELEMETRY_PATH))
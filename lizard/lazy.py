@@ -0,0 +1,61 @@
+"""
+Deferred imports of the heavy dependencies.
+
+SimpleITK, numpy, pandas and pydicom together take most of a second to import,
+which `lizard --help`, a spawned pool worker or a notebook importing one helper
+should not pay. The modules of this package bind them with
+
+    sitk = lazy_import("SimpleITK")
+
+which returns a stand-in module whose first attribute access runs the real
+import. A dependency that is not installed still fails at import time, like a
+plain import statement would.
+
+The first access may come from several threads at once (mask_stats decodes in
+a thread pool), so the real import runs under a lock per module. The standard
+importlib.util.LazyLoader is not safe there before Python 3.12: a second
+thread sees the half-executed module and gets an AttributeError.
+"""
+import sys
+import types
+import threading
+import importlib
+import importlib.util
+
+# Module name -> its stand-in, shared by every module binding it
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def __getattr__(self, attr):
+        # Only reached for names not (yet) copied from the real module
+        with self.__dict__["_lazy_lock"]:
+            module = importlib.import_module(self.__name__)
+            if "_lazy_loaded" not in self.__dict__:
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_lazy_loaded"] = True
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _modules_lock:
+        if name not in _modules:
+            if importlib.util.find_spec(name) is None:
+                raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+            _modules[name] = _LazyModule(name)
+        return _modules[name]
+
+
+def is_loaded(name):
+    """True once the module has really been imported (not just bound lazily)."""
+    return name in sys.modules
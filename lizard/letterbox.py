@@ -0,0 +1,207 @@
+"""
+Tight-crop storage with a virtual letterbox.
+
+nnunet_preprocessing letterboxes every case into a fixed 256^3 grid, so a
+30-slice liver is stored as ~90% constant -100 HU / label 0 padding that is
+still compressed, written, read and decompressed. With LIZARD_TIGHT_CROP=1 only
+the part of that grid the liver crop reaches is resampled and written (a
+sub-box of the same grid: labels are identical, image voxels can differ in the
+last float bit through the shifted origin), and a small layout file records
+where the box sits:
+
+    letterbox/Lizard_<pid>.json   full grid (size, spacing, origin, direction),
+                                  offset of the stored box in it, backgrounds
+
+LetterboxVolume serves the 256^3 view on top of the stored box: any window of
+it is assembled from the overlapping stored voxels plus the background, so the
+padding is never read or kept in memory.
+
+    layout = load_layout("letterbox/Lizard_7.json")
+    ct = open_letterbox("imagesTr/Lizard_7_0000.nii.gz", layout)
+    ct.shape                    # (256, 256, 256)
+    patch = ct[100:164, 64:192, 64:192]
+
+Plain .nii files are memory-mapped; .nii.gz files are unpacked once into
+LIZARD_PATCH_CACHE when it is set, otherwise decoded into memory (tight crops
+are small).
+"""
+import os
+import gzip
+import json
+import shutil
+import hashlib
+
+from .lazy import lazy_import
+from .nii_writer import nifti_layout
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+CACHE_DIR = os.environ.get("LIZARD_PATCH_CACHE")
+# Letterbox background of nnunet_preprocessing outside the crop
+IMAGE_BACKGROUND = -100.0
+LABEL_BACKGROUND = 0
+LAYOUT_VERSION = 1
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()
+
+
+def _unpack(path, cache_dir):
+    out_path = os.path.join(cache_dir, _cache_key(path) + ".nii")
+    if os.path.exists(out_path):
+        return out_path
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = out_path + f".tmp{os.getpid()}"
+    with gzip.open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def open_volume(path, cache_dir=None):
+    """(z, y, x) read-only memmap of a NIfTI file and its (scl_slope, scl_inter), or None."""
+    if path.endswith(".gz"):
+        cache_dir = cache_dir or CACHE_DIR
+        if not cache_dir:
+            raise ValueError(f"{path} is compressed: set LIZARD_PATCH_CACHE or write with LIZARD_NII_CODEC=none")
+        path = _unpack(path, cache_dir)
+    with open(path, 'rb') as f:
+        layout = nifti_layout(f.read(348))
+    volume = np.memmap(path, dtype=layout["dtype"], mode='r', offset=layout["offset"], shape=layout["shape"])
+    return volume, layout["scale"]
+
+
+def read_window(volume, start, size, fill):
+    """volume[start:start + size], with fill where the window leaves the volume."""
+    out = np.full(size, fill, dtype=volume.dtype)
+    src = tuple(slice(max(0, s), min(n, s + k)) for s, k, n in zip(start, size, volume.shape))
+    if all(sl.stop > sl.start for sl in src):
+        dst = tuple(slice(sl.start - s, sl.stop - s) for sl, s in zip(src, start))
+        out[dst] = volume[src]
+    return out
+
+
+def basic_index(key, shape):
+    """
+    (start, size, axes to squeeze) of a basic index (unit-step slices and
+    integers) into an array of this shape, for views that read windows.
+    """
+    key = key if isinstance(key, tuple) else (key,)
+    key = key + (slice(None),) * (len(shape) - len(key))
+    start, size, squeeze = [], [], []
+    for axis, (k, n) in enumerate(zip(key, shape)):
+        if isinstance(k, slice):
+            lo, hi, step = k.indices(n)
+            if step != 1:
+                raise IndexError("only unit-step slices are supported")
+            start.append(lo)
+            size.append(max(0, hi - lo))
+        else:
+            k = int(k) + n if int(k) < 0 else int(k)
+            if not 0 <= k < n:
+                raise IndexError(f"index {k} out of range for axis {axis} of size {n}")
+            start.append(k)
+            size.append(1)
+            squeeze.append(axis)
+    return start, size, tuple(squeeze)
+
+
+def save_layout(path, plan, backgrounds=None):
+    """Layout file of a tight_plan() output: where its grid sits in the letterbox grid."""
+    letterbox = plan["letterbox"]
+    layout = {
+        "version": LAYOUT_VERSION,
+        "size": list(letterbox["grid"]["size"]),
+        "spacing": list(letterbox["grid"]["spacing"]),
+        "origin": list(letterbox["grid"]["origin"]),
+        "direction": list(letterbox["grid"]["direction"]),
+        "offset": list(letterbox["offset"]),
+        "stored_size": list(plan["grid"]["size"]),
+        "background": backgrounds or {"image": IMAGE_BACKGROUND, "label": LABEL_BACKGROUND},
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + f".tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(layout, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def load_layout(path):
+    with open(path) as f:
+        layout = json.load(f)
+    if layout.get("version") != LAYOUT_VERSION:
+        raise ValueError(f"{path}: unsupported letterbox layout version {layout.get('version')}")
+    return layout
+
+
+class LetterboxVolume:
+    """
+    Read-only (z, y, x) view of a stored box placed at offset inside a larger
+    virtual volume of the given shape; everything outside the box is fill.
+    Reads return the window only (float32 for scaled images).
+    """
+
+    def __init__(self, data, offset=(0, 0, 0), shape=None, fill=0, scale=None, grid=None):
+        self.data = data
+        self.offset = tuple(int(o) for o in offset)
+        self.shape = tuple(int(s) for s in (shape or data.shape))
+        self.fill = fill
+        self.scale = scale
+        self.grid = grid
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32) if self.scale is not None else self.data.dtype
+
+    def read_window(self, start, size):
+        """self[start:start + size] (z, y, x), with fill outside the virtual volume as well."""
+        start = [int(s) - o for s, o in zip(start, self.offset)]
+        size = tuple(int(k) for k in size)
+        if self.scale is None:
+            return read_window(self.data, start, size, self.fill)
+        slope, inter = self.scale
+        # Background in stored units, so it comes out as fill after scaling
+        window = read_window(self.data, start, size, (self.fill - inter) / slope).astype(np.float32)
+        window *= slope
+        window += inter
+        return window
+
+    def __getitem__(self, key):
+        start, size, squeeze = basic_index(key, self.shape)
+        window = self.read_window(start, size)
+        return window.squeeze(axis=squeeze) if squeeze else window
+
+    def __array__(self, dtype=None, copy=None):
+        window = self.read_window((0, 0, 0), self.shape)
+        return window.astype(dtype) if dtype is not None else window
+
+    def to_image(self):
+        """The whole letterboxed volume as a SimpleITK image on the letterbox grid (materialized)."""
+        img = sitk.GetImageFromArray(np.asarray(self))
+        if self.grid is not None:
+            img.SetSpacing(self.grid["spacing"])
+            img.SetOrigin(self.grid["origin"])
+            img.SetDirection(self.grid["direction"])
+        return img
+
+
+def open_letterbox(path, layout=None, is_label=False, cache_dir=None):
+    """
+    LetterboxVolume of a stored image or label file. With a layout (from
+    load_layout) it is the full letterbox view; without one, the file itself.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if path.endswith(".gz") and not cache_dir:
+        data, scale = sitk.GetArrayFromImage(sitk.ReadImage(path)), None
+    else:
+        data, scale = open_volume(path, cache_dir)
+    fill = LABEL_BACKGROUND if is_label else IMAGE_BACKGROUND
+    if layout is None:
+        return LetterboxVolume(data, fill=fill, scale=scale)
+    fill = layout["background"]["label" if is_label else "image"]
+    if tuple(data.shape) != tuple(layout["stored_size"][::-1]):
+        raise ValueError(f"{path}: shape {data.shape} does not match its layout {layout['stored_size'][::-1]}")
+    return LetterboxVolume(data, layout["offset"][::-1], layout["size"][::-1], fill, scale, layout)
@@ -0,0 +1,46 @@
+from .instrument import set_patient
+from .lazy import lazy_import
+from .paths import DATA_ROOT, series_path, study_path
+from .series_index import has_series, list_patients
+from .mask_stats import decode_mask_series, mask_statistics, patient_mask_stats, stats_row
+
+pd = lazy_import("pandas")
+
+def get_liver_stats(liver_dir):
+    # Slices are ordered by their position along the slice normal (same z index as the ITK volume)
+    mask, spacing = decode_mask_series(liver_dir)
+    if mask is None:
+        return None
+
+    stats = mask_statistics(mask, spacing)
+    if stats is None:
+        return None  # No liver detected in any slice
+
+    # First/last slice numbers and the centroid slice (the liver's 'center of mass')
+    return stats["First_Slice"], stats["Last_Slice"], stats["Centroid_Slice"]
+
+# --- Main Batch Process ---
+def run(root_dir=DATA_ROOT, output_path="liver_slice_stats.csv"):
+    results = []
+
+    for patient_id in list_patients(root_dir):
+        # Navigate to: Lizard_IDX / STL_DICOM_Lizard_IDX / Liver
+        series_root = study_path(root_dir, patient_id)
+
+        if has_series(series_path(root_dir, patient_id, "Liver")):
+            print(f"Processing {patient_id}...")
+            set_patient(patient_id)
+            stats = patient_mask_stats(series_root)
+
+            # Liver, Portal, Vein, Region* and their union: slices, bounding box and volume
+            if stats.get("Liver"):
+                results.append(stats_row(patient_id, stats))
+
+    # Save results to a CSV for your analysis
+    df = pd.DataFrame(results)
+    df.to_csv(output_path, index=False)
+    print(f"Finished! Stats saved to {output_path}")
+
+if __name__ == "__main__":
+    run()
+
@@ -0,0 +1,215 @@
+"""
+Vectorized statistics for the Liver / Portal / Vein / Region* mask series.
+
+Slices are decoded on a thread pool, ordered by their position along the slice
+normal (the same order GDCM gives the ImageSeriesReader, so slice numbers match
+the z index of the loaded volumes) and stacked into one boolean volume. All
+statistics are then computed from that volume in a single pass.
+
+Only the bool plane and the few header values the statistics need leave a
+decoding thread, so the series is held once (as bool) rather than as raw
+pixel data plus decoded arrays.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrument import timed
+from .lazy import lazy_import
+from .series_index import list_series
+
+np = lazy_import("numpy")
+pydicom = lazy_import("pydicom")
+sitk = lazy_import("SimpleITK")
+
+STAT_LABELS = ("Liver", "Portal", "Vein")
+STAT_FIELDS = ("First_Slice", "Last_Slice", "Centroid_Slice",
+               "BBox_X", "BBox_Y", "BBox_Z", "BBox_SX", "BBox_SY", "BBox_SZ",
+               "Voxels", "Volume_ml")
+
+
+def _slice_sort_key(ds, file_name):
+    # Position along the slice normal first, then InstanceNumber, then file name
+    if "ImagePositionPatient" in ds and "ImageOrientationPatient" in ds:
+        iop = np.array(ds.ImageOrientationPatient, dtype=float)
+        normal = np.cross(iop[:3], iop[3:])
+        return (0, float(np.dot(normal, np.array(ds.ImagePositionPatient, dtype=float))), file_name)
+    if "InstanceNumber" in ds:
+        return (1, float(ds.InstanceNumber), file_name)
+    return (2, 0.0, file_name)
+
+
+def _floats(ds, keyword):
+    value = ds.get(keyword)
+    return [float(v) for v in value] if value else None
+
+
+def _decode_slice(path):
+    ds = pydicom.dcmread(path)
+    header = {
+        "pixel_spacing": _floats(ds, "PixelSpacing"),
+        "slice_thickness": float(ds.get("SliceThickness") or 0) or None,
+        "position": _floats(ds, "ImagePositionPatient"),
+        "orientation": _floats(ds, "ImageOrientationPatient"),
+    }
+    # The Dataset (raw PixelData and the decoded array) is dropped here
+    return _slice_sort_key(ds, os.path.basename(path)), ds.pixel_array != 0, header
+
+
+@timed("load")
+def decode_mask_grid(series_dir, max_workers=None):
+    """
+    Decodes every slice of a mask series in parallel.
+    Returns (mask, grid) with mask as a bool array of shape (z, y, x) and grid
+    as size, spacing, origin and direction (x, y, z order, like the ITK
+    image of the series), or (None, None) if there are no slices.
+    """
+    files = [os.path.join(series_dir, f) for f in os.listdir(series_dir) if f.endswith('.dcm')]
+    if not files:
+        return None, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        decoded = sorted(pool.map(_decode_slice, files), key=lambda d: d[0])
+
+    mask = np.empty((len(decoded),) + decoded[0][1].shape, dtype=bool)
+    for z, (_, plane, _) in enumerate(decoded):
+        mask[z] = plane
+
+    first = decoded[0][2]
+    row_sp, col_sp = first["pixel_spacing"] or (1.0, 1.0)
+    positions = [d[0][1] for d in decoded if d[0][0] == 0]
+    if len(positions) > 1:
+        z_sp = float(np.median(np.diff(positions)))
+    else:
+        z_sp = first["slice_thickness"] or 1.0
+
+    direction = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+    if first["orientation"] is not None:
+        row, col = np.array(first["orientation"][:3]), np.array(first["orientation"][3:])
+        direction = tuple(float(v) for v in np.column_stack([row, col, np.cross(row, col)]).ravel())
+    return mask, {
+        "size": (mask.shape[2], mask.shape[1], mask.shape[0]),
+        "spacing": (col_sp, row_sp, abs(z_sp)),
+        "origin": tuple(first["position"] or (0.0, 0.0, 0.0)),
+        "direction": direction,
+    }
+
+
+def decode_mask_series(series_dir, max_workers=None):
+    """
+    Decodes every slice of a mask series in parallel.
+    Returns (mask, spacing) with mask as a bool array of shape (z, y, x)
+    and spacing as (x, y, z) in mm, or (None, None) if there are no slices.
+    """
+    mask, grid = decode_mask_grid(series_dir, max_workers)
+    return mask, grid["spacing"] if grid is not None else None
+
+
+def _same_grid(grid, ref, tol=1e-3):
+    return tuple(grid["size"]) == tuple(ref["size"]) and all(
+        np.allclose(grid[key], ref[key], rtol=0, atol=tol) for key in ("spacing", "origin", "direction"))
+
+
+def align_mask(mask, grid, ref):
+    """
+    mask (on grid) on the ref grid: as it is when the grids match, otherwise
+    nearest-neighbour resampled like nnunet_preprocessing aligns its labels.
+    """
+    if _same_grid(grid, ref):
+        return mask
+    img = sitk.GetImageFromArray(mask.astype(np.uint8))
+    img.SetSpacing(grid["spacing"])
+    img.SetOrigin(grid["origin"])
+    img.SetDirection(grid["direction"])
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetSize([int(s) for s in ref["size"]])
+    resampler.SetOutputSpacing(ref["spacing"])
+    resampler.SetOutputOrigin(ref["origin"])
+    resampler.SetOutputDirection(ref["direction"])
+    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+    return sitk.GetArrayFromImage(resampler.Execute(img)) != 0
+
+
+@timed("stats")
+def mask_statistics(mask, spacing):
+    """
+    First/last/centroid slice, ITK-style bounding box (x, y, z, sx, sy, sz),
+    voxel count and physical volume of a stacked boolean mask.
+    Returns None if the mask is empty.
+    """
+    per_slice = np.count_nonzero(mask, axis=(1, 2))
+    z_idx = np.flatnonzero(per_slice)
+    if z_idx.size == 0:
+        return None
+
+    y_idx = np.flatnonzero(mask.any(axis=(0, 2)))
+    x_idx = np.flatnonzero(mask.any(axis=(0, 1)))
+    voxels = int(per_slice.sum())
+
+    first, last = int(z_idx[0]), int(z_idx[-1])
+    return {
+        "First_Slice": first,
+        "Last_Slice": last,
+        # Slice at the liver's centre of mass (weighted by area per slice)
+        "Centroid_Slice": int(round(np.average(z_idx, weights=per_slice[z_idx]))),
+        "BBox_X": int(x_idx[0]),
+        "BBox_Y": int(y_idx[0]),
+        "BBox_Z": first,
+        "BBox_SX": int(x_idx[-1] - x_idx[0] + 1),
+        "BBox_SY": int(y_idx[-1] - y_idx[0] + 1),
+        "BBox_SZ": last - first + 1,
+        "Voxels": voxels,
+        "Volume_ml": voxels * float(np.prod(spacing)) / 1000.0,
+    }
+
+
+def region_folders(series_root):
+    return sorted((f for f in list_series(series_root) if re.match(r'Region\d+', f, re.IGNORECASE)),
+                  key=lambda f: int(re.findall(r'\d+', f)[0]))
+
+
+def patient_mask_stats(series_root, max_workers=None):
+    """
+    Statistics for Liver, Portal, Vein, every Region* folder and the Liver+Region
+    union (the mask nnunet_preprocessing crops to) of one STL_DICOM_Lizard_IDx folder.
+    The union lies on the grid of the Liver series (the first Region without
+    one); Regions on another grid are resampled onto it first.
+    Returns {label: stats dict or None}.
+    """
+    stats = {}
+    union = None
+    union_grid = None
+    for label in STAT_LABELS + tuple(region_folders(series_root)):
+        label_dir = os.path.join(series_root, label)
+        if not os.path.isdir(label_dir):
+            continue
+        mask, grid = decode_mask_grid(label_dir, max_workers)
+        if mask is None:
+            continue
+        stats[label] = mask_statistics(mask, grid["spacing"])
+
+        if label not in ("Portal", "Vein"):
+            if union is None:
+                union, union_grid = mask.copy(), grid
+            else:
+                union |= align_mask(mask, grid, union_grid)
+    if union is not None:
+        stats["LiverUnion"] = mask_statistics(union, union_grid["spacing"])
+    return stats
+
+
+def stats_row(patient_id, stats):
+    """Flattens patient_mask_stats() output into one liver_slice.csv row."""
+    liver = stats.get("Liver")
+    row = {"Patient_ID": patient_id}
+    if liver:
+        row.update({
+            "First_Liver_Slice": liver["First_Slice"],
+            "Last_Liver_Slice": liver["Last_Slice"],
+            "Centroid_Slice": liver["Centroid_Slice"],
+            "Total_Slices_with_Liver": liver["BBox_SZ"],
+        })
+    for label, label_stats in stats.items():
+        for field in STAT_FIELDS:
+            row[f"{label}_{field}"] = label_stats[field] if label_stats else None
+    return row
@@ -0,0 +1,102 @@
+import os
+import json
+
+from .dicom_cache import load_dicom_series, load_dicom_slab
+from .instrument import set_patient
+from .lazy import lazy_import
+from .nii_writer import nii_suffix
+from .paths import DATA_ROOT, NNUNET_RAW_DIR, SLICE_CSV, patient_folder, patient_number, study_path
+from .patient_cost import patient_memory_mb
+from .patient_pool import run_patients
+from .resample_plan import apply_plan, make_plan, whole_image_plan
+from .roi_reading import crop_slab, liver_z_range, load_label_slab, slab_crop_is_exact
+from .volume_ops import clamp_mask_fill, composite_liver_mask, composite_vessel_labels
+
+sitk = lazy_import("SimpleITK")
+pd = lazy_import("pandas")
+
+NUM_WORKERS = int(os.environ.get("LIZARD_WORKERS", 1))
+# Decode only the slices around the liver (falls back to a full read when needed)
+ROI_READING = os.environ.get("LIZARD_ROI_READING", "1") == "1"
+CROP_BUFFER = 5
+
+def resample_iso(img, is_label=False, output_path=None):
+    # 1mm isotropic copy of a whole (already cropped) image
+    return apply_plan(whole_image_plan(img), img, is_label, output_path=output_path, cropped=True)
+
+def prepare_nnunet_vessels_universal(row, root_dir, target_raw_dir, use_slab=ROI_READING):
+    patient_id = patient_number(row['Patient_ID'])
+    p_folder = patient_folder(patient_id)
+    set_patient(patient_id)
+    base_path = study_path(root_dir, patient_id)
+    
+    reader = sitk.ImageSeriesReader()
+    slab = None
+    try:
+        if use_slab:
+            ct, z_range, geometry = load_dicom_slab(os.path.join(base_path, "CorrespImage"), liver_z_range(row), reader)
+            slab = (z_range, geometry)
+            liver, portal, vein = (load_label_slab(os.path.join(base_path, d), slab, reader)
+                                   for d in ("Liver", "Portal", "Vein"))
+        else:
+            ct = load_dicom_series(os.path.join(base_path, "CorrespImage"), reader)
+            liver = load_dicom_series(os.path.join(base_path, "Liver"), reader)
+            portal = load_dicom_series(os.path.join(base_path, "Portal"), reader)
+            vein = load_dicom_series(os.path.join(base_path, "Vein"), reader)
+    except Exception as e:
+        print(f"Skipping {p_folder}: {e}")
+        return
+
+    # 2. ALIGN PHYSICAL SPACES (Crucial for Patient 54 types; skipped when the grids already match)
+    # If it's not 0, it's a mask. This catches 1, 255, or any other value used during export.
+    liver_mask = composite_liver_mask(ct, [liver])
+    combined_labels = composite_vessel_labels(ct, portal, vein)
+
+    label_stats = sitk.LabelShapeStatisticsImageFilter()
+    label_stats.Execute(liver_mask)
+    if slab is not None and not (label_stats.HasLabel(1) and
+                                 slab_crop_is_exact(label_stats.GetBoundingBox(1), CROP_BUFFER, slab)):
+        # Liver not (fully) inside the slab: decode the whole series instead
+        return prepare_nnunet_vessels_universal(row, root_dir, target_raw_dir, use_slab=False)
+    
+    # Black out everything outside the liver
+        
+    if label_stats.HasLabel(1):
+        bbox = label_stats.GetBoundingBox(1)
+        buf = CROP_BUFFER
+    else:
+        z_start = int(row['First_Liver_Slice'])
+        z_end = int(row['Last_Liver_Slice'])
+        bbox = [0, 0, z_start, ct.GetSize()[0], ct.GetSize()[1], max(1, z_end - z_start)]
+        buf = 0
+
+    size = [min(ct.GetSize()[i] - bbox[i], bbox[i+3] + 2*buf) for i in range(3)]
+    index = [max(0, bbox[i] - buf) for i in range(3)]
+
+    # One plan (crop window + 1mm isotropic grid) for image and label
+    plan = make_plan(ct, index, size, slab)
+
+    # Clamp to -100..250 HU and fill non-liver voxels with -100, only inside the crop
+    mask_crop = crop_slab(liver_mask, size, index, slab) if label_stats.HasLabel(1) else None
+    ct_crop = clamp_mask_fill(crop_slab(ct, size, index, slab), mask_crop, (-100, 250), -100.0)
+
+    img_dir = os.path.join(target_raw_dir, "imagesTr")
+    lab_dir = os.path.join(target_raw_dir, "labelsTr")
+    os.makedirs(img_dir, exist_ok=True)
+    os.makedirs(lab_dir, exist_ok=True)
+    
+    apply_plan(plan, ct_crop, False, output_path=os.path.join(img_dir, f"Lizard_{patient_id}_0000{nii_suffix()}"), cropped=True)
+    apply_plan(plan, combined_labels, True, output_path=os.path.join(lab_dir, f"Lizard_{patient_id}{nii_suffix()}"))
+    print(f"Processed {p_folder}")
+
+def run(csv_path=SLICE_CSV, root_data=DATA_ROOT, raw_dir=NNUNET_RAW_DIR, num_workers=NUM_WORKERS):
+    df = pd.read_csv(csv_path)
+    jobs = [(row, root_data, raw_dir) for _, row in df.iterrows()]
+    costs = [patient_memory_mb(study_path(root_data, patient_number(row['Patient_ID'])),
+                               liver_z_range(row) if ROI_READING else None, row)
+             for row, _, _ in jobs] if num_workers > 1 else None
+    run_patients(prepare_nnunet_vessels_universal, jobs, num_workers, costs=costs,
+                 names=[patient_folder(row['Patient_ID']) for row, _, _ in jobs])
+
+if __name__ == "__main__":
+    run()
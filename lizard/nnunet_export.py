@@ -0,0 +1,295 @@
+"""
+Export straight into nnU-Net's preprocessed layout (nnU-Net v2, npz + pkl).
+
+Our cases already are at 1 mm on a fixed 256^3 grid, so nnU-Net's
+plan_and_preprocess would only decompress them, crop them to the nonzero box,
+normalize and rewrite them. export_case() does that per training case while
+the arrays are in memory:
+
+    nnUNet_preprocessed/<dataset>/nnUNetPlans_3d_fullres/<case>.pkl   properties
+                                                       (incl. class_locations)
+    nnUNet_preprocessed/<dataset>/nnUNetPlans_3d_fullres/<case>.npz   data + seg
+
+CT normalization needs the dataset fingerprint (foreground mean/std and
+percentiles of all training cases), which is only known at the end of the run.
+So the cropped image and seg are staged as plain .npy files (kept, as the
+source for later runs); finalize() normalizes the staged arrays of new cases
+(all of them if the fingerprint changed; no decoding or resampling) and writes
+the .npz files, nnUNetPlans.json, dataset.json and dataset_fingerprint.json.
+"""
+import os
+import json
+import shutil
+import pickle
+
+from .fingerprint import FINGERPRINT_NAME
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+PLANS_NAME = "nnUNetPlans"
+CONFIGURATION = "3d_fullres"
+DATA_IDENTIFIER = f"{PLANS_NAME}_{CONFIGURATION}"
+STAGING_DIR = ".staging"
+# nnU-Net's DefaultPreprocessor._sample_foreground_locations settings
+NUM_LOCATION_SAMPLES = 10000
+MIN_LOCATION_COVERAGE = 0.01
+LOCATION_SEED = 1234
+# ExperimentPlanner defaults for a 3d_fullres U-Net
+BASE_FEATURES = 32
+MAX_FEATURES = 320
+MAX_PATCH = 128
+MIN_FEATURE_MAP = 4
+BATCH_SIZE = 2
+
+
+def case_dir(export_root):
+    return os.path.join(export_root, DATA_IDENTIFIER)
+
+
+def staged_paths(case_id, export_root):
+    staging = os.path.join(case_dir(export_root), STAGING_DIR)
+    return os.path.join(staging, case_id + ".npy"), os.path.join(staging, case_id + "_seg.npy")
+
+
+def nonzero_mask(image):
+    """crop_to_nonzero's mask: nonzero voxels with enclosed holes filled (6-connected background)."""
+    mask = sitk.GetImageFromArray((image != 0).astype(np.uint8))
+    return sitk.GetArrayFromImage(sitk.BinaryFillhole(mask, fullyConnected=False, foregroundValue=1)).astype(bool)
+
+
+def sample_class_locations(seg, labels, seed=LOCATION_SEED):
+    """{label: (n, 4) voxel coordinates} drawn like nnU-Net's preprocessor (seg is (1, z, y, x))."""
+    rng = np.random.RandomState(seed)
+    foreground = seg != 0
+    coords = np.argwhere(foreground)
+    values = seg[foreground]
+    locations = {}
+    for label in labels:
+        all_locs = coords[values == label]
+        if len(all_locs) == 0:
+            locations[label] = []
+            continue
+        target = min(NUM_LOCATION_SAMPLES, len(all_locs))
+        target = max(target, int(np.ceil(len(all_locs) * MIN_LOCATION_COVERAGE)))
+        locations[label] = all_locs[rng.choice(len(all_locs), target, replace=False)]
+    return locations
+
+
+def export_case(case_id, image, labels, grid, export_root, foreground_labels):
+    """
+    Crops one training case (z, y, x image and label arrays on grid) like
+    nnU-Net, writes its properties .pkl and stages the data for finalize().
+    """
+    out_dir = case_dir(export_root)
+    os.makedirs(os.path.join(out_dir, STAGING_DIR), exist_ok=True)
+
+    mask = nonzero_mask(image)
+    nonzero = np.argwhere(mask)
+    lo, hi = nonzero.min(axis=0), nonzero.max(axis=0) + 1
+    bbox = [[int(a), int(b)] for a, b in zip(lo, hi)]
+    window = tuple(slice(a, b) for a, b in bbox)
+
+    data = np.ascontiguousarray(image[window], dtype=np.float32)[None]
+    seg = np.array(labels[window], dtype=np.int16)[None]
+    # Background outside the nonzero region is marked -1, as nnU-Net does
+    seg[0][(seg[0] == 0) & ~mask[window]] = -1
+    seg = seg.astype(np.int8 if seg.max() <= 127 else np.int16)
+
+    properties = {
+        "sitk_stuff": {"spacing": tuple(grid["spacing"]), "origin": tuple(grid["origin"]),
+                       "direction": tuple(grid["direction"])},
+        "spacing": list(grid["spacing"])[::-1],
+        "shape_before_cropping": tuple(image.shape),
+        "bbox_used_for_cropping": bbox,
+        "shape_after_cropping_and_before_resampling": tuple(data.shape[1:]),
+        "class_locations": sample_class_locations(seg, foreground_labels),
+    }
+    with open(os.path.join(out_dir, case_id + ".pkl"), 'wb') as f:
+        pickle.dump(properties, f)
+
+    # Staged until the dataset-wide normalization is known
+    for path, arr in zip(staged_paths(case_id, export_root), (data, seg)):
+        tmp_path = path + f".tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+
+
+def ct_normalize(data, properties):
+    """nnU-Net's CTNormalization with the dataset's foreground intensity properties."""
+    np.clip(data, properties["percentile_00_5"], properties["percentile_99_5"], out=data)
+    data -= properties["mean"]
+    data /= max(properties["std"], 1e-8)
+    return data
+
+
+def pool_and_conv_props(spacing, patch_size):
+    """
+    Per-axis pooling of nnU-Net's get_pool_and_conv_props: every stage halves
+    the axes that are still at least 2 * MIN_FEATURE_MAP voxels and within a
+    factor 2 of the finest spacing. Returns the strides and kernel sizes per
+    stage and the patch size rounded up to a multiple of each axis's total
+    stride, so every skip connection lines up.
+    """
+    dim = len(patch_size)
+    current_spacing = [float(s) for s in spacing]
+    current_size = [int(s) for s in patch_size]
+    num_pool = [0] * dim
+    kernel = [1] * dim
+    strides, kernel_sizes = [[1] * dim], []
+    while True:
+        axes = [i for i in range(dim) if current_size[i] >= 2 * MIN_FEATURE_MAP]
+        if not axes:
+            break
+        finest = min(current_spacing[i] for i in axes)
+        axes = [i for i in axes if current_spacing[i] / finest < 2]
+        # A single axis is only pooled while it stays well above the minimum
+        if len(axes) == 1 and current_size[axes[0]] < 3 * MIN_FEATURE_MAP:
+            break
+        for d in range(dim):
+            if current_spacing[d] / min(current_spacing) < 2:
+                kernel[d] = 3
+        stride = [1] * dim
+        for i in axes:
+            stride[i] = 2
+            num_pool[i] += 1
+            current_spacing[i] *= 2
+            current_size[i] = -(-current_size[i] // 2)
+        strides.append(stride)
+        kernel_sizes.append(list(kernel))
+    kernel_sizes.append([3] * dim)
+    divisor = [2 ** n for n in num_pool]
+    patch_size = [-(-int(s) // d) * d for s, d in zip(patch_size, divisor)]
+    return strides, kernel_sizes, patch_size
+
+
+def plan_network(strides, kernel_sizes):
+    """PlainConvUNet arguments for the stages of pool_and_conv_props()."""
+    stages = len(strides)
+    return {
+        "network_class_name": "dynamic_network_architectures.architectures.unet.PlainConvUNet",
+        "arch_kwargs": {
+            "n_stages": stages,
+            "features_per_stage": [min(BASE_FEATURES * 2 ** i, MAX_FEATURES) for i in range(stages)],
+            "conv_op": "torch.nn.modules.conv.Conv3d",
+            "kernel_sizes": kernel_sizes,
+            "strides": strides,
+            "n_conv_per_stage": [2] * stages,
+            "n_conv_per_stage_decoder": [2] * (stages - 1),
+            "conv_bias": True,
+            "norm_op": "torch.nn.modules.instancenorm.InstanceNorm3d",
+            "norm_op_kwargs": {"eps": 1e-05, "affine": True},
+            "dropout_op": None,
+            "dropout_op_kwargs": None,
+            "nonlin": "torch.nn.LeakyReLU",
+            "nonlin_kwargs": {"inplace": True},
+        },
+        "_kw_requires_import": ["conv_op", "norm_op", "dropout_op", "nonlin"],
+    }
+
+
+def make_plans(dataset_name, fingerprint, shape, spacing):
+    """nnUNetPlans.json for the fixed grid (shape and spacing in z, y, x order)."""
+    strides, kernel_sizes, patch_size = pool_and_conv_props(spacing, [min(s, MAX_PATCH) for s in shape])
+    resampling_kwargs = {"is_seg": False, "order": 3, "order_z": 0, "force_separate_z": None}
+    return {
+        "dataset_name": dataset_name,
+        "plans_name": PLANS_NAME,
+        "original_median_spacing_after_transp": list(spacing),
+        "original_median_shape_after_transp": list(shape),
+        "image_reader_writer": "SimpleITKIO",
+        "transpose_forward": [0, 1, 2],
+        "transpose_backward": [0, 1, 2],
+        "configurations": {
+            CONFIGURATION: {
+                "data_identifier": DATA_IDENTIFIER,
+                "preprocessor_name": "DefaultPreprocessor",
+                "batch_size": BATCH_SIZE,
+                "patch_size": patch_size,
+                "median_image_size_in_voxels": [float(s) for s in shape],
+                "spacing": list(spacing),
+                "normalization_schemes": ["CTNormalization"],
+                "use_mask_for_norm": [False],
+                "resampling_fn_data": "resample_data_or_seg_to_shape",
+                "resampling_fn_seg": "resample_data_or_seg_to_shape",
+                "resampling_fn_data_kwargs": resampling_kwargs,
+                "resampling_fn_seg_kwargs": dict(resampling_kwargs, is_seg=True, order=1),
+                "resampling_fn_probabilities": "resample_data_or_seg_to_shape",
+                "resampling_fn_probabilities_kwargs": dict(resampling_kwargs, order=1),
+                "architecture": plan_network(strides, kernel_sizes),
+                "batch_dice": False,
+            }
+        },
+        "experiment_planner_used": "lizard nnunet_export (fixed 1 mm grid)",
+        "label_manager": "LabelManager",
+        "foreground_intensity_properties_per_channel": fingerprint["foreground_intensity_properties_per_channel"],
+    }
+
+
+def remove_stale_cases(export_root, case_ids):
+    """Deletes the staged and packed files of every case not in case_ids. Returns the removed ids."""
+    out_dir = case_dir(export_root)
+    staging = os.path.join(out_dir, STAGING_DIR)
+    keep = set(case_ids)
+    stale = set()
+    for directory, suffixes in ((staging, ("_seg.npy", ".npy")), (out_dir, (".npz", ".pkl"))):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            suffix = next((s for s in suffixes if name.endswith(s)), None)
+            if suffix is None or ".tmp" in name or name[:-len(suffix)] in keep:
+                continue
+            os.remove(os.path.join(directory, name))
+            stale.add(name[:-len(suffix)])
+    return sorted(stale)
+
+
+def finalize(export_root, raw_dir, fingerprint, shape, spacing, case_ids):
+    """
+    Packs the training cases case_ids: writes the .npz of every one that is
+    new or was normalized with other fingerprint values, then the plans,
+    dataset.json and the fingerprint. Staged and packed files of other cases
+    (excluded, failed or moved to the test split since) are deleted.
+    Returns the number of cases (re)written.
+    """
+    out_dir = case_dir(export_root)
+    staging = os.path.join(out_dir, STAGING_DIR)
+    properties = fingerprint["foreground_intensity_properties_per_channel"]["0"]
+    state_path = os.path.join(staging, "normalization.json")
+    try:
+        with open(state_path) as f:
+            renormalize_all = json.load(f) != properties
+    except (OSError, ValueError):
+        renormalize_all = True
+
+    stale = remove_stale_cases(export_root, case_ids)
+    if stale:
+        print(f"Removed {len(stale)} cases no longer in the training set: {', '.join(stale)}")
+    written = 0
+    for case_id in sorted(case_ids):
+        data_path, seg_path = staged_paths(case_id, export_root)
+        if not (os.path.exists(data_path) and os.path.exists(seg_path)):
+            print(f"  --> {case_id}: not staged, left out of the export")
+            continue
+        npz_path = os.path.join(out_dir, case_id + ".npz")
+        if not renormalize_all and os.path.exists(npz_path) and \
+                os.path.getmtime(npz_path) >= max(os.path.getmtime(data_path), os.path.getmtime(seg_path)):
+            continue
+        data = ct_normalize(np.load(data_path), properties)
+        tmp_path = os.path.join(out_dir, case_id + f".tmp{os.getpid()}.npz")
+        np.savez_compressed(tmp_path, data=data, seg=np.load(seg_path))
+        os.replace(tmp_path, npz_path)
+        written += 1
+    if os.path.isdir(staging):
+        with open(state_path, 'w') as f:
+            json.dump(properties, f)
+
+    dataset_name = os.path.basename(os.path.normpath(export_root))
+    with open(os.path.join(export_root, PLANS_NAME + ".json"), 'w') as f:
+        json.dump(make_plans(dataset_name, fingerprint, shape, spacing), f, indent=4)
+    with open(os.path.join(export_root, FINGERPRINT_NAME), 'w') as f:
+        json.dump(fingerprint, f, indent=4, sort_keys=True)
+    shutil.copy(os.path.join(raw_dir, "dataset.json"), os.path.join(export_root, "dataset.json"))
+    return written
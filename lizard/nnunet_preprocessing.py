@@ -0,0 +1,391 @@
+import os
+import json
+import re
+import random
+from functools import partial
+
+from .dicom_cache import load_dicom_series, load_dicom_slab
+from .fingerprint import CaseFingerprint, dataset_fingerprint, write_fingerprint
+from .instrument import set_patient
+from .lazy import lazy_import
+from .letterbox import save_layout
+from .nii_writer import COMPACT, nii_suffix, readback, write_image
+from .nnunet_export import case_dir, export_case, finalize, staged_paths
+from .paths import DATA_ROOT, NNUNET_RAW_DIR, SLICE_CSV, patient_folder, patient_number, study_path
+from .patient_cost import patient_memory_mb
+from .patient_pool import NODE_BUDGET_MB, PATIENT_TIMEOUT, run_patients
+from .prefetch_pipeline import PREFETCH, run_pipelined
+from .pyramid import CHUNK as PYRAMID_CHUNK, LEVELS as PYRAMID_LEVELS, write_pyramid
+from .resample_plan import TARGET_SPACING, apply_plan, deferred_apply_plan, make_plan, tight_plan, whole_image_plan
+from .roi_reading import crop_slab, liver_z_range, load_label_slab, slab_crop_is_exact
+from .series_index import list_patients, list_series
+from .run_manifest import (input_fingerprint, is_up_to_date, load_manifest, params_fingerprint,
+                          record_patient, save_manifest)
+from .volume_ops import clamp_mask_fill, composite_liver_mask, composite_vessel_labels
+from .work_queue import QUEUE_DIR, WorkQueue, run_queue
+
+sitk = lazy_import("SimpleITK")
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+# 1. CONFIGURATION
+EXCLUSION_LIST = ["115", "4", "13", "16", "26", "66", "69", "101", "146"]
+TEST_SET_SIZE = 25
+RANDOM_SEED = 42 
+# INCREASED Z-DIMENSION to 256 for better vertical coverage
+TARGET_SIZE = (256, 256, 256) 
+HU_WINDOW = (-100, 250)
+CROP_BUFFER = 2
+# Patients processed in parallel; ITK threads are split between the workers
+NUM_WORKERS = int(os.environ.get("LIZARD_WORKERS", 1))
+# Decode only the slices around the liver (falls back to a full read when needed)
+ROI_READING = os.environ.get("LIZARD_ROI_READING", "1") == "1"
+# Reprocess every patient even if the manifest says its outputs are current
+FORCE_REBUILD = os.environ.get("LIZARD_FORCE") == "1"
+# Also write nnU-Net's preprocessed dataset (needs nnUNet_preprocessed; implies the fingerprint)
+EXPORT_PREPROCESSED = os.environ.get("LIZARD_EXPORT_PREPROCESSED") == "1"
+# Collect nnU-Net's dataset fingerprint while writing (no separate fingerprint pass)
+FINGERPRINT = os.environ.get("LIZARD_FINGERPRINT") == "1" or EXPORT_PREPROCESSED
+FOREGROUND_LABELS = (1, 2)
+# Store only the part of the letterbox the liver reaches, plus its offset (see letterbox.py)
+TIGHT_CROP = os.environ.get("LIZARD_TIGHT_CROP") == "1"
+# Also write a chunked 1/2/4 mm pyramid of image and labels (see pyramid.py)
+PYRAMID = os.environ.get("LIZARD_PYRAMID") == "1"
+
+def resample_letterbox(img, is_label=False, target_size=TARGET_SIZE, output_path=None):
+    # Letterbox of a whole (already cropped) image; process_patient plans crop + letterbox in one go
+    plan = whole_image_plan(img, target_size=target_size)
+    # Background HU for the image
+    return apply_plan(plan, img, is_label, 0 if is_label else -100, output_path, cropped=True)
+
+def output_paths(patient_id, target_raw_dir, is_test=False):
+    img_sub = "imagesTs" if is_test else "imagesTr"
+    lab_sub = "labelsTs" if is_test else "labelsTr"
+    return (os.path.join(target_raw_dir, img_sub, f"Lizard_{patient_id}_0000{nii_suffix()}"),
+            os.path.join(target_raw_dir, lab_sub, f"Lizard_{patient_id}{nii_suffix()}"))
+
+def fingerprint_path(patient_id, target_raw_dir):
+    # Per-case part of dataset_fingerprint.json, kept so skipped patients still count
+    return os.path.join(target_raw_dir, "fingerprint", f"Lizard_{patient_id}.npz")
+
+def layout_path(patient_id, target_raw_dir):
+    # Where a tight-crop case sits in the 256x256x256 letterbox
+    return os.path.join(target_raw_dir, "letterbox", f"Lizard_{patient_id}.json")
+
+def pyramid_path(patient_id, target_raw_dir):
+    return os.path.join(target_raw_dir, "pyramid", f"Lizard_{patient_id}.zarr")
+
+def export_root(target_raw_dir):
+    # nnUNet_preprocessed/<same dataset name as the raw folder>
+    return os.path.join(os.environ["nnUNet_preprocessed"], os.path.basename(os.path.normpath(target_raw_dir)))
+
+def patient_outputs(patient_id, target_raw_dir, is_test=False):
+    # Every file the manifest checks for this patient
+    outputs = output_paths(patient_id, target_raw_dir, is_test)
+    if TIGHT_CROP:
+        outputs += (layout_path(patient_id, target_raw_dir),)
+    if PYRAMID:
+        # Written last, so it stands for the whole store
+        outputs += (os.path.join(pyramid_path(patient_id, target_raw_dir), ".zattrs"),)
+    if FINGERPRINT and not is_test:
+        outputs += (fingerprint_path(patient_id, target_raw_dir),)
+    if EXPORT_PREPROCESSED and not is_test:
+        root = export_root(target_raw_dir)
+        outputs += (os.path.join(case_dir(root), f"Lizard_{patient_id}.pkl"),) + staged_paths(f"Lizard_{patient_id}", root)
+    return outputs
+
+def patient_params(row, is_test):
+    # Everything that changes the output files of one patient
+    params = {
+        "target_size": TARGET_SIZE,
+        "hu_window": HU_WINDOW,
+        "crop_buffer": CROP_BUFFER,
+        "exclusion_list": sorted(EXCLUSION_LIST),
+        "liver_slices": [int(row['First_Liver_Slice']), int(row['Last_Liver_Slice'])],
+        "is_test": bool(is_test),
+        "file_ending": nii_suffix(),
+        "compact": COMPACT,
+    }
+    if TIGHT_CROP:
+        params["tight_crop"] = True
+    if PYRAMID:
+        params["pyramid"] = {"levels": list(PYRAMID_LEVELS), "chunk": PYRAMID_CHUNK}
+    return params_fingerprint(params)
+
+def load_patient_volumes(base_path, reader, z_range=None, with_labels=True):
+    """
+    CT, Liver+Region union and portal/vein label map of one patient (None
+    without with_labels, e.g. for inference studies).
+    With a z_range only that slab of every series is decoded; the returned
+    slab info is then (z_range, full CT geometry), otherwise None.
+    """
+    if z_range is None:
+        ct = load_dicom_series(os.path.join(base_path, "CorrespImage"), reader)
+        slab = None
+        load_label = lambda d: load_dicom_series(os.path.join(base_path, d), reader)
+    else:
+        ct, z_range, geometry = load_dicom_slab(os.path.join(base_path, "CorrespImage"), z_range, reader)
+        slab = (z_range, geometry)
+        load_label = lambda d: load_label_slab(os.path.join(base_path, d), slab, reader)
+
+    # Merge Liver + Regions (each series is aligned to the CT only if its grid differs)
+    region_folders = [f for f in list_series(base_path) if re.match(r'Region\d+', f, re.IGNORECASE)]
+    liver_mask = composite_liver_mask(ct, (load_label(f) for f in ["Liver"] + region_folders))
+
+    # Merge Vessels
+    vessels = composite_vessel_labels(ct, load_label("Portal"), load_label("Vein")) if with_labels else None
+    return ct, liver_mask, vessels, slab
+
+def load_study(row, base_path, with_labels=True):
+    """Volumes of one STL_DICOM study folder; the slab around the liver if row has its slices."""
+    reader = sitk.ImageSeriesReader()
+    z_range = liver_z_range(row) if ROI_READING and 'First_Liver_Slice' in row else None
+
+    ct, liver_mask, vessels, slab = load_patient_volumes(base_path, reader, z_range, with_labels)
+    ls = sitk.LabelShapeStatisticsImageFilter()
+    ls.Execute(liver_mask)
+    if slab is not None and not (ls.HasLabel(1) and slab_crop_is_exact(ls.GetBoundingBox(1), CROP_BUFFER, slab)):
+        # Liver not (fully) inside the slab: decode the whole series instead
+        ct, liver_mask, vessels, slab = load_patient_volumes(base_path, reader, None, with_labels)
+        ls.Execute(liver_mask)
+    return ct, liver_mask, vessels, slab, ls
+
+def load_patient(row, root_dir, target_raw_dir, is_test=False):
+    """Reading stage: decoded volumes of one patient, as the slab or the full series."""
+    patient_id = row['pid_str']
+    set_patient(patient_id)
+    return load_study(row, study_path(root_dir, patient_id))
+
+def compute_patient(row, volumes, target_raw_dir, is_test=False):
+    """Compute stage: crop, clamp/mask and resample. Returns the pending writes."""
+    patient_id = row['pid_str']
+    set_patient(patient_id)
+    ct, liver_mask, vessels, slab, ls = volumes
+
+    img_path, lab_path = output_paths(patient_id, target_raw_dir, is_test)
+    os.makedirs(os.path.dirname(img_path), exist_ok=True)
+    if vessels is not None:
+        os.makedirs(os.path.dirname(lab_path), exist_ok=True)
+
+    if ls.HasLabel(1):
+        bbox = ls.GetBoundingBox(1)
+    elif 'First_Liver_Slice' not in row:
+        raise ValueError("empty liver mask and no liver slices given")
+    else:
+        z_s, z_e = int(row['First_Liver_Slice']), int(row['Last_Liver_Slice'])
+        bbox = [0, 0, z_s, ct.GetSize()[0], ct.GetSize()[1], max(1, z_e - z_s)]
+
+    # ROI Crop
+    sz = [min(ct.GetSize()[i] - bbox[i], bbox[i+3] + 2*CROP_BUFFER) for i in range(3)]
+    idx = [max(0, bbox[i] - CROP_BUFFER) for i in range(3)]
+
+    # One plan (crop window + 256x256x256 letterbox grid) for image and label
+    plan = make_plan(ct, idx, sz, slab, target_size=TARGET_SIZE)
+    if TIGHT_CROP:
+        # Same voxels, minus the letterbox padding the crop cannot reach
+        plan = tight_plan(plan)
+
+    # Intensity Clamping & Masking (Isolation), only inside the crop
+    mask_roi = crop_slab(liver_mask, sz, idx, slab) if ls.HasLabel(1) else None
+    ct_roi = clamp_mask_fill(crop_slab(ct, sz, idx, slab), mask_roi, HU_WINDOW, -100.0)
+
+    # Resample to the new 256x256x256 Grid (-100 HU / label 0 outside the crop)
+    fingerprint = FINGERPRINT and not is_test
+    export = EXPORT_PREPROCESSED and not is_test
+    if vessels is None or (not fingerprint and not PYRAMID):
+        pending = [deferred_apply_plan(plan, ct_roi, False, -100, img_path, cropped=True)]
+        # Inference studies come without labels
+        if vessels is not None:
+            pending.append(deferred_apply_plan(plan, vessels, True, 0, lab_path))
+        if TIGHT_CROP:
+            pending.append(partial(save_layout, layout_path(patient_id, target_raw_dir), plan))
+        return pending
+
+    # Fingerprint and pyramid come from the written voxels: the (small) label
+    # grid stays in memory while the image slabs go by
+    labels = apply_plan(plan, vessels, True, 0)
+    label_array = sitk.GetArrayViewFromImage(labels)
+    case = CaseFingerprint(label_array.shape, plan["grid"]["spacing"][::-1], HU_WINDOW) if fingerprint else None
+    # The export and the pyramid need the whole image, assembled from the slabs as read back by nnU-Net
+    image_array = np.empty(label_array.shape, dtype=np.float32) if export or PYRAMID else None
+
+    def on_slab(k0, image):
+        if case is not None:
+            case.add_slab(k0, image, label_array)
+        if image_array is not None:
+            image_array[k0:k0 + image.shape[0]] = readback(image)
+
+    pending = [deferred_apply_plan(plan, ct_roi, False, -100, img_path, cropped=True, on_slab=on_slab),
+               partial(write_image, labels, lab_path, is_label=True)]
+    if case is not None:
+        pending.append(partial(case.save, fingerprint_path(patient_id, target_raw_dir)))
+    if export:
+        pending.append(partial(export_case, f"Lizard_{patient_id}", image_array, label_array, plan["grid"],
+                               export_root(target_raw_dir), FOREGROUND_LABELS))
+    if PYRAMID:
+        pending.append(partial(write_pyramid, pyramid_path(patient_id, target_raw_dir), image_array, label_array,
+                               plan["grid"]))
+    if TIGHT_CROP:
+        pending.append(partial(save_layout, layout_path(patient_id, target_raw_dir), plan))
+    return pending
+
+def write_patient(row, pending):
+    """Writing stage: runs the pending writes of compute_patient()."""
+    set_patient(row['pid_str'])
+    for write in pending:
+        write()
+    return True
+
+def process_patient(row, root_dir, target_raw_dir, is_test=False):
+    try:
+        volumes = load_patient(row, root_dir, target_raw_dir, is_test)
+        return write_patient(row, compute_patient(row, volumes, target_raw_dir, is_test))
+    except Exception as e:
+        print(f"  --> Skip ID {row['pid_str']}: {e}")
+        return False
+
+def queue_patient(row, root_dir, target_raw_dir, is_test, inputs, params, outputs):
+    """process_patient() for the work queue: its result and its manifest entry, for the reducer."""
+    ok = process_patient(row, root_dir, target_raw_dir, is_test)
+    entry = {"patients": {}}
+    record_patient(entry, row['pid_str'], inputs, params, outputs, target_raw_dir, ok)
+    return {"success": ok, "manifest": entry["patients"][row['pid_str']]}
+
+def result_counts(jobs, results, skipped):
+    # (saved patients, saved training patients), counting the up-to-date ones as saved
+    success_count = len(skipped) + sum(1 for ok in results if ok)
+    train_count = (sum(1 for is_test in skipped if not is_test)
+                   + sum(1 for job, ok in zip(jobs, results) if ok and not job[3]))
+    return success_count, train_count
+
+def write_dataset(df_final, test_pids, raw_dir, success_count, train_count):
+    """dataset.json, and the fingerprint / nnU-Net export when enabled, once all patients are done."""
+    # Dataset.json update
+    dataset_json = {
+        "channel_names": {"0": "CT"},
+        "labels": {"background": 0, "portal_vein": 1, "hepatic_vein": 2},
+        "numTrainingInstances": train_count,
+        "file_ending": nii_suffix(),
+    }
+    with open(os.path.join(raw_dir, "dataset.json"), 'w') as f:
+        json.dump(dataset_json, f, indent=4)
+
+    if FINGERPRINT:
+        # Same cases nnU-Net would fingerprint: every training image on disk
+        train_pids = [pid for pid in df_final['pid_str']
+                      if pid not in test_pids and os.path.exists(output_paths(pid, raw_dir)[0])]
+        case_paths = [fingerprint_path(pid, raw_dir) for pid in train_pids]
+        missing = [p for p in case_paths if not os.path.exists(p)]
+        if missing:
+            print(f"Fingerprint incomplete ({len(missing)} cases missing), not written")
+        else:
+            fingerprint = dataset_fingerprint(case_paths)
+            out_dir = export_root(raw_dir) if os.environ.get("nnUNet_preprocessed") else raw_dir
+            print(f"Fingerprint written to {write_fingerprint(fingerprint, out_dir)}")
+            if EXPORT_PREPROCESSED:
+                # Normalize the staged cases; training can start right after this
+                shape = TARGET_SIZE[::-1]
+                if TIGHT_CROP:
+                    # Cases come in their own sizes, as nnU-Net would plan them
+                    shape = [int(s) for s in np.median(fingerprint["shapes_after_crop"], axis=0)]
+                count = finalize(export_root(raw_dir), raw_dir, fingerprint, shape, TARGET_SPACING[::-1],
+                                 [f"Lizard_{pid}" for pid in train_pids])
+                print(f"nnU-Net preprocessed export: {count} cases written to {export_root(raw_dir)}")
+
+    if TIGHT_CROP:
+        print(f"Preprocessing finished. {success_count} patients saved as tight crops of the 256x256x256 grid.")
+    else:
+        print(f"Preprocessing finished. {success_count} patients saved in 256x256x256 grid.")
+
+def run(csv_path=SLICE_CSV, root_data=DATA_ROOT, raw_dir=NNUNET_RAW_DIR, num_workers=NUM_WORKERS, force=FORCE_REBUILD):
+    """The whole dataset: split, incremental per-patient runs and the dataset files."""
+    if EXPORT_PREPROCESSED and not os.environ.get("nnUNet_preprocessed"):
+        raise SystemExit("LIZARD_EXPORT_PREPROCESSED=1 needs nnUNet_preprocessed to point at the preprocessed root")
+
+    df = pd.read_csv(csv_path)
+    df['pid_str'] = df['Patient_ID'].apply(patient_number)
+
+    # Filtering and Counting Usable Data
+    df_valid = df[~df['pid_str'].isin(EXCLUSION_LIST)].copy()
+    patient_folders = set(list_patients(root_data))
+    available_pids = [pid for pid in df_valid['pid_str'] if patient_folder(pid) in patient_folders]
+    df_final = df_valid[df_valid['pid_str'].isin(available_pids)].copy()
+
+    total_usable = len(df_final)
+    print(f"Total Usable Patients: {total_usable}")
+
+    # Split
+    random.seed(RANDOM_SEED)
+    test_pids = random.sample(df_final['pid_str'].tolist(), min(TEST_SET_SIZE, total_usable))
+
+    # Skip patients whose inputs, parameters and outputs match the manifest
+    manifest = load_manifest(raw_dir)
+    jobs, job_keys, skipped = [], [], []
+    for _, row in df_final.iterrows():
+        pid = row['pid_str']
+        is_test = pid in test_pids
+        inputs = input_fingerprint(study_path(root_data, pid))
+        params = patient_params(row, is_test)
+        outputs = patient_outputs(pid, raw_dir, is_test)
+        if not force and is_up_to_date(manifest, pid, inputs, params, outputs, raw_dir):
+            skipped.append(is_test)
+            continue
+        jobs.append((row, root_data, raw_dir, is_test))
+        job_keys.append((pid, inputs, params, outputs))
+    print(f"Up to date: {len(skipped)} patients, to process: {len(jobs)}")
+
+    def checkpoint(i, ok):
+        pid, inputs, params, outputs = job_keys[i]
+        record_patient(manifest, pid, inputs, params, outputs, raw_dir, ok)
+        save_manifest(manifest, raw_dir)
+
+    if QUEUE_DIR:
+        # Distributed mode: every worker process (on any host) claims patients from the shared queue
+        queue = WorkQueue(QUEUE_DIR)
+        names = [patient_folder(key[0]) for key in job_keys]
+        # The manifest entry a run starts from is part of the key: done records of
+        # earlier runs (written from an older entry) do not count for this one
+        keys = [params_fingerprint({"inputs": key[1], "params": key[2], "previous": manifest["patients"].get(key[0])})
+                for key in job_keys]
+        try:
+            records = run_queue(queue_patient, [job + key[1:] for job, key in zip(jobs, job_keys)],
+                                names, keys, queue)
+            success_count, train_count = result_counts(jobs, [record["success"] for record in records], skipped)
+
+            def reduce():
+                # Only the reducer writes the manifest and the dataset files
+                manifest = load_manifest(raw_dir)
+                for key, record in zip(job_keys, records):
+                    manifest["patients"][key[0]] = record["manifest"]
+                save_manifest(manifest, raw_dir)
+                write_dataset(df_final, test_pids, raw_dir, success_count, train_count)
+
+            run_key = params_fingerprint({"jobs": keys, "patients": sorted(df_final['pid_str']),
+                                          "test": sorted(test_pids), "counts": [success_count, train_count]})
+            if not queue.reduce_once(run_key, reduce):
+                print("All patients done; the dataset files are written by another worker")
+        finally:
+            queue.close()
+    else:
+        prefetch = PREFETCH > 0 and num_workers <= 1
+        if prefetch and (PATIENT_TIMEOUT or NODE_BUDGET_MB):
+            # The pipeline runs the patients in this process and keeps several in memory
+            print("LIZARD_PREFETCH ignored: the patient timeout and node budget are only enforced without it")
+            prefetch = False
+        if prefetch:
+            # Reading, compute and writing of consecutive patients overlap
+            results = run_pipelined(load_patient, lambda job, volumes: compute_patient(job[0], volumes, job[2], job[3]),
+                                    lambda job, pending: write_patient(job[0], pending), jobs,
+                                    PREFETCH, on_result=checkpoint, job_name=lambda job: f"ID {job[0]['pid_str']}")
+        else:
+            # Largest patients first, within LIZARD_NODE_BUDGET_MB (estimates only matter in parallel)
+            costs = [patient_memory_mb(study_path(root_data, job[0]['pid_str']),
+                                       liver_z_range(job[0]) if ROI_READING else None, job[0])
+                     for job in jobs] if num_workers > 1 else None
+            results = run_patients(process_patient, jobs, num_workers, on_result=checkpoint, costs=costs,
+                                   names=[patient_folder(key[0]) for key in job_keys], failed=False)
+        success_count, train_count = result_counts(jobs, results, skipped)
+        write_dataset(df_final, test_pids, raw_dir, success_count, train_count)
+
+if __name__ == "__main__":
+    run()
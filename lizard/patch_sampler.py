@@ -0,0 +1,149 @@
+"""
+Memory-mapped, foreground-biased 3D patch sampling over the preprocessing outputs.
+
+Training on the 256^3 cases of Dataset501_LiverVessels only needs small
+patches, but a .nii.gz has to be decompressed completely to get one. Here
+every case is opened as a np.memmap instead, so a patch read only touches the
+rows it covers:
+
+  .nii     (LIZARD_NII_CODEC=none) is mapped in place
+  .nii.gz  is unpacked once into LIZARD_PATCH_CACHE and that copy is mapped
+           (without a cache it is decoded into memory, once per process)
+
+Portal/vein voxels (labels 1 and 2) are a tiny part of each volume, so the
+coordinates of every foreground voxel are indexed once per label file (cached
+in LIZARD_PATCH_CACHE as well) and a configurable share of the patches is
+centred on one of them, like nnU-Net's foreground oversampling.
+
+    sampler = PatchSampler(cases, patch_size=(128, 128, 128), oversample_foreground=0.33)
+    for images, labels in sampler.batches(batch_size=2, num_batches=250, num_workers=4):
+        ...
+
+Tight-crop outputs (LIZARD_TIGHT_CROP=1) are sampled in their letterbox
+frame by passing (image, label, layout) cases, see letterbox.py.
+
+PatchSampler also has __len__/__getitem__, so it can be handed to a
+torch DataLoader as a map-style dataset.
+"""
+import os
+from multiprocessing import Pool
+
+from .lazy import lazy_import
+from .letterbox import CACHE_DIR, _cache_key, load_layout, open_letterbox
+
+np = lazy_import("numpy")
+
+FOREGROUND_LABELS = (1, 2)
+OVERSAMPLE_FOREGROUND = 0.33
+
+
+def foreground_index(label_path, labels=FOREGROUND_LABELS, cache_dir=None):
+    """{label: (n, 3) z, y, x coordinates of its voxels}; cached per label file if there is a cache."""
+    cache_dir = cache_dir or CACHE_DIR
+    index_path = os.path.join(cache_dir, _cache_key(label_path) + ".fg.npz") if cache_dir else None
+    if index_path and os.path.exists(index_path):
+        with np.load(index_path) as f:
+            return {label: f[f"label_{label}"] for label in labels}
+
+    seg = open_letterbox(label_path, is_label=True, cache_dir=cache_dir).data
+    index = {label: np.argwhere(seg == label).astype(np.int16) for label in labels}
+    if index_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = index_path + f".tmp{os.getpid()}.npz"
+        np.savez(tmp_path, **{f"label_{label}": coords for label, coords in index.items()})
+        os.replace(tmp_path, index_path)
+    return index
+
+
+class PatchSampler:
+    """
+    Random patches from (image_path, label_path[, layout_path]) cases. With probability
+    oversample_foreground a patch is centred on a random portal/vein voxel
+    (class first, then voxel), otherwise it is placed uniformly.
+    """
+
+    def __init__(self, cases, patch_size=(128, 128, 128), oversample_foreground=OVERSAMPLE_FOREGROUND,
+                 labels=FOREGROUND_LABELS, cache_dir=None, seed=0, epoch_length=250):
+        self.cases = list(cases)
+        self.patch_size = tuple(int(s) for s in patch_size)
+        self.oversample_foreground = oversample_foreground
+        self.labels = tuple(labels)
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.seed = seed
+        self.epoch_length = epoch_length
+        self._open = {}
+
+    def __getstate__(self):
+        # Memmaps are reopened in every worker process
+        state = dict(self.__dict__)
+        state["_open"] = {}
+        return state
+
+    def _case(self, i):
+        if i not in self._open:
+            image_path, label_path = self.cases[i][:2]
+            layout = load_layout(self.cases[i][2]) if len(self.cases[i]) > 2 else None
+            image = open_letterbox(image_path, layout, False, self.cache_dir)
+            seg = open_letterbox(label_path, layout, True, self.cache_dir)
+            # Foreground coordinates of the stored voxels, moved into the letterbox frame
+            index = {label: coords + np.array(seg.offset, dtype=coords.dtype) for label, coords
+                     in foreground_index(label_path, self.labels, self.cache_dir).items()}
+            self._open[i] = (image, seg, index)
+        return self._open[i]
+
+    def read_patch(self, i, start):
+        """(image float32, label) patches of case i starting at voxel start (z, y, x)."""
+        image, seg, _ = self._case(i)
+        return (image.read_window(start, self.patch_size).astype(np.float32, copy=False),
+                seg.read_window(start, self.patch_size))
+
+    def sample(self, rng):
+        """One random (image, label, case index, start) patch."""
+        i = int(rng.randint(len(self.cases)))
+        _, seg, index = self._case(i)
+        present = [label for label in self.labels if len(index[label])]
+        if present and rng.uniform() < self.oversample_foreground:
+            coords = index[present[rng.randint(len(present))]]
+            center = coords[rng.randint(len(coords))].astype(int)
+            start = [int(c) - k // 2 for c, k in zip(center, self.patch_size)]
+        else:
+            # Patches larger than the volume are placed so the volume lies inside them
+            start = [int(rng.randint(min(0, n - k), max(0, n - k) + 1)) for n, k in zip(seg.shape, self.patch_size)]
+        image_patch, label_patch = self.read_patch(i, start)
+        return image_patch, label_patch, i, start
+
+    def __len__(self):
+        return self.epoch_length
+
+    def __getitem__(self, k):
+        # Deterministic per item, so parallel loaders draw different patches
+        image_patch, label_patch, _, _ = self.sample(np.random.RandomState((self.seed, k)))
+        return image_patch[None], label_patch[None]
+
+    def batch(self, b, batch_size):
+        rng = np.random.RandomState((self.seed, b))
+        patches = [self.sample(rng) for _ in range(batch_size)]
+        return (np.stack([p[0] for p in patches])[:, None],
+                np.stack([p[1] for p in patches])[:, None])
+
+    def batches(self, batch_size=2, num_batches=None, num_workers=1):
+        """Yields (images, labels) batches of shape (B, 1, z, y, x), built on num_workers processes."""
+        num_batches = self.epoch_length if num_batches is None else num_batches
+        if num_workers <= 1:
+            for b in range(num_batches):
+                yield self.batch(b, batch_size)
+            return
+        with Pool(num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+            yield from pool.imap(_worker_batch, ((b, batch_size) for b in range(num_batches)))
+
+
+_worker_sampler = None
+
+
+def _init_worker(sampler):
+    global _worker_sampler
+    _worker_sampler = sampler
+
+
+def _worker_batch(args):
+    return _worker_sampler.batch(*args)
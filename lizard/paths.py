@@ -0,0 +1,37 @@
+"""
+Default data locations and the folder layout of one LIZARD patient.
+
+    <DATA_ROOT>/Lizard_ID7/STL_DICOM_Lizard_ID7/CorrespImage, Liver, Portal, ...
+
+The defaults are the paths of the training cluster; every one can be
+overridden with its environment variable or the matching `lizard` option.
+"""
+import os
+
+DATA_ROOT = os.environ.get("LIZARD_DATA_ROOT", "/workspace/Storage_fast/data/Mainz_LIZARD")
+# First/last liver slice per patient, input of the nnU-Net pipelines
+SLICE_CSV = os.environ.get("LIZARD_SLICE_CSV", "/workspace/Storage_redundent/lizard/stats/liver_slice.csv")
+# Mask statistics written by `lizard stats`, input of the extract pipelines
+STATS_CSV = os.environ.get("LIZARD_STATS_CSV", "/workspace/Storage_redundent/lizard/liver_slice_stats.csv")
+NNUNET_RAW_DIR = os.environ.get("LIZARD_NNUNET_RAW", "/workspace/Storage_fast/nnUNet_raw/Dataset501_LiverVessels")
+# Parent of the Processed_* output folders of the extract pipelines
+OUTPUT_ROOT = os.environ.get("LIZARD_OUTPUT_ROOT", "/workspace/Storage_fast/data")
+
+
+def patient_number(patient_id):
+    """"7" for 7, "7" or "Lizard_ID7"."""
+    return str(patient_id).replace("Lizard_ID", "")
+
+
+def patient_folder(patient_id):
+    return f"Lizard_ID{patient_number(patient_id)}"
+
+
+def study_path(root_dir, patient_id):
+    """The STL_DICOM folder holding the series of one patient."""
+    folder = patient_folder(patient_id)
+    return os.path.join(root_dir, folder, f"STL_DICOM_{folder}")
+
+
+def series_path(root_dir, patient_id, anatomy):
+    return os.path.join(study_path(root_dir, patient_id), anatomy)
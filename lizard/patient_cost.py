@@ -0,0 +1,68 @@
+"""
+Estimated size and peak memory of one patient, for the scheduler in
+patient_pool.run_patients().
+
+The CT grid of a study comes from the header index (LIZARD_INDEX) or from
+one DICOM header plus the number of files in CorrespImage, so nothing is
+decoded. With the liver z-range of ROI reading only that slab counts. A study
+that cannot be read falls back to the liver slices of the stats CSV on a
+512x512 grid.
+
+Peak memory is modelled as a fixed per-worker part (interpreter, SimpleITK,
+the 256^3 output grids) plus a cost per decoded CT voxel (the CT, its float
+copy and the label series on the same grid). Both were measured on the
+letterbox pipeline and can be tuned with LIZARD_WORKER_BASE_MB and
+LIZARD_BYTES_PER_VOXEL.
+"""
+import os
+
+from .dicom_cache import _read_header
+from .series_index import indexed_series
+
+WORKER_BASE_MB = float(os.environ.get("LIZARD_WORKER_BASE_MB", 300))
+BYTES_PER_VOXEL = float(os.environ.get("LIZARD_BYTES_PER_VOXEL", 24))
+DEFAULT_SLICE_SIZE = (512, 512)
+
+
+def ct_size(study_dir):
+    """(x, y, z) of the CorrespImage series of a study, from its headers; None if unreadable."""
+    directory = os.path.join(study_dir, "CorrespImage")
+    record = indexed_series(directory)
+    if record is not None and record["size"] is not None:
+        return tuple(record["size"])
+    try:
+        names = sorted(f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)))
+        if not names:
+            return None
+        size = _read_header(os.path.join(directory, names[0])).GetSize()
+    except (OSError, RuntimeError):
+        return None
+    return size[0], size[1], len(names)
+
+
+def csv_slices(row):
+    """Liver slices of a stats CSV row, or None."""
+    if 'First_Liver_Slice' in row and 'Last_Liver_Slice' in row:
+        return int(row['Last_Liver_Slice']) - int(row['First_Liver_Slice']) + 1
+    if 'Total_Slices_with_Liver' in row:
+        return int(row['Total_Slices_with_Liver'])
+    return None
+
+
+def patient_voxels(study_dir, z_range=None, row=None):
+    """CT voxels one patient decodes: the full series, or the z_range slab of it."""
+    size = ct_size(study_dir)
+    if size is None:
+        slices = csv_slices(row) if row is not None else None
+        if z_range is not None:
+            slices = z_range[1] - z_range[0] + 1
+        return DEFAULT_SLICE_SIZE[0] * DEFAULT_SLICE_SIZE[1] * (slices or 1)
+    slices = size[2]
+    if z_range is not None:
+        slices = max(1, min(size[2] - 1, z_range[1]) - max(0, z_range[0]) + 1)
+    return size[0] * size[1] * slices
+
+
+def patient_memory_mb(study_dir, z_range=None, row=None):
+    """Estimated peak memory (MB) of a worker processing this patient."""
+    return WORKER_BASE_MB + patient_voxels(study_dir, z_range, row) * BYTES_PER_VOXEL / 1024**2
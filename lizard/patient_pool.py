@@ -0,0 +1,202 @@
+"""
+Runs one function over many patients: in this process, on a process pool, or
+through the memory-aware scheduler.
+
+The scheduler starts with the most expensive patients (estimated peak memory,
+see patient_cost.py) so a large case does not end up running alone at the
+tail. A patient is only admitted while the estimates of the running ones plus
+its own fit LIZARD_NODE_BUDGET_MB. Each patient then runs in its own process,
+which is killed after LIZARD_PATIENT_TIMEOUT seconds.
+"""
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .lazy import lazy_import
+
+sitk = lazy_import("SimpleITK")
+
+_budget = os.environ.get("LIZARD_NODE_BUDGET_MB")
+NODE_BUDGET_MB = float(_budget) if _budget else None
+_timeout = os.environ.get("LIZARD_PATIENT_TIMEOUT")
+PATIENT_TIMEOUT = float(_timeout) if _timeout else None
+
+
+def available_cpus():
+    """Number of cores this process may run on (respects taskset/cgroup affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def itk_threads_per_worker(num_workers):
+    """Split the available cores evenly between workers, at least one ITK thread each."""
+    return max(1, available_cpus() // max(1, num_workers))
+
+
+def _init_worker(itk_threads):
+    # Every filter created in this worker inherits the global default, so
+    # N workers x itk_threads never exceeds the core count.
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(itk_threads)
+
+
+def _call(func, args):
+    return func(*args)
+
+
+def largest_first(costs):
+    """Job indices by decreasing cost (job order among equal costs)."""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def _run_child(conn, func, args, itk_threads):
+    _init_worker(itk_threads)
+    try:
+        result = ("ok", func(*args))
+    except BaseException as e:
+        result = ("error", e)
+    try:
+        conn.send(result)
+    except Exception as e:
+        # Unpicklable result or exception
+        conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+    conn.close()
+
+
+def run_scheduled(func, jobs, num_workers, costs=None, budget_mb=None, timeout=None, on_result=None, names=None,
+                  failed=None):
+    """
+    run_patients() with one process per job: largest cost first, admitted
+    while the running costs fit budget_mb, killed after timeout seconds.
+    A job that is killed or whose process dies (e.g. out of memory) gets the
+    result `failed`; an exception raised by func stops the run as it would in
+    the pool.
+    """
+    jobs = list(jobs)
+    costs = list(costs) if costs is not None else [0.0] * len(jobs)
+    names = list(names) if names is not None else [f"job {i}" for i in range(len(jobs))]
+    results = [None] * len(jobs)
+    pending = largest_first(costs)
+    itk_threads = itk_threads_per_worker(num_workers)
+    ctx = multiprocessing.get_context()
+    running = {}  # job index -> (process, connection, deadline)
+
+    def admit():
+        used = sum(costs[i] for i in running)
+        for i in pending:
+            if budget_mb is None or used + costs[i] <= budget_mb:
+                return i
+        if not running:
+            # Nothing else can free memory for it: run it alone
+            i = pending[0]
+            print(f"  --> {names[i]}: estimated {costs[i]:.0f} MB exceeds the node budget "
+                  f"({budget_mb:.0f} MB), running it alone")
+            return i
+        return None
+
+    def finish(i, result):
+        results[i] = result
+        if on_result is not None:
+            on_result(i, result)
+
+    try:
+        while pending or running:
+            while pending and len(running) < num_workers:
+                i = admit()
+                if i is None:
+                    break
+                pending.remove(i)
+                receiver, sender = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_run_child, args=(sender, func, jobs[i], itk_threads))
+                process.start()
+                sender.close()
+                running[i] = (process, receiver, time.monotonic() + timeout if timeout else None)
+
+            deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = set(wait([conn for _, conn, _ in running.values()]
+                             + [process.sentinel for process, _, _ in running.values()], wait_for))
+
+            for i, (process, conn, deadline) in list(running.items()):
+                if conn in ready or process.sentinel in ready:
+                    try:
+                        status, value = conn.recv()
+                    except EOFError:
+                        status, value = "died", process.exitcode
+                    process.join()
+                    conn.close()
+                    del running[i]
+                    if status == "error":
+                        raise value
+                    if status == "died":
+                        print(f"  --> {names[i]}: worker died (exit code {process.exitcode})")
+                        value = failed
+                    finish(i, value)
+                elif deadline is not None and time.monotonic() >= deadline:
+                    process.kill()
+                    process.join()
+                    conn.close()
+                    del running[i]
+                    print(f"  --> {names[i]}: killed after the {timeout:g} s patient timeout")
+                    finish(i, failed)
+    finally:
+        for process, conn, _ in running.values():
+            process.kill()
+            process.join()
+            conn.close()
+    return results
+
+
+def run_patients(func, jobs, num_workers=1, on_result=None, costs=None, names=None,
+                 budget_mb=NODE_BUDGET_MB, timeout=PATIENT_TIMEOUT, failed=None):
+    """
+    Runs func(*args) for every args tuple in jobs and returns the results in job order.
+
+    With num_workers <= 1 the jobs run in this process exactly like the old
+    serial loops. Otherwise they are fanned out over a process pool whose ITK
+    thread budget is divided between the workers. func must live at module
+    level so it can be pickled into the workers.
+
+    costs (estimated peak MB per job, see patient_cost.py) make the pool start
+    the largest jobs first. With a node budget_mb or a per-job timeout
+    (LIZARD_NODE_BUDGET_MB, LIZARD_PATIENT_TIMEOUT) the jobs go through
+    run_scheduled() instead; names label them in its messages, and a job it
+    kills or loses to a dead process gets the result `failed`.
+
+    on_result(job_index, result) is called in this process as soon as each job
+    finishes, e.g. to checkpoint progress.
+    """
+    jobs = list(jobs)
+    if jobs and (timeout or (budget_mb and costs is not None and num_workers > 1)):
+        num_workers = max(1, min(num_workers, len(jobs)))
+        budget = f", node budget {budget_mb:.0f} MB" if budget_mb and costs is not None else ""
+        limit = f", {timeout:g} s per patient" if timeout else ""
+        print(f"Scheduling {len(jobs)} patients on {num_workers} workers{budget}{limit}")
+        return run_scheduled(func, jobs, num_workers, costs, budget_mb if costs is not None else None,
+                             timeout, on_result, names, failed)
+
+    results = [None] * len(jobs)
+    if num_workers <= 1 or len(jobs) <= 1:
+        for i, args in enumerate(jobs):
+            results[i] = func(*args)
+            if on_result is not None:
+                on_result(i, results[i])
+        return results
+
+    num_workers = min(num_workers, len(jobs))
+    itk_threads = itk_threads_per_worker(num_workers)
+    print(f"Running {len(jobs)} patients on {num_workers} workers ({itk_threads} ITK threads each)")
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                             initargs=(itk_threads,)) as pool:
+        order = largest_first(costs) if costs is not None else range(len(jobs))
+        futures = {pool.submit(_call, func, jobs[i]): i for i in order}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_result is not None:
+                on_result(i, results[i])
+    return results
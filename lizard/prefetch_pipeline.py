@@ -0,0 +1,144 @@
+"""
+Pipelined per-patient runner: load, compute and write overlap.
+
+run_patients() with one worker handles a patient strictly in order (read the
+series, compute, write), so the disk idles while the CPU works and the other
+way round. run_pipelined() splits each job into three stages on their own
+threads, connected by bounded queues:
+
+    reader thread   load(*args)            -> up to PREFETCH loaded jobs waiting
+    calling thread  compute(args, data)    -> up to WRITE_QUEUE finished jobs waiting
+    writer thread   write(args, pending)   -> result
+
+SimpleITK releases the GIL inside filters and readers and numpy/zlib do the same
+for their heavy loops, so the stages really run in parallel. The queues are
+bounded, so when compute is the slow stage the reader blocks instead of piling
+up decoded volumes: at most PREFETCH + WRITE_QUEUE + 3 jobs are in memory.
+"""
+import os
+import queue
+import threading
+
+PREFETCH = int(os.environ.get("LIZARD_PREFETCH", 0))
+WRITE_QUEUE = int(os.environ.get("LIZARD_WRITE_QUEUE", 2))
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+def _job_name(args):
+    return str(args[0]) if args else "job"
+
+
+def run_pipelined(load, compute, write, jobs, prefetch=None, write_queue=None, on_result=None,
+                  job_name=_job_name, failed=False):
+    """
+    Runs write(args, compute(args, load(*args))) for every args tuple in jobs,
+    with the three stages of consecutive jobs overlapping. Returns the results
+    in job order. A stage that raises marks its job as failed (the error is
+    printed and its result is `failed`); the other jobs carry on.
+
+    on_result(job_index, result) is called from the writer thread, in job
+    order, as soon as each job is written, e.g. to checkpoint progress. An
+    exception it raises (or any other one escaping a stage thread) stops the
+    pipeline and is re-raised here.
+    """
+    prefetch = max(1, PREFETCH if prefetch is None else prefetch)
+    write_queue = max(1, WRITE_QUEUE if write_queue is None else write_queue)
+    jobs = list(jobs)
+    results = [failed] * len(jobs)
+    loaded = queue.Queue(maxsize=prefetch)
+    computed = queue.Queue(maxsize=write_queue)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        # Gives up when the pipeline is torn down, so a blocked thread can exit
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def guarded(target):
+        # Without this a dead thread would leave the others waiting on its queue
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        return run
+
+    def reader():
+        for i, args in enumerate(jobs):
+            try:
+                data = load(*args)
+            except Exception as e:
+                data = _Failed("load", e)
+            if not put(loaded, (i, args, data)):
+                return
+        put(loaded, _DONE)
+
+    def writer():
+        while not stop.is_set():
+            try:
+                item = computed.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            i, args, pending = item
+            if isinstance(pending, _Failed):
+                _report(job_name(args), pending)
+            else:
+                try:
+                    results[i] = write(args, pending)
+                except Exception as e:
+                    _report(job_name(args), _Failed("write", e))
+            if on_result is not None:
+                on_result(i, results[i])
+
+    threads = [threading.Thread(target=guarded(reader), name="lizard-reader", daemon=True),
+               threading.Thread(target=guarded(writer), name="lizard-writer", daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while not stop.is_set():
+            try:
+                item = loaded.get(timeout=0.1)
+            except queue.Empty:
+                if not threads[0].is_alive() and loaded.empty():
+                    break
+                continue
+            if item is _DONE:
+                break
+            i, args, data = item
+            del item
+            if not isinstance(data, _Failed):
+                try:
+                    data = compute(args, data)
+                except Exception as e:
+                    data = _Failed("compute", e)
+            if not put(computed, (i, args, data)):
+                break
+        put(computed, _DONE)
+        threads[1].join()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def _report(name, failure):
+    print(f"  --> Skip {name}: {failure.stage} failed: {failure.error}")
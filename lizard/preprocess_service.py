@@ -0,0 +1,332 @@
+"""
+Long-running local preprocessing service for inference requests.
+
+Adapting a batch script per study pays the SimpleITK/pandas imports, the CSV
+and a scan of the whole Mainz_LIZARD tree every time. This service starts once,
+keeps a bounded pool of warm worker processes and runs the nnunet_preprocessing
+pipeline (alignment, clamp, liver masking, letterbox to 256^3) on one study
+directory per request:
+
+    lizard service serve                            # Unix socket LIZARD_SERVICE_SOCKET
+    LIZARD_SERVICE_PORT=8765 lizard service serve   # or 127.0.0.1:8765
+    lizard service request /data/new/STL_DICOM_Lizard_ID7 [--array]
+    lizard service stats
+
+Protocol: one JSON object per line in each direction, any number of requests
+per connection, connections served concurrently.
+
+    {"study": "<STL_DICOM_* folder>", "case_id": "7", "liver_slices": [11, 29],
+     "output_dir": "...", "array": false}
+    -> {"ok": true, "case_id": "7", "image": ".../imagesTs/Lizard_7_0000.nii.gz",
+        "labels": null, "seconds": 3.2, "queued": 0.0, "stages": {"load": 1.1, ...}}
+
+The study needs CorrespImage and Liver (plus any RegionN) series; Portal/Vein
+are preprocessed to labelsTs as well when present. liver_slices enables reading
+only the slab around the liver. With "array": true the JSON line carries
+"array": {"shape", "dtype", "nbytes"} and is followed by the raw (z, y, x)
+C-order bytes of the image as nnU-Net reads it.
+
+At most LIZARD_SERVICE_WORKERS studies run at once and LIZARD_SERVICE_QUEUE more
+wait; beyond that requests are refused with "busy" instead of piling up.
+Concurrent requests for the same study and output share one run.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .instrument import add_listener, set_patient
+from .lazy import lazy_import
+from .nnunet_preprocessing import compute_patient, load_study, output_paths, write_patient
+from .patient_pool import _init_worker, itk_threads_per_worker
+from .series_index import list_series
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+SOCKET_PATH = os.environ.get("LIZARD_SERVICE_SOCKET", "/tmp/lizard_preprocess.sock")
+# Serve on 127.0.0.1:<port> instead of the Unix socket
+PORT = int(os.environ.get("LIZARD_SERVICE_PORT", 0))
+WORKERS = int(os.environ.get("LIZARD_SERVICE_WORKERS", 1))
+MAX_QUEUED = int(os.environ.get("LIZARD_SERVICE_QUEUE", 8))
+OUTPUT_DIR = os.environ.get("LIZARD_SERVICE_OUTPUT", "/workspace/Storage_fast/nnUNet_inference")
+# Latencies kept for the stats request
+LATENCY_WINDOW = 1000
+
+# Stage times of the request running in this worker process
+_stages = {}
+
+
+def _collect(name, seconds, fields):
+    _stages[name] = _stages.get(name, 0.0) + seconds
+
+
+def _init_service_worker(itk_threads):
+    _init_worker(itk_threads)
+    add_listener(_collect)
+
+
+def _warm_up():
+    # Loads ITK's resample/IO factories once, so the first request does not pay for them
+    img = sitk.Image([8, 8, 8], sitk.sitkFloat32)
+    sitk.Resample(img, img, sitk.Transform(), sitk.sitkLinear)
+    return os.getpid()
+
+
+def case_id_of(study):
+    name = os.path.basename(os.path.normpath(study))
+    for prefix in ("STL_DICOM_", "Lizard_ID"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name) or "study"
+
+
+def preprocess_study(study, case_id, output_dir, liver_slices=None, with_array=False):
+    """
+    Runs in a worker: preprocesses one study folder into output_dir/imagesTs
+    (and labelsTs with Portal/Vein present). Returns paths, stage times and
+    optionally the image array.
+    """
+    started = time.time()
+    _stages.clear()
+    row = {"pid_str": case_id}
+    if liver_slices is not None:
+        row["First_Liver_Slice"], row["Last_Liver_Slice"] = (int(s) for s in liver_slices)
+    set_patient(case_id)
+    try:
+        with_labels = {"Portal", "Vein"} <= set(list_series(study))
+        volumes = load_study(row, study, with_labels)
+        write_patient(row, compute_patient(row, volumes, output_dir, is_test=True))
+    finally:
+        set_patient(None)
+    img_path, lab_path = output_paths(case_id, output_dir, is_test=True)
+    result = {"image": img_path, "labels": lab_path if with_labels else None,
+              "started": started, "stages": dict(_stages)}
+    if with_array:
+        result["array"] = sitk.GetArrayFromImage(sitk.ReadImage(img_path))
+    return result
+
+
+class PreprocessService:
+    """asyncio front end: parses requests, bounds the work and hands it to the worker pool."""
+
+    def __init__(self, workers=WORKERS, max_queued=MAX_QUEUED, output_dir=OUTPUT_DIR):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.output_dir = output_dir
+        self.pool = None
+        self.in_flight = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.served = 0
+        self.failed = 0
+        self.refused = 0
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker,
+                                   initargs=(itk_threads_per_worker(self.workers),))
+
+    async def start(self):
+        self.pool = self._new_pool()
+        loop = asyncio.get_running_loop()
+        # One task per worker, so every process is spawned and warm before the first request
+        pids = await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up) for _ in range(self.workers)))
+        print(f"{len(set(pids))} workers ready ({itk_threads_per_worker(self.workers)} ITK threads each)")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def _run(self, study, case_id, output_dir, liver_slices, with_array):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.pool, partial(preprocess_study, study, case_id, output_dir, liver_slices, with_array))
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory): the next requests get a fresh pool
+            self.pool.shutdown(wait=False)
+            self.pool = self._new_pool()
+            raise RuntimeError("worker process died")
+
+    async def preprocess(self, request):
+        received = time.time()
+        study = request.get("study")
+        if not study:
+            return {"ok": False, "error": "missing study"}
+        if not os.path.isdir(study):
+            return {"ok": False, "error": f"No study folder {study}"}
+        case_id = str(request.get("case_id") or case_id_of(study))
+        output_dir = request.get("output_dir") or self.output_dir
+        liver_slices = request.get("liver_slices")
+        with_array = bool(request.get("array"))
+
+        key = (os.path.abspath(study), case_id, os.path.abspath(output_dir), json.dumps(liver_slices), with_array)
+        task = self.in_flight.get(key)
+        if task is None:
+            if len(self.in_flight) >= self.workers + self.max_queued:
+                self.refused += 1
+                return {"ok": False, "case_id": case_id,
+                        "error": f"busy: {len(self.in_flight)} studies in progress, try again later"}
+            task = asyncio.ensure_future(self._run(study, case_id, output_dir, liver_slices, with_array))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        try:
+            # shield: a client hanging up does not cancel the run other clients wait for
+            result = dict(await asyncio.shield(task))
+        except Exception as e:
+            self.failed += 1
+            seconds = time.time() - received
+            print(f"  --> {case_id}: failed after {seconds:.2f}s: {e}")
+            return {"ok": False, "case_id": case_id, "error": str(e), "seconds": seconds}
+
+        seconds = time.time() - received
+        self.served += 1
+        self.latencies.append(seconds)
+        response = {"ok": True, "case_id": case_id, "seconds": seconds,
+                    "queued": max(0.0, result.pop("started") - received)}
+        response.update(result)
+        print(f"{case_id}: {seconds:.2f}s ({response['queued']:.2f}s queued) -> {response['image']}")
+        return response
+
+    def stats(self):
+        latencies = np.array(self.latencies, dtype=float)
+        percentiles = {f"p{p}": float(np.percentile(latencies, p)) for p in (50, 90, 99)} if len(latencies) else {}
+        return {"ok": True, "workers": self.workers, "in_progress": len(self.in_flight), "served": self.served,
+                "failed": self.failed, "refused": self.refused, "latency_s": percentiles}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"ok": False, "error": f"invalid JSON: {e}"}
+                else:
+                    op = request.get("op", "preprocess")
+                    if op == "stats":
+                        response = self.stats()
+                    elif op == "preprocess":
+                        response = await self.preprocess(request)
+                    else:
+                        response = {"ok": False, "error": f"unknown op {op}"}
+
+                array = response.pop("array", None)
+                if array is not None:
+                    array = np.ascontiguousarray(array)
+                    response["array"] = {"shape": list(array.shape), "dtype": array.dtype.str, "nbytes": array.nbytes}
+                writer.write((json.dumps(response) + "\n").encode())
+                if array is not None:
+                    writer.write(memoryview(array).cast("B"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, socket_path=SOCKET_PATH, port=PORT):
+    await service.start()
+    if port:
+        server = await asyncio.start_server(service.handle, "127.0.0.1", port, limit=1 << 20)
+        where = f"127.0.0.1:{port}"
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(service.handle, socket_path, limit=1 << 20)
+        where = socket_path
+    print(f"Preprocessing service listening on {where}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+    service.close()
+    if not port and os.path.exists(socket_path):
+        os.remove(socket_path)
+    print("Preprocessing service stopped")
+
+
+def _connect(socket_path=SOCKET_PATH, port=PORT):
+    if port:
+        return socket.create_connection(("127.0.0.1", port))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    return sock
+
+
+def request(payload, socket_path=SOCKET_PATH, port=PORT):
+    """
+    Sends one request to a running service and returns its response. An image
+    array sent along (payload "array": true) is returned as response["data"].
+    """
+    with _connect(socket_path, port) as sock, sock.makefile('rb') as f:
+        sock.sendall((json.dumps(payload) + "\n").encode())
+        line = f.readline()
+        if not line:
+            raise ConnectionError("service closed the connection")
+        response = json.loads(line)
+        meta = response.get("array")
+        if meta is not None:
+            data = f.read(meta["nbytes"])
+            if len(data) != meta["nbytes"]:
+                raise ConnectionError("service closed the connection mid-array")
+            response["data"] = np.frombuffer(data, dtype=np.dtype(meta["dtype"])).reshape(meta["shape"])
+    return response
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Local preprocessing service for inference studies")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("--workers", type=int, default=WORKERS)
+    serve_parser.add_argument("--queue", type=int, default=MAX_QUEUED, help="requests waiting beyond the workers")
+    serve_parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    request_parser = sub.add_parser("request")
+    request_parser.add_argument("study", help="STL_DICOM_* folder with CorrespImage and Liver series")
+    request_parser.add_argument("--case-id")
+    request_parser.add_argument("--liver-slices", type=int, nargs=2, metavar=("FIRST", "LAST"))
+    request_parser.add_argument("--output-dir")
+    request_parser.add_argument("--array", action="store_true", help="also fetch the image array")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        asyncio.run(serve(PreprocessService(args.workers, args.queue, args.output_dir)))
+        return 0
+
+    if args.command == "stats":
+        print(json.dumps(request({"op": "stats"}), indent=4))
+        return 0
+
+    payload = {"study": os.path.abspath(args.study), "array": args.array}
+    if args.case_id:
+        payload["case_id"] = args.case_id
+    if args.liver_slices:
+        payload["liver_slices"] = args.liver_slices
+    if args.output_dir:
+        payload["output_dir"] = os.path.abspath(args.output_dir)
+    start = time.perf_counter()
+    response = request(payload)
+    data = response.pop("data", None)
+    print(json.dumps(response, indent=4))
+    if data is not None:
+        print(f"array {data.shape} {data.dtype}, {data.min():.1f}..{data.max():.1f}")
+    print(f"Round trip: {time.perf_counter() - start:.2f}s")
+    return 0 if response.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
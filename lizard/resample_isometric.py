@@ -1,8 +1,16 @@
-import SimpleITK as sitk
 import os
 
+from .lazy import lazy_import
+from .slab_resample import resample_to_file
+
+sitk = lazy_import("SimpleITK")
+
 def resample_to_1mm_isotropic(input_path, output_path):
-    img = sitk.ReadImage(input_path)
+    # Only the header is read here; under LIZARD_RESAMPLE_BUDGET_MB the voxels are
+    # read, resampled and written slab by slab
+    img = sitk.ImageFileReader()
+    img.SetFileName(input_path)
+    img.ReadImageInformation()
     original_spacing = img.GetSpacing()
     original_size = img.GetSize()
     target_spacing = [1.0, 1.0, 1.0]
@@ -23,9 +31,7 @@ def resample_to_1mm_isotropic(input_path, output_path):
     resampler.SetOutputDirection(img.GetDirection())
     resampler.SetInterpolator(sitk.sitkLinear)
     
-    resampled_img = resampler.Execute(img)
-    
-    sitk.WriteImage(resampled_img, output_path)
+    resample_to_file(resampler, input_path, output_path)
     print(f"Resampled to: {target_size}")
 
 # resample_to_1mm_isotropic("path/to/Corresplmage", "liver_iso.nii.gz")
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Crop + resample planning shared by the image and label of a patient.
+
+make_plan() turns the liver bounding box crop (index and size on the CT grid,
+or on a slab of it) into the final output grid in one step: 1 mm isotropic
+over the crop, or a fixed-size letterbox centred on it. The CT and the label
+map then go through apply_plan() with the same plan, so both land on exactly
+the same grid. The crop itself is a voxel copy (no interpolation); every output
+voxel is interpolated exactly once, by the single resample onto the plan grid.
+
+The crop window stays part of the result: ITK treats the crop edge as the
+image edge (default value beyond it, edge voxels within half a voxel of it),
+so sampling the uncropped volume would change the border of the output.
+"""
+from functools import partial
+
+from .dicom_cache import index_to_point
+from .instrument import timed
+from .lazy import lazy_import
+from .nii_writer import write_image
+from .roi_reading import crop_slab
+from .separable_resample import execute
+from .slab_resample import MEMORY_BUDGET_MB, resample_to_file
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+TARGET_SPACING = (1.0, 1.0, 1.0)
+
+
+def crop_grid(img, index, size, slab=None):
+    """Grid of crop_slab(img, size, index, slab) without making the crop."""
+    if slab is not None:
+        (z0, _), geometry = slab
+        origin = index_to_point(geometry, (index[0], index[1], index[2] + z0))
+    else:
+        origin = img.TransformIndexToPhysicalPoint([int(i) for i in index])
+    return {"size": tuple(int(s) for s in size), "spacing": img.GetSpacing(),
+            "origin": origin, "direction": img.GetDirection()}
+
+
+def make_plan(img, index, size, slab=None, spacing=TARGET_SPACING, target_size=None):
+    """
+    Plan for cropping img (CT or anything on its grid) to index/size and
+    resampling the crop. Without target_size the output covers the crop at
+    the given spacing (size rounded per axis); with it, the output is a
+    target_size box centred on the crop (the nnU-Net letterbox).
+    """
+    crop = crop_grid(img, index, size, slab)
+    if target_size is None:
+        out_size = [int(round(crop["size"][i] * crop["spacing"][i] / spacing[i])) for i in range(3)]
+        out_origin = crop["origin"]
+    else:
+        out_size = list(target_size)
+        # Physical centre of the crop, and the box origin that centres it
+        center = [crop["origin"][i] + (crop["size"][i] * crop["spacing"][i] / 2.0) for i in range(3)]
+        out_origin = [center[i] - (out_size[i] * spacing[i] / 2.0) for i in range(3)]
+    return {
+        "index": [int(i) for i in index],
+        "size": [int(s) for s in size],
+        "slab": slab,
+        "crop": crop,
+        "grid": {"size": out_size, "spacing": list(spacing), "origin": list(out_origin),
+                 "direction": crop["direction"]},
+    }
+
+
+def tight_plan(plan, margin=1):
+    """
+    The letterbox plan cut down to the part of its grid the crop can reach:
+    the same output voxels on a sub-box of the same grid (the rest would be
+    the default value). plan["letterbox"] keeps the full grid and the offset
+    (x, y, z voxels) of the box in it.
+    """
+    grid, crop = plan["grid"], plan["crop"]
+    # Interpolators sample up to half a voxel beyond the outer crop voxels
+    corners = np.array([[-0.5 if c == 0 else s - 0.5 for c, s in zip(bits, crop["size"])]
+                        for bits in np.ndindex(2, 2, 2)])
+    crop_direction = np.array(crop["direction"]).reshape(3, 3)
+    points = np.array(crop["origin"]) + (corners * np.array(crop["spacing"])) @ crop_direction.T
+    direction = np.array(grid["direction"]).reshape(3, 3)
+    index = ((points - np.array(grid["origin"])) @ direction) / np.array(grid["spacing"])
+
+    offset, size = [], []
+    for axis, n in enumerate(grid["size"]):
+        lo = min(max(0, int(np.floor(index[:, axis].min())) - margin), n - 1)
+        hi = max(min(n, int(np.ceil(index[:, axis].max())) + 1 + margin), lo + 1)
+        offset.append(lo)
+        size.append(hi - lo)
+    tight = dict(grid, size=size, origin=list(index_to_point(grid, offset)))
+    return dict(plan, grid=tight, letterbox={"grid": grid, "offset": offset})
+
+
+def whole_image_plan(img, spacing=TARGET_SPACING, target_size=None):
+    """Plan that keeps all of img (for callers that have already cropped)."""
+    return make_plan(img, (0, 0, 0), img.GetSize(), spacing=spacing, target_size=target_size)
+
+
+def plan_resampler(plan, is_label=False, default=0.0):
+    grid = plan["grid"]
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetSize(grid["size"])
+    resampler.SetOutputSpacing(grid["spacing"])
+    resampler.SetOutputOrigin(grid["origin"])
+    resampler.SetOutputDirection(grid["direction"])
+    resampler.SetInterpolator(sitk.sitkNearestNeighbor if is_label else sitk.sitkLinear)
+    resampler.SetDefaultPixelValue(default)
+    return resampler
+
+
+@timed("resample")
+def apply_plan(plan, img, is_label=False, default=0.0, output_path=None, cropped=False, on_slab=None):
+    """
+    Crops img to the plan window and resamples it onto the plan grid.
+    cropped=True means img already is the crop (e.g. the masked CT from
+    clamp_mask_fill) and is used as it is. With an output_path the result is
+    written (slab by slab under LIZARD_RESAMPLE_BUDGET_MB) and its size returned;
+    on_slab sees the written voxels (see slab_resample.resample_to_file).
+    """
+    roi = img if cropped else crop_slab(img, plan["size"], plan["index"], plan["slab"])
+    resampler = plan_resampler(plan, is_label, default)
+    if output_path:
+        return resample_to_file(resampler, roi, output_path, is_label, on_slab=on_slab)
+    return execute(resampler, roi)
+
+
+def deferred_apply_plan(plan, img, is_label=False, default=0.0, output_path=None, cropped=False, on_slab=None):
+    """
+    apply_plan() to output_path split in two: resamples now and returns a
+    callable that writes the result (for the writer stage of prefetch_pipeline).
+    Under LIZARD_RESAMPLE_BUDGET_MB the slab resample is fused with its write,
+    so the callable does both.
+    """
+    if MEMORY_BUDGET_MB:
+        return partial(apply_plan, plan, img, is_label, default, output_path, cropped, on_slab)
+    out = apply_plan(plan, img, is_label, default, cropped=cropped)
+    if on_slab is not None:
+        on_slab(0, sitk.GetArrayViewFromImage(out))
+    return partial(write_image, out, output_path, is_label=is_label)
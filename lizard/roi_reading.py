@@ -0,0 +1,85 @@
+"""
+ROI-first reading: decode only the slices around the liver.
+
+stats/liver_slice.csv already knows which slices hold the liver, so the CT and
+all label series can be read as a z-slab (liver extent plus a margin) instead
+of the whole series. Slabs carry the exact geometry of the full volume, and
+slab_crop_is_exact() tells the caller when the liver bounding box found in the
+slab gives the same crop as a full read would; otherwise it should fall back
+to decoding everything. Outputs are therefore identical to the full-read path.
+"""
+
+from .instrument import timed
+from .dicom_cache import index_to_point, load_dicom_series, load_dicom_slab, series_geometry
+from .lazy import lazy_import
+from .separable_resample import execute
+from .series_index import series_file_names
+from .volume_ops import same_grid
+
+sitk = lazy_import("SimpleITK")
+
+# Slices kept on each side of the liver extent recorded in liver_slice.csv
+ROI_MARGIN = 8
+
+
+def liver_z_range(row, margin=ROI_MARGIN):
+    return int(row['First_Liver_Slice']) - margin, int(row['Last_Liver_Slice']) + margin
+
+
+@timed("load")
+def load_label_slab(directory, slab, reader=None):
+    """
+    A label series on the CT slab's grid. slab is (z_range, full CT geometry)
+    as returned by load_dicom_slab(). Series on the CT grid are read as the
+    same slab; others are resampled onto the full CT grid and then cut, exactly
+    like the full-read path does.
+    """
+    if reader is None:
+        reader = sitk.ImageSeriesReader()
+    (z0, z1), ct_geometry = slab
+    dicom_names = series_file_names(directory, reader)
+    if not dicom_names:
+        raise FileNotFoundError(f"No DICOM files found in {directory}")
+
+    if same_grid(series_geometry(dicom_names), ct_geometry):
+        label, _, _ = load_dicom_slab(directory, (z0, z1), reader)
+        return label
+
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetSize(ct_geometry["size"])
+    resampler.SetOutputSpacing(ct_geometry["spacing"])
+    resampler.SetOutputOrigin(ct_geometry["origin"])
+    resampler.SetOutputDirection(ct_geometry["direction"])
+    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+    resampler.SetTransform(sitk.Transform())
+    full = execute(resampler, load_dicom_series(directory, reader))
+    size = [ct_geometry["size"][0], ct_geometry["size"][1], z1 - z0 + 1]
+    return sitk.RegionOfInterest(full, size, [0, 0, z0])
+
+
+def slab_crop_is_exact(bbox, buffer, slab):
+    """
+    True if bbox (found on the slab) is not cut off by the slab and the
+    'bbox +/- buffer' crop used by the scripts comes out the same as on the
+    full volume.
+    """
+    (z0, z1), geometry = slab
+    num_slices = geometry["size"][2]
+    start = bbox[2] + z0
+    end = start + bbox[5]
+    low_ok = z0 == 0 or start - max(buffer, 1) >= z0
+    high_ok = z1 == num_slices - 1 or (end <= z1 and end + 2 * buffer <= z1 + 1)
+    return low_ok and high_ok
+
+
+@timed("crop")
+def crop_slab(img, size, index, slab=None):
+    """
+    RegionOfInterest with index given on the slab. The origin is recomputed
+    on the full grid so the crop is bit-identical to one taken from a full read.
+    """
+    roi = sitk.RegionOfInterest(img, size, index)
+    if slab is not None:
+        (z0, _), geometry = slab
+        roi.SetOrigin(index_to_point(geometry, (index[0], index[1], index[2] + z0)))
+    return roi
@@ -0,0 +1,108 @@
+"""
+Input/output manifest for incremental preprocessing runs.
+
+The manifest sits next to the nnU-Net raw dataset and records, per patient,
+a fingerprint of the input series (file list, sizes, mtimes), a hash of the
+preprocessing parameters and the hashes of the written files. A patient whose
+inputs, parameters and outputs are unchanged can be skipped on the next run.
+"""
+import os
+import json
+import hashlib
+
+MANIFEST_NAME = "lizard_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _hash_json(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+def input_fingerprint(series_root):
+    """Hash of every file below series_root: relative path, size and mtime."""
+    h = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(series_root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            h.update(f"{os.path.relpath(path, series_root)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def params_fingerprint(params):
+    return _hash_json(params)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(raw_dir):
+    path = os.path.join(raw_dir, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "patients": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "patients": {}}
+    return manifest
+
+
+def save_manifest(manifest, raw_dir):
+    # Atomic replace so a crash mid-write never leaves a truncated manifest
+    path = os.path.join(raw_dir, MANIFEST_NAME)
+    os.makedirs(raw_dir, exist_ok=True)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _output_state(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def is_up_to_date(manifest, patient_id, inputs, params, output_paths, raw_dir):
+    """
+    True if the patient was processed successfully with the same inputs and
+    parameters and its output files are still the ones that run wrote.
+    """
+    entry = manifest["patients"].get(patient_id)
+    if not entry or not entry.get("success"):
+        return False
+    if entry.get("inputs") != inputs or entry.get("params") != params:
+        return False
+
+    recorded = entry.get("outputs", {})
+    if set(recorded) != {os.path.relpath(p, raw_dir) for p in output_paths}:
+        return False
+    for rel_path, state in recorded.items():
+        try:
+            current = _output_state(os.path.join(raw_dir, rel_path))
+        except OSError:
+            return False
+        # Size and mtime are enough to detect a rewrite without re-hashing every volume
+        if current["size"] != state["size"] or current["mtime_ns"] != state["mtime_ns"]:
+            return False
+    return True
+
+
+def record_patient(manifest, patient_id, inputs, params, output_paths, raw_dir, success):
+    outputs = {}
+    if success:
+        for path in output_paths:
+            state = _output_state(path)
+            state["sha256"] = file_sha256(path)
+            outputs[os.path.relpath(path, raw_dir)] = state
+    manifest["patients"][patient_id] = {
+        "inputs": inputs,
+        "params": params,
+        "outputs": outputs,
+        "success": bool(success),
+    }
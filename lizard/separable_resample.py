@@ -0,0 +1,170 @@
+"""
+Separable NumPy resampling for axis-aligned grids.
+
+sitk.ResampleImageFilter maps every output voxel through a general 3D
+transform and evaluates the interpolator there. For the grids this repo
+resamples between (identity transform, and input and output directions that
+differ at most by an axis permutation or flip) every input axis depends on
+one output axis only, so the same result comes out of three batched 1D
+passes: gather the two neighbours along one axis and blend, then the next
+axis. resample_separable() does that for linear and nearest-neighbour
+interpolation with ITK's conventions:
+
+  - samples are inside when -0.5 <= continuous index < size - 0.5 on every
+    axis, everything else gets the default value
+  - linear blends along x, then y, then z in double precision, reuses the
+    edge voxel within half a voxel of the edge, and casts like ITK (rounding
+    for float outputs, clamping + truncation for integer ones)
+  - nearest neighbour rounds half indices up
+
+Tolerance: the continuous indices are computed per axis instead of through
+ITK's per-voxel matrix products, so they differ by ~1e-13 voxels. Linear
+outputs therefore differ from ITK by at most a few float32 ulps (in practice
+<1e-4 HU). Nearest-neighbour outputs are identical except for samples that lie
+within ~1e-9 voxels of a half-voxel boundary, where ITK's own rounding picks
+either neighbour. benchmarks/bench_resample.py measures both.
+
+LIZARD_RESAMPLE_ENGINE selects the engine for every resample in the
+preprocessing scripts: "itk" (default), or "auto", which uses this engine
+whenever the grids allow it and ITK otherwise.
+"""
+import os
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+
+ENGINE = os.environ.get("LIZARD_RESAMPLE_ENGINE", "itk")
+# Largest deviation of a direction cosine from 0 or +-1 still treated as axis-aligned
+DIRECTION_TOLERANCE = 1e-6
+
+
+def axis_map(in_direction, out_direction, tol=DIRECTION_TOLERANCE):
+    """
+    For every output axis the input axis it runs along and the sign, or None
+    if the two directions are not equal up to an axis permutation and flips.
+    """
+    relative = np.array(in_direction, dtype=float).reshape(3, 3).T @ np.array(out_direction, dtype=float).reshape(3, 3)
+    mapping = []
+    for j in range(3):
+        column = relative[:, j]
+        i = int(np.argmax(np.abs(column)))
+        others = np.delete(column, i)
+        if abs(abs(column[i]) - 1.0) > tol or np.any(np.abs(others) > tol):
+            return None
+        mapping.append((i, 1.0 if column[i] > 0 else -1.0))
+    if len({i for i, _ in mapping}) != 3:
+        return None
+    return mapping
+
+
+def _is_identity(transform):
+    return transform.GetName() in ("Transform", "IdentityTransform") and not transform.GetParameters()
+
+
+def _linear_pass(array, axis, coords):
+    # ITK's LinearInterpolateImageFunction along one axis: a + (b - a) * distance
+    n = array.shape[axis]
+    base = np.clip(np.floor(coords), 0, n - 1).astype(np.intp)
+    distance = np.maximum(coords - base, 0.0)
+    upper = base + 1
+    # Beyond the last voxel the edge value is used as it is
+    distance[upper > n - 1] = 0.0
+    upper = np.minimum(upper, n - 1)
+    shape = [1] * array.ndim
+    shape[axis] = len(coords)
+    lo = np.take(array, base, axis=axis).astype(np.float64, copy=False)
+    hi = np.take(array, upper, axis=axis).astype(np.float64, copy=False)
+    hi -= lo
+    hi *= distance.reshape(shape)
+    hi += lo
+    return hi
+
+
+def _nearest_pass(array, axis, coords):
+    n = array.shape[axis]
+    index = np.clip(np.floor(coords + 0.5), 0, n - 1).astype(np.intp)
+    return np.take(array, index, axis=axis)
+
+
+def _cast(values, dtype):
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        np.clip(values, info.min, info.max, out=values)
+        return np.trunc(values).astype(dtype)
+    return values.astype(dtype)
+
+
+def _numpy_dtype(pixel_id):
+    return sitk.GetArrayViewFromImage(sitk.Image([1, 1, 1], pixel_id)).dtype
+
+
+def resample_separable(resampler, img):
+    """
+    resampler.Execute(img) computed with separable NumPy passes, or None if
+    this resampler/image combination is not supported (non-identity
+    transform, other interpolators, vector pixels, non-aligned directions).
+    """
+    interpolator = resampler.GetInterpolator()
+    if interpolator not in (sitk.sitkLinear, sitk.sitkNearestNeighbor):
+        return None
+    if img.GetDimension() != 3 or img.GetNumberOfComponentsPerPixel() != 1:
+        return None
+    if not _is_identity(resampler.GetTransform()) or resampler.GetUseNearestNeighborExtrapolator():
+        return None
+    mapping = axis_map(img.GetDirection(), resampler.GetOutputDirection())
+    if mapping is None:
+        return None
+
+    out_size = resampler.GetSize()
+    out_spacing = np.array(resampler.GetOutputSpacing(), dtype=float)
+    in_spacing = np.array(img.GetSpacing(), dtype=float)
+    in_direction = np.array(img.GetDirection(), dtype=float).reshape(3, 3)
+    # Continuous input index of the output origin, then one step per output voxel
+    start = (in_direction.T @ (np.array(resampler.GetOutputOrigin()) - np.array(img.GetOrigin()))) / in_spacing
+
+    # Samples are inside on a contiguous run of every output axis (the index is monotonic)
+    coords, window = {}, {}
+    for j, (i, sign) in enumerate(mapping):
+        c = start[i] + sign * out_spacing[j] / in_spacing[i] * np.arange(out_size[j], dtype=np.float64)
+        inside = np.flatnonzero((c >= -0.5) & (c < img.GetSize()[i] - 0.5))
+        window[j] = slice(int(inside[0]), int(inside[-1]) + 1) if inside.size else slice(0, 0)
+        coords[i] = c[window[j]]
+
+    out_pixel_id = resampler.GetOutputPixelType()
+    if out_pixel_id == sitk.sitkUnknown:
+        out_pixel_id = img.GetPixelID()
+    out_dtype = _numpy_dtype(out_pixel_id)
+    # Only the inside block is interpolated; the rest is the default value
+    out_array = np.full(out_size[::-1], resampler.GetDefaultPixelValue(), dtype=out_dtype)
+
+    if all(w.stop > w.start for w in window.values()):
+        array = sitk.GetArrayViewFromImage(img)
+        one_pass = _linear_pass if interpolator == sitk.sitkLinear else _nearest_pass
+        # x, then y, then z: the order in which ITK's trilinear blend combines the neighbours
+        for i in range(3):
+            array = one_pass(array, 2 - i, coords[i])
+        if interpolator == sitk.sitkLinear:
+            array = _cast(array, out_dtype)
+        # Axes of array are the input axes (z, y, x); put them in output order
+        out_array[window[2], window[1], window[0]] = array.transpose([2 - mapping[2 - q][0] for q in range(3)])
+
+    out = sitk.GetImageFromArray(out_array)
+    out.SetSpacing(tuple(out_spacing))
+    out.SetOrigin(resampler.GetOutputOrigin())
+    out.SetDirection(resampler.GetOutputDirection())
+    return out
+
+
+def execute(resampler, img, engine=None):
+    """resampler.Execute(img) on the configured engine (see LIZARD_RESAMPLE_ENGINE)."""
+    engine = engine or ENGINE
+    if engine not in ("itk", "auto"):
+        raise ValueError(f"Unknown resampling engine: {engine}")
+    if engine == "auto":
+        out = resample_separable(resampler, img)
+        if out is not None:
+            return out
+    return resampler.Execute(img)
@@ -0,0 +1,357 @@
+"""
+Persistent SQLite index of the DICOM series headers below a Mainz_LIZARD root.
+
+Every script used to rediscover the dataset: os.listdir on the root and on
+each STL_DICOM_Lizard_IDx folder, GetGDCMSeriesFileNames (which parses every
+header) per series and two more header reads for the geometry. The indexer
+walks the tree once, one worker per patient, and records per series folder:
+
+    series UID, transfer syntax, GDCM-ordered file list, slice positions,
+    size, spacing, origin and direction (as series_geometry() computes them)
+
+    lizard index /workspace/Storage_fast/data/Mainz_LIZARD [--index lizard_index.sqlite]
+
+Rerunning it refreshes incrementally: a folder whose file names, sizes and
+mtimes are unchanged is not parsed again, vanished folders are dropped.
+
+The scripts query the index when LIZARD_INDEX points at the database; folders
+it does not know fall back to the filesystem. The index is trusted as it is,
+so refresh it after the tree changes.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import hashlib
+import sqlite3
+import argparse
+
+from .lazy import lazy_import
+from .patient_pool import run_patients
+
+pydicom = lazy_import("pydicom")
+sitk = lazy_import("SimpleITK")
+
+INDEX_PATH = os.environ.get("LIZARD_INDEX")
+NUM_WORKERS = int(os.environ.get("LIZARD_WORKERS", 1))
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS series (
+    directory TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    patient TEXT NOT NULL,
+    anatomy TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    series_uid TEXT,
+    transfer_syntax TEXT,
+    num_files INTEGER NOT NULL,
+    size TEXT,
+    spacing TEXT,
+    origin TEXT,
+    direction TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS series_patient ON series (root, patient);
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    slice_position TEXT,
+    PRIMARY KEY (directory, position)
+);
+"""
+
+
+def _norm(path):
+    return os.path.abspath(path).rstrip(os.sep)
+
+
+def folder_fingerprint(directory):
+    """Hash of the file names, sizes and mtimes in one folder (stat only, no headers)."""
+    h = hashlib.sha1()
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if entry.is_file():
+            st = entry.stat()
+            h.update(f"{entry.name}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _floats(ds, keyword):
+    value = getattr(ds, keyword, None)
+    return [float(v) for v in value] if value is not None else None
+
+
+def _file_header(path):
+    ds = pydicom.dcmread(path, stop_before_pixels=True)
+    return {
+        "series_uid": str(getattr(ds, "SeriesInstanceUID", "")) or None,
+        "transfer_syntax": str(ds.file_meta.get("TransferSyntaxUID", "")) or None,
+        "position": _floats(ds, "ImagePositionPatient"),
+        "orientation": _floats(ds, "ImageOrientationPatient"),
+        "pixel_spacing": _floats(ds, "PixelSpacing"),
+        "rows": getattr(ds, "Rows", None),
+        "columns": getattr(ds, "Columns", None),
+    }
+
+
+def _cross(a, b):
+    return [a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]]
+
+
+def _unit(v):
+    # As vnl_vector::normalize: scaled by the reciprocal of the length
+    scale = 1.0 / math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    return [x * scale for x in v]
+
+
+def headers_geometry(headers):
+    """
+    header_geometry() from the parsed headers of a series in file order, or
+    None if a tag it needs is missing (or the series has a single file).
+    """
+    first, last = headers[0], headers[-1]
+    needed = ("position", "orientation", "pixel_spacing", "rows", "columns")
+    if len(headers) < 2 or any(first[key] is None for key in needed) or last["position"] is None:
+        return None
+    # The cosines orthogonalized exactly like ITK's GDCMImageIO (the tag keeps only a few digits)
+    row, col = first["orientation"][:3], first["orientation"][3:]
+    normal = _unit(_cross(row, col))
+    row = _unit(_cross(col, normal))
+    col = _cross(normal, row)
+    d = [b - a for a, b in zip(first["position"], last["position"])]
+    return {
+        "size": (int(first["columns"]), int(first["rows"]), len(headers)),
+        # PixelSpacing is (between rows, between columns), i.e. (y, x)
+        "spacing": (first["pixel_spacing"][1], first["pixel_spacing"][0],
+                    math.sqrt(d[0] * d[0] + d[1] * d[1] + d[2] * d[2]) / (len(headers) - 1)),
+        "origin": tuple(first["position"]),
+        "direction": tuple(v for axis in range(3) for v in (row[axis], col[axis], normal[axis])),
+    }
+
+
+def index_series(directory):
+    """Header-only record of one series folder (files in GDCM order, geometry as series_geometry())."""
+    from .dicom_cache import header_geometry
+    dicom_names = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(directory)
+    record = {"series_uid": None, "transfer_syntax": None, "files": list(dicom_names), "positions": [],
+              "size": None, "spacing": None, "origin": None, "direction": None}
+    if not dicom_names:
+        return record
+    headers = [_file_header(name) for name in dicom_names]
+    record["series_uid"], record["transfer_syntax"] = headers[0]["series_uid"], headers[0]["transfer_syntax"]
+    record["positions"] = [h["position"] for h in headers]
+    # The headers are parsed already; ITK only reads them again for single-file or incomplete series
+    geometry = headers_geometry(headers) or header_geometry(dicom_names)
+    for key in ("size", "spacing", "origin", "direction"):
+        record[key] = list(geometry[key])
+    return record
+
+
+def series_folders(series_root):
+    try:
+        return sorted(f for f in os.listdir(series_root) if os.path.isdir(os.path.join(series_root, f)))
+    except FileNotFoundError:
+        return []
+
+
+def index_patient(root, patient, known):
+    """
+    Records for every series folder of one patient. known maps folder ->
+    fingerprint already in the index; those folders come back as None (unchanged).
+    """
+    series_root = os.path.join(root, patient, f"STL_DICOM_{patient}")
+    records = {}
+    for anatomy in series_folders(series_root):
+        directory = _norm(os.path.join(series_root, anatomy))
+        fingerprint = folder_fingerprint(directory)
+        if known.get(directory) == fingerprint:
+            records[directory] = None
+            continue
+        try:
+            record = index_series(directory)
+        except Exception as e:
+            print(f"  --> Could not index {directory}: {e}")
+            continue
+        record.update(anatomy=anatomy, fingerprint=fingerprint)
+        records[directory] = record
+    return records
+
+
+def connect(path, read_only=False):
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is None or int(version[0]) != SCHEMA_VERSION:
+        conn.executescript("DELETE FROM series; DELETE FROM files;")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+        conn.commit()
+    return conn
+
+
+def build_index(root, path, num_workers=NUM_WORKERS):
+    """Indexes (or refreshes) every Lizard_ID* patient below root. Returns (parsed, unchanged, removed)."""
+    root = _norm(root)
+    conn = connect(path)
+    known = dict(conn.execute("SELECT directory, fingerprint FROM series WHERE root = ?", (root,)))
+    patients = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)) and d.startswith("Lizard_ID"))
+    prefixes = {p: _norm(os.path.join(root, p)) + os.sep for p in patients}
+    jobs = [(root, p, {d: f for d, f in known.items() if d.startswith(prefixes[p])}) for p in patients]
+
+    parsed = unchanged = 0
+    seen = set()
+
+    def store(i, records):
+        # Written from this process only, as each patient finishes
+        nonlocal parsed, unchanged
+        patient = jobs[i][1]
+        if records is None:
+            # Killed or lost by the scheduler: keep what the index knew about the patient
+            print(f"  --> {patient}: not indexed, its previous entries are kept")
+            seen.update(jobs[i][2])
+            return
+        for directory, record in records.items():
+            seen.add(directory)
+            if record is None:
+                unchanged += 1
+                continue
+            parsed += 1
+            conn.execute("DELETE FROM files WHERE directory = ?", (directory,))
+            conn.execute("INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                directory, root, patient, record["anatomy"], record["fingerprint"], record["series_uid"],
+                record["transfer_syntax"], len(record["files"]), json.dumps(record["size"]),
+                json.dumps(record["spacing"]), json.dumps(record["origin"]), json.dumps(record["direction"]),
+                time.time()))
+            conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?)", [
+                (directory, k, name, json.dumps(pos)) for k, (name, pos)
+                in enumerate(zip(record["files"], record["positions"] or [None] * len(record["files"])))])
+        conn.commit()
+
+    run_patients(index_patient, jobs, num_workers, on_result=store, names=patients)
+
+    removed = [d for d in known if d not in seen]
+    for directory in removed:
+        conn.execute("DELETE FROM series WHERE directory = ?", (directory,))
+        conn.execute("DELETE FROM files WHERE directory = ?", (directory,))
+    conn.commit()
+    conn.close()
+    return parsed, unchanged, len(removed)
+
+
+# --- Queries (filesystem fallback when LIZARD_INDEX is unset or a folder is unknown) ---
+
+_conn = None
+_conn_pid = None
+
+
+def _index():
+    # One read-only connection per process (pool workers must not share the parent's)
+    global _conn, _conn_pid
+    if not INDEX_PATH:
+        return None
+    if _conn is None or _conn_pid != os.getpid():
+        _conn, _conn_pid = connect(INDEX_PATH, read_only=True), os.getpid()
+    return _conn
+
+
+def indexed_series(directory):
+    """The index record of a series folder (without the file list), or None."""
+    conn = _index()
+    if conn is None:
+        return None
+    row = conn.execute("SELECT series_uid, transfer_syntax, num_files, size, spacing, origin, direction "
+                       "FROM series WHERE directory = ?", (_norm(directory),)).fetchone()
+    if row is None:
+        return None
+    record = {"series_uid": row[0], "transfer_syntax": row[1], "num_files": row[2]}
+    for key, value in zip(("size", "spacing", "origin", "direction"), row[3:]):
+        value = json.loads(value) if value else None
+        record[key] = tuple(value) if value is not None else None
+    return record
+
+
+def series_file_names(directory, reader=None):
+    """Ordered DICOM files of a series folder, as GetGDCMSeriesFileNames returns them."""
+    conn = _index()
+    if conn is not None and indexed_series(directory) is not None:
+        return tuple(r[0] for r in conn.execute(
+            "SELECT path FROM files WHERE directory = ? ORDER BY position", (_norm(directory),)))
+    if reader is None:
+        reader = sitk.ImageSeriesReader()
+    return reader.GetGDCMSeriesFileNames(directory)
+
+
+def indexed_geometry(dicom_names):
+    """series_geometry() of this exact file list from the index, or None."""
+    if not dicom_names or _index() is None:
+        return None
+    directory = os.path.dirname(dicom_names[0])
+    record = indexed_series(directory)
+    if record is None or record["size"] is None or record["num_files"] != len(dicom_names):
+        return None
+    if tuple(series_file_names(directory)) != tuple(dicom_names):
+        return None
+    return {key: record[key] for key in ("size", "spacing", "origin", "direction")}
+
+
+def slice_positions(directory):
+    """Image Position (Patient) of every slice in file order, or None if not indexed."""
+    conn = _index()
+    if conn is None or indexed_series(directory) is None:
+        return None
+    return [json.loads(r[0]) for r in conn.execute(
+        "SELECT slice_position FROM files WHERE directory = ? ORDER BY position", (_norm(directory),))]
+
+
+def list_patients(root):
+    """Lizard_ID* patient folders below root."""
+    conn = _index()
+    if conn is not None:
+        rows = conn.execute("SELECT DISTINCT patient FROM series WHERE root = ?", (_norm(root),)).fetchall()
+        if rows:
+            return sorted(r[0] for r in rows)
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)) and d.startswith("Lizard_ID"))
+
+
+def list_series(series_root):
+    """Series folder names (CorrespImage, Liver, Region1, ...) of one STL_DICOM_Lizard_IDx folder."""
+    conn = _index()
+    if conn is not None:
+        rows = conn.execute("SELECT anatomy FROM series WHERE directory LIKE ? ESCAPE '\\'",
+                            (_like_prefix(_norm(series_root) + os.sep),)).fetchall()
+        if rows:
+            return sorted(r[0] for r in rows)
+    return series_folders(series_root)
+
+
+def has_series(directory):
+    if indexed_series(directory) is not None:
+        return True
+    return os.path.isdir(directory)
+
+
+def _like_prefix(prefix):
+    return re.sub(r"([%_\\])", r"\\\1", prefix) + "%"
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Build or refresh the DICOM header index")
+    parser.add_argument("root", help="Mainz_LIZARD data root")
+    parser.add_argument("--index", default=INDEX_PATH or "lizard_index.sqlite")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    parsed, unchanged, removed = build_index(args.root, args.index, args.workers)
+    print(f"Indexed {parsed} series, {unchanged} unchanged, {removed} removed "
+          f"in {time.perf_counter() - start:.1f}s -> {args.index}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Bounded-memory resampling: the output is produced and written in z-slabs.
+
+sitk.ResampleImageFilter needs the whole input and output volume in memory.
+resample_to_file() instead walks the output grid slab by slab, resamples each
+slab and appends its voxels to the NIfTI file, so only one output slab is ever
+in memory. Peak memory then follows LIZARD_RESAMPLE_BUDGET_MB instead of the
+scan length.
+
+The input can be an in-memory image, which is sampled as it is (the output is
+bit-identical to a single Execute), or an image file. A file is read slab by
+slab too (ImageFileReader extract regions): only the input slices the output
+slab can reach, plus one slice of overlap on each side, enough for linear or
+nearest-neighbour interpolation. The shifted origin of such a cut changes the
+interpolation weights in the last float bit, so linear outputs from files can
+differ from a whole-volume resample by float32 rounding (1 for integer types).
+
+Without a budget, or when the whole output fits into it, the plain resample +
+write_image path is used.
+"""
+import os
+import math
+
+from .dicom_cache import index_to_point
+from .instrument import stage
+from .lazy import lazy_import
+from .nii_writer import CODEC, COMPACT, COMPRESSION_LEVEL, ParallelGzipWriter, compact_image, nifti_header, write_image
+from .separable_resample import execute
+
+sitk = lazy_import("SimpleITK")
+
+_budget = os.environ.get("LIZARD_RESAMPLE_BUDGET_MB")
+MEMORY_BUDGET_MB = float(_budget) if _budget else None
+# Input slices kept beyond the ones an output slab maps into
+SLAB_OVERLAP = 1
+
+
+class _ImageSource:
+    resident = True
+
+    def __init__(self, img):
+        self.img = img
+        self.size = img.GetSize()
+        self.geometry = {"size": self.size, "spacing": img.GetSpacing(),
+                         "origin": img.GetOrigin(), "direction": img.GetDirection()}
+        self.pixel_id = img.GetPixelID()
+        self.components = img.GetNumberOfComponentsPerPixel()
+
+    def read(self, z0, z1):
+        # Already in memory; cutting it would only change the interpolation rounding
+        return self.img
+
+
+class _FileSource:
+    resident = False
+
+    def __init__(self, path):
+        self.reader = sitk.ImageFileReader()
+        self.reader.SetFileName(path)
+        self.reader.ReadImageInformation()
+        self.size = self.reader.GetSize()
+        self.geometry = {"size": self.size, "spacing": self.reader.GetSpacing(),
+                         "origin": self.reader.GetOrigin(), "direction": self.reader.GetDirection()}
+        self.pixel_id = self.reader.GetPixelID()
+        self.components = self.reader.GetNumberOfComponents()
+
+    def read(self, z0, z1):
+        self.reader.SetExtractIndex([0, 0, z0])
+        self.reader.SetExtractSize([self.size[0], self.size[1], z1 - z0 + 1])
+        return self.reader.Execute()
+
+
+def _pixel_bytes(pixel_id, components=1):
+    probe = sitk.Image([1, 1, 1], pixel_id, components)
+    return sitk.GetArrayViewFromImage(probe).itemsize * components
+
+
+def _output_geometry(resampler):
+    return {"size": resampler.GetSize(), "spacing": resampler.GetOutputSpacing(),
+            "origin": resampler.GetOutputOrigin(), "direction": resampler.GetOutputDirection()}
+
+
+def input_z_range(source_geometry, out_geometry, k0, k1, overlap=SLAB_OVERLAP):
+    """
+    Input slices (inclusive, clipped) that output slices k0..k1-1 can sample from.
+    The grids are affine, so the corners of the output slab bound every point.
+    """
+    probe = sitk.Image([1, 1, 1], sitk.sitkUInt8)
+    probe.SetSpacing(source_geometry["spacing"])
+    probe.SetOrigin(source_geometry["origin"])
+    probe.SetDirection(source_geometry["direction"])
+    nx, ny = out_geometry["size"][0], out_geometry["size"][1]
+    zs = [probe.TransformPhysicalPointToContinuousIndex(index_to_point(out_geometry, (i, j, k)))[2]
+          for i in (0, nx - 1) for j in (0, ny - 1) for k in (k0, k1 - 1)]
+    num_slices = source_geometry["size"][2]
+    z0 = max(0, math.floor(min(zs)) - overlap)
+    z1 = min(num_slices - 1, math.ceil(max(zs)) + overlap)
+    if z0 > z1:
+        # Slab lies entirely outside the input: any edge slice yields default values
+        z0 = z1 = 0 if max(zs) < 0 else num_slices - 1
+    return z0, z1
+
+
+def _slab_cost(source, out_geometry, k0, k1, in_slice_bytes, out_slice_bytes):
+    # Output slab + its contiguous copy for the writer (+ the input cut for files)
+    cost = 2 * (k1 - k0) * out_slice_bytes
+    if not source.resident:
+        z0, z1 = input_z_range(source.geometry, out_geometry, k0, k1)
+        cost += (z1 - z0 + 1) * in_slice_bytes
+    return cost
+
+
+def plan_slabs(source, out_geometry, out_pixel_id, budget_bytes):
+    """Output slice ranges [(k0, k1), ...] whose cost each stays within budget_bytes (at least one slice)."""
+    in_slice_bytes = source.size[0] * source.size[1] * _pixel_bytes(source.pixel_id, source.components)
+    out_slice_bytes = out_geometry["size"][0] * out_geometry["size"][1] * \
+        _pixel_bytes(out_pixel_id, source.components)
+    num_out = out_geometry["size"][2]
+    slabs = []
+    k0 = 0
+    while k0 < num_out:
+        # Largest k1 that fits, by bisection (cost grows with the slab)
+        lo, hi = k0 + 1, num_out
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if _slab_cost(source, out_geometry, k0, mid, in_slice_bytes, out_slice_bytes) <= budget_bytes:
+                lo = mid
+            else:
+                hi = mid - 1
+        slabs.append((k0, lo))
+        k0 = lo
+    return slabs
+
+
+def _slab_resampler(resampler, out_geometry, k0, k1):
+    slab = sitk.ResampleImageFilter()
+    slab.SetSize([out_geometry["size"][0], out_geometry["size"][1], k1 - k0])
+    slab.SetOutputSpacing(out_geometry["spacing"])
+    slab.SetOutputDirection(out_geometry["direction"])
+    slab.SetOutputOrigin(index_to_point(out_geometry, (0, 0, k0)))
+    slab.SetInterpolator(resampler.GetInterpolator())
+    slab.SetDefaultPixelValue(resampler.GetDefaultPixelValue())
+    slab.SetOutputPixelType(resampler.GetOutputPixelType())
+    slab.SetTransform(resampler.GetTransform())
+    return slab
+
+
+def resample_to_file(resampler, img, path, is_label=False, budget_mb=None, codec=None, compact=None,
+                     level=COMPRESSION_LEVEL, threads=None, on_slab=None):
+    """
+    Writes resampler.Execute(img) to path (.nii or .nii.gz) with peak memory
+    bounded by budget_mb (default LIZARD_RESAMPLE_BUDGET_MB). img is an image
+    or the path of an image file. Returns the output size.
+    on_slab(k0, array) sees every output slab (z, y, x, starting at slice k0)
+    before it is written, e.g. to collect statistics on the way out.
+    """
+    budget_mb = MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+    compact = COMPACT if compact is None else compact
+    source = _FileSource(img) if isinstance(img, str) else _ImageSource(img)
+    out_geometry = _output_geometry(resampler)
+    out_pixel_id = resampler.GetOutputPixelType()
+    if out_pixel_id == sitk.sitkUnknown:
+        out_pixel_id = source.pixel_id
+
+    slabs = None
+    if budget_mb and path.endswith((".nii", ".nii.gz")) and (codec or CODEC) != "itk":
+        slabs = plan_slabs(source, out_geometry, out_pixel_id, budget_mb * 1024**2)
+    if not slabs or len(slabs) == 1:
+        full = execute(resampler, img if not isinstance(img, str) else sitk.ReadImage(img))
+        if on_slab is not None:
+            on_slab(0, sitk.GetArrayViewFromImage(full))
+        write_image(full, path, codec=codec, compact=compact, is_label=is_label, level=level, threads=threads)
+        return full.GetSize()
+
+    threads = threads or max(1, sitk.ProcessObject.GetGlobalDefaultNumberOfThreads())
+    tmp_path = path + f".tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        out = ParallelGzipWriter(f, level, threads) if path.endswith(".nii.gz") else f
+        for k0, k1 in slabs:
+            if source.resident:
+                cut = source.read(0, source.size[2] - 1)
+            else:
+                with stage("load", voxels_in=0) as fields:
+                    cut = source.read(*input_z_range(source.geometry, out_geometry, k0, k1))
+                    fields["voxels_out"] = cut.GetNumberOfPixels()
+            with stage("resample", voxels_in=cut.GetNumberOfPixels()) as fields:
+                part = execute(_slab_resampler(resampler, out_geometry, k0, k1), cut)
+                fields["voxels_out"] = part.GetNumberOfPixels()
+            del cut
+
+            if on_slab is not None:
+                on_slab(k0, sitk.GetArrayViewFromImage(part))
+            with stage("write", voxels_in=part.GetNumberOfPixels()):
+                scl_slope = None
+                if compact:
+                    part, scl_slope = compact_image(part, is_label)
+                if k0 == 0:
+                    # The first slab starts at the output origin, so its header is the volume's
+                    out.write(nifti_header(part, num_slices=out_geometry["size"][2], scl_slope=scl_slope))
+                # A copy, not a view: the gzip threads may still read it after part is freed
+                out.write(sitk.GetArrayFromImage(part))
+            del part
+        if out is not f:
+            out.close()
+    os.replace(tmp_path, path)
+    return tuple(out_geometry["size"])
@@ -0,0 +1,122 @@
+"""
+Summarizes a LIZARD_TELEMETRY file (see instrument.py).
+
+    lizard telemetry telemetry.jsonl [--outlier-factor 3.5]
+
+Prints per-stage percentiles of duration, throughput and I/O, then flags the
+patients whose time in a stage is far above the median for that stage
+(robust z-score on the median absolute deviation).
+"""
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+PERCENTILES = (50, 90, 99)
+OUTLIER_FACTOR = 3.5
+
+
+def load_records(path):
+    records = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A worker killed mid-write leaves a partial last line
+                print(f"Skipping malformed line {line_no}")
+    return records
+
+
+def patient_stage_seconds(records):
+    """{stage: {patient: total seconds}}; a patient can hit a stage several times."""
+    totals = defaultdict(lambda: defaultdict(float))
+    for r in records:
+        if r.get("patient") is not None:
+            totals[r["stage"]][r["patient"]] += r["seconds"]
+    return totals
+
+
+def stage_summary(records):
+    """Per-stage count, total and percentile rows."""
+    by_stage = defaultdict(list)
+    for r in records:
+        by_stage[r["stage"]].append(r)
+
+    rows = []
+    for name, recs in sorted(by_stage.items()):
+        seconds = np.array([r["seconds"] for r in recs])
+        # Loads have no input image, so count whichever side is larger
+        voxels = sum(max(r.get("voxels_in") or 0, r.get("voxels_out") or 0) for r in recs)
+        row = {
+            "stage": name,
+            "count": len(recs),
+            "total_s": float(seconds.sum()),
+            "mvox_per_s": voxels / seconds.sum() / 1e6 if seconds.sum() > 0 else 0.0,
+            "read_mb": sum(r.get("bytes_read", 0) for r in recs) / 1024**2,
+            "written_mb": sum(r.get("bytes_written", 0) for r in recs) / 1024**2,
+            "max_rss_mb": max(r.get("rss_mb", 0.0) for r in recs),
+        }
+        for p in PERCENTILES:
+            row[f"p{p}_s"] = float(np.percentile(seconds, p))
+        row["max_s"] = float(seconds.max())
+        rows.append(row)
+    return rows
+
+
+def find_outliers(records, factor=OUTLIER_FACTOR):
+    """(stage, patient, seconds, median seconds) for every outlier, slowest first."""
+    outliers = []
+    for name, per_patient in patient_stage_seconds(records).items():
+        if len(per_patient) < 3:
+            continue
+        values = np.array(list(per_patient.values()))
+        median = float(np.median(values))
+        # 1.4826 * MAD estimates the standard deviation for normal data
+        mad = 1.4826 * float(np.median(np.abs(values - median)))
+        if mad == 0:
+            continue
+        for patient, seconds in per_patient.items():
+            if (seconds - median) / mad > factor:
+                outliers.append((name, patient, seconds, median))
+    return sorted(outliers, key=lambda o: o[2] - o[3], reverse=True)
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Per-stage summary of a LIZARD_TELEMETRY file")
+    parser.add_argument("path")
+    parser.add_argument("--outlier-factor", type=float, default=OUTLIER_FACTOR)
+    args = parser.parse_args(argv)
+
+    records = load_records(args.path)
+    if not records:
+        print(f"No records in {args.path}")
+        return 1
+
+    patients = {r.get("patient") for r in records if r.get("patient") is not None}
+    print(f"{len(records)} records, {len(patients)} patients\n")
+
+    header = ["stage", "count", "total_s"] + [f"p{p}_s" for p in PERCENTILES] + \
+             ["max_s", "mvox_per_s", "read_mb", "written_mb", "max_rss_mb"]
+    print("".join(f"{h:>12}" for h in header))
+    for row in stage_summary(records):
+        print(f"{row['stage']:>12}{row['count']:>12}" +
+              "".join(f"{row[h]:>12.3f}" for h in header[2:]))
+
+    outliers = find_outliers(records, args.outlier_factor)
+    print(f"\n{len(outliers)} outlier(s)")
+    for name, patient, seconds, median in outliers:
+        print(f"  patient {patient}: {name} took {seconds:.2f}s (median {median:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
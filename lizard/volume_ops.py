@@ -0,0 +1,127 @@
+"""
+Label alignment, compositing and intensity masking shared by the preprocessing scripts.
+"""
+
+from .instrument import timed
+from .lazy import lazy_import
+from .separable_resample import execute
+
+np = lazy_import("numpy")
+sitk = lazy_import("SimpleITK")
+
+# Largest geometry difference still treated as "same grid", as a fraction of a
+# voxel over the whole extent. Far below the 0.5 voxel where nearest-neighbour
+# resampling would pick a different voxel, so skipping it changes nothing.
+GEOMETRY_TOLERANCE = 1e-3
+
+
+def image_grid(img):
+    return {"size": img.GetSize(), "spacing": img.GetSpacing(),
+            "origin": img.GetOrigin(), "direction": img.GetDirection()}
+
+
+def same_grid(grid, ref, tol=GEOMETRY_TOLERANCE):
+    """
+    True if two grids (dicts with size, spacing, origin and direction, as from
+    image_grid() or dicom_cache.series_geometry()) match within tol.
+    """
+    if tuple(grid["size"]) != tuple(ref["size"]):
+        return False
+    spacing = np.array(ref["spacing"])
+    extent = np.array(ref["size"])
+    if np.any(np.abs(np.array(grid["spacing"]) - spacing) * extent > tol * spacing):
+        return False
+    if np.any(np.abs(np.array(grid["origin"]) - np.array(ref["origin"])) > tol * spacing):
+        return False
+    direction_diff = np.abs(np.array(grid["direction"]) - np.array(ref["direction"]))
+    return bool(np.all(direction_diff * extent.max() < tol))
+
+
+def same_geometry(img, ref, tol=GEOMETRY_TOLERANCE):
+    """True if img lies on ref's voxel grid (size, spacing, origin and direction within tol)."""
+    return same_grid(image_grid(img), image_grid(ref), tol)
+
+
+@timed("align")
+def align_to_reference(img, ref, tol=GEOMETRY_TOLERANCE):
+    """
+    Puts a label image on ref's grid. Images that already share the grid are
+    returned as they are; the rest go through a nearest-neighbour resample
+    (the "Patient 54" case).
+    """
+    if same_geometry(img, ref, tol):
+        return img
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetReferenceImage(ref)
+    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+    resampler.SetTransform(sitk.Transform())
+    return execute(resampler, img)
+
+
+def _to_image(buf, ref):
+    img = sitk.GetImageFromArray(buf)
+    img.CopyInformation(ref)
+    return img
+
+
+@timed("align")
+def composite_liver_mask(ref, masks):
+    """
+    Union of any number of label images (Liver, Region1, Region2, ...) as a
+    0/1 uint8 image on ref's grid. masks may be a generator, so each series is
+    loaded, aligned and folded into the buffer before the next one is read.
+    """
+    shape = sitk.GetArrayViewFromImage(ref).shape
+    union = np.zeros(shape, dtype=np.uint8)
+    scratch = np.empty(shape, dtype=bool)
+    for mask in masks:
+        # Keep the aligned image referenced while its array view is in use
+        aligned = align_to_reference(mask, ref)
+        np.not_equal(sitk.GetArrayViewFromImage(aligned), 0, out=scratch)
+        np.logical_or(union, scratch, out=union)
+        del aligned
+    return _to_image(union, ref)
+
+
+@timed("align")
+def composite_vessel_labels(ref, portal, vein):
+    """portal=1 / vein=2 label map on ref's grid; vein wins where both are set."""
+    shape = sitk.GetArrayViewFromImage(ref).shape
+    labels = np.empty(shape, dtype=np.uint8)
+    scratch = np.empty(shape, dtype=bool)
+    portal = align_to_reference(portal, ref)
+    np.not_equal(sitk.GetArrayViewFromImage(portal), 0, out=labels)
+    vein = align_to_reference(vein, ref)
+    np.not_equal(sitk.GetArrayViewFromImage(vein), 0, out=scratch)
+    np.putmask(labels, scratch, 2)
+    return _to_image(labels, ref)
+
+
+@timed("mask")
+def clamp_mask_fill(ct, mask=None, window=(-100, 250), fill=-100.0, mask_range=None):
+    """
+    Fused form of
+
+        ct = sitk.Clamp(ct, sitk.sitkFloat32, *window)
+        m = sitk.Cast(mask, sitk.sitkFloat32)   # 0/1 mask
+        ct = (ct * m) + ((1.0 - m) * fill)
+
+    computed in one pass into a single float32 buffer, with identical values
+    (for a 0/1 mask the arithmetic is exactly "clamped CT inside, fill outside").
+    Mask voxels count as inside when != 0, or when within mask_range (inclusive,
+    like sitk.BinaryThreshold). Without a mask only the clamp is applied.
+    Call it on the cropped CT and mask so only the crop region is touched.
+    """
+    ct_view = sitk.GetArrayViewFromImage(ct)
+    # Rounding to float32 is monotonic, so cast-then-clamp equals sitk.Clamp's clamp-then-cast
+    out = ct_view.astype(np.float32)
+    np.clip(out, window[0], window[1], out=out)
+
+    if mask is not None:
+        mask_view = sitk.GetArrayViewFromImage(mask)
+        if mask_range is None:
+            outside = mask_view == 0
+        else:
+            outside = (mask_view < mask_range[0]) | (mask_view > mask_range[1])
+        np.putmask(out, outside, np.float32(fill))
+    return _to_image(out, ct)
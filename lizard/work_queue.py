@@ -0,0 +1,230 @@
+"""
+File-lock work queue on shared storage: one job list, any number of worker
+processes on any number of hosts.
+
+Every worker builds the same job list (same CSV, seeded split and manifest)
+and walks it; the queue directory decides who runs what:
+
+    <queue>/claims/<job>.lock   created with O_EXCL by the worker that runs the job;
+                                its mtime is the worker's heartbeat
+    <queue>/done/<job>.json     the job's result, written atomically when it finishes
+
+Only lock-file creation, rename and mtime are relied on, which NFS provides
+(SQLite locking over NFS is not safe). A claim whose heartbeat is older than
+LIZARD_QUEUE_LEASE seconds, or whose process is gone on this host, belongs to a
+dead worker and is taken over. Host clocks are compared through file mtimes, so
+the lease must be well above the clock skew between nodes. Jobs run at least
+once: a worker that was wrongly declared dead still finishes its job, and the
+outputs are written with atomic replaces, so the duplicate only costs time.
+
+A done record carries a key (a hash of the job's inputs and parameters), so
+records of an older run with other inputs count as not done. Once every job is
+done, exactly one worker runs the reduce step (see WorkQueue.reduce_once).
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+QUEUE_DIR = os.environ.get("LIZARD_QUEUE")
+LEASE = float(os.environ.get("LIZARD_QUEUE_LEASE", 300))
+POLL_INTERVAL = float(os.environ.get("LIZARD_QUEUE_POLL", 5))
+REDUCE_JOB = "_reduce"
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkQueue:
+    """Claims, heartbeats and results of one queue directory for this process."""
+
+    def __init__(self, queue_dir, lease=LEASE):
+        self.queue_dir = queue_dir
+        self.lease = lease
+        self.worker = worker_id()
+        self.host = socket.gethostname()
+        self.held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        os.makedirs(os.path.join(queue_dir, "claims"), exist_ok=True)
+        os.makedirs(os.path.join(queue_dir, "done"), exist_ok=True)
+
+    def _claim_path(self, name):
+        return os.path.join(self.queue_dir, "claims", name + ".lock")
+
+    def _done_path(self, name):
+        return os.path.join(self.queue_dir, "done", name + ".json")
+
+    def _is_stale(self, path):
+        try:
+            age = time.time() - os.stat(path).st_mtime
+            with open(path) as f:
+                owner = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError:
+            # Claim still being written: only its age counts
+            return age > self.lease
+        if owner.get("host") == self.host and not _pid_alive(owner.get("pid", -1)):
+            return True
+        return age > self.lease
+
+    def _break(self, path):
+        # Only one worker wins the rename; a claim that turned out fresh is put back
+        broken = f"{path}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(path, broken)
+        except FileNotFoundError:
+            return
+        if not self._is_stale(broken):
+            try:
+                os.link(broken, path)
+            except FileExistsError:
+                pass
+        os.remove(broken)
+
+    def claim(self, name):
+        """True if this worker now holds the job (dead workers' claims are taken over)."""
+        if name in self.held:
+            return True
+        path = self._claim_path(name)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._is_stale(path):
+                    return False
+                print(f"  --> Taking over {name} from a dead worker")
+                self._break(path)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"worker": self.worker, "host": self.host, "pid": os.getpid(),
+                           "claimed_at": time.time()}, f)
+            with self._lock:
+                self.held.add(name)
+            self._start_heartbeat()
+            return True
+        return False
+
+    def release(self, name):
+        with self._lock:
+            self.held.discard(name)
+        try:
+            with open(self._claim_path(name)) as f:
+                ours = json.load(f).get("worker") == self.worker
+        except (OSError, ValueError):
+            return
+        if ours:
+            try:
+                os.remove(self._claim_path(name))
+            except FileNotFoundError:
+                pass
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name="lizard-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        while not self._stop.wait(self.lease / 4):
+            with self._lock:
+                held = list(self.held)
+            for name in held:
+                try:
+                    os.utime(self._claim_path(name))
+                except FileNotFoundError:
+                    pass
+
+    def result(self, name, key=None):
+        """The done record of a job (None if missing or from a run with another key)."""
+        try:
+            with open(self._done_path(name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if key is not None and record.get("key") != key:
+            return None
+        return record
+
+    def complete(self, name, result, key=None):
+        path = self._done_path(name)
+        tmp_path = path + f".tmp{uuid.uuid4().hex}"
+        with open(tmp_path, 'w') as f:
+            json.dump({"key": key, "result": result, "worker": self.worker, "finished_at": time.time()}, f)
+        os.replace(tmp_path, path)
+        self.release(name)
+
+    def close(self):
+        self._stop.set()
+        for name in list(self.held):
+            self.release(name)
+
+    def reduce_once(self, key, func):
+        """
+        Runs func() if no worker has reduced this run (same key) yet and none
+        is doing it right now. Returns True if this worker ran it.
+        """
+        if self.result(REDUCE_JOB, key) is not None or not self.claim(REDUCE_JOB):
+            return False
+        try:
+            if self.result(REDUCE_JOB, key) is not None:
+                return False
+            func()
+            self.complete(REDUCE_JOB, True, key)
+            return True
+        finally:
+            self.release(REDUCE_JOB)
+
+
+def run_queue(func, jobs, names, keys, queue, on_result=None, poll_interval=POLL_INTERVAL):
+    """
+    Runs func(*args) for every job not yet done by any worker of the queue,
+    then waits until the rest is done elsewhere (taking over jobs of dead
+    workers). Returns every job's result in job order, including the ones other
+    workers produced; results must be JSON-serializable.
+
+    on_result(job_index, result) is called for the jobs this worker ran.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    waiting = False
+    while pending:
+        progressed = False
+        for i in list(pending):
+            record = queue.result(names[i], keys[i])
+            if record is None and queue.claim(names[i]):
+                # It may have finished between the check and the claim
+                record = queue.result(names[i], keys[i])
+                if record is None:
+                    result = func(*jobs[i])
+                    queue.complete(names[i], result, keys[i])
+                    record = {"result": result}
+                    if on_result is not None:
+                        on_result(i, result)
+                else:
+                    queue.release(names[i])
+            if record is not None:
+                results[i] = record["result"]
+                pending.remove(i)
+                progressed = True
+        if pending and not progressed:
+            if not waiting:
+                print(f"Waiting for {len(pending)} jobs claimed by other workers")
+                waiting = True
+            time.sleep(poll_interval)
+    return results
@@ -0,0 +1,67 @@
+import gzip
+import io
+import os
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from lizard.nii_writer import COMPACT_SCALE, ParallelGzipWriter, write_image
+
+
+def make_image(array, spacing=(0.8, 0.8, 2.5), origin=(-40.0, -40.0, -100.0)):
+    img = sitk.GetImageFromArray(array)
+    img.SetSpacing(spacing)
+    img.SetOrigin(origin)
+    return img
+
+
+@pytest.mark.parametrize("chunks", [[1 << 20], [1, 4095, 70000, 3, 200000]])
+def test_parallel_gzip_round_trip(chunks):
+    rng = np.random.RandomState(0)
+    # Compressible but not trivial: small integers, several blocks long
+    data = rng.randint(0, 8, size=sum(chunks), dtype=np.uint8).tobytes()
+    out = io.BytesIO()
+    gz = ParallelGzipWriter(out, level=6, threads=3, block_size=64 * 1024)
+    pos = 0
+    for n in chunks:
+        gz.write(data[pos:pos + n])
+        pos += n
+    gz.close()
+    assert gzip.decompress(out.getvalue()) == data
+
+
+def test_pgzip_image_reads_back_in_itk(tmp_path):
+    array = np.random.RandomState(1).uniform(-100, 250, size=(9, 33, 40)).astype(np.float32)
+    img = make_image(array)
+    path = str(tmp_path / "ct.nii.gz")
+    write_image(img, path, codec="pgzip", compact=False, threads=2)
+    back = sitk.ReadImage(path)
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(back), array)
+    assert back.GetSpacing() == pytest.approx(img.GetSpacing())
+    assert back.GetOrigin() == pytest.approx(img.GetOrigin())
+    assert not [f for f in os.listdir(tmp_path) if ".tmp" in f]
+
+
+@pytest.mark.parametrize("codec, suffix", [("pgzip", ".nii.gz"), ("none", ".nii")])
+def test_compact_image_scl_slope_read_back(tmp_path, codec, suffix):
+    array = np.random.RandomState(2).uniform(-100, 250, size=(7, 20, 24)).astype(np.float32)
+    path = str(tmp_path / ("ct" + suffix))
+    write_image(make_image(array), path, codec=codec, compact=True, threads=2)
+
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    assert float(reader.GetMetaData("scl_slope")) == pytest.approx(1.0 / COMPACT_SCALE)
+    back = sitk.GetArrayFromImage(sitk.ReadImage(path))
+    # Stored as int16 steps of 1/COMPACT_SCALE HU, scaled back on read
+    np.testing.assert_allclose(back, array, atol=0.5 / COMPACT_SCALE + 1e-6)
+
+
+def test_compact_labels_are_uint8(tmp_path):
+    labels = np.random.RandomState(3).randint(0, 3, size=(5, 16, 16)).astype(np.float32)
+    path = str(tmp_path / "seg.nii.gz")
+    write_image(make_image(labels), path, codec="pgzip", compact=True, is_label=True, threads=2)
+    back = sitk.ReadImage(path)
+    assert back.GetPixelID() == sitk.sitkUInt8
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(back), labels.astype(np.uint8))
@@ -0,0 +1,41 @@
+import pytest
+
+from lizard.nnunet_export import make_plans, pool_and_conv_props
+
+FINGERPRINT = {"foreground_intensity_properties_per_channel": {"0": {}}}
+
+
+def total_strides(strides):
+    total = [1, 1, 1]
+    for stride in strides:
+        total = [t * s for t, s in zip(total, stride)]
+    return total
+
+
+@pytest.mark.parametrize("shape, spacing", [
+    ([61, 44, 58], [1.0, 1.0, 1.0]),      # median tight crop
+    ([7, 130, 9], [1.0, 1.0, 1.0]),       # axes too thin to pool
+    ([40, 200, 200], [3.0, 0.8, 0.8]),    # anisotropic
+])
+def test_patch_divisible_by_strides(shape, spacing):
+    config = make_plans("Dataset501_LiverVessels", FINGERPRINT, shape, spacing)["configurations"]["3d_fullres"]
+    arch = config["architecture"]["arch_kwargs"]
+    patch = config["patch_size"]
+    assert len(arch["strides"]) == len(arch["kernel_sizes"]) == arch["n_stages"]
+    for size, total in zip(patch, total_strides(arch["strides"])):
+        assert size % total == 0
+        # The deepest feature map keeps at least one voxel per axis
+        assert size // total >= 1
+
+
+def test_tight_crop_axes_pool_independently():
+    strides, _, patch = pool_and_conv_props([1.0, 1.0, 1.0], [61, 44, 58])
+    assert total_strides(strides) == [16, 8, 16]
+    assert patch == [64, 48, 64]
+
+
+def test_letterbox_grid_keeps_five_isotropic_pools():
+    strides, kernel_sizes, patch = pool_and_conv_props([1.0, 1.0, 1.0], [128, 128, 128])
+    assert strides == [[1, 1, 1]] + [[2, 2, 2]] * 5
+    assert kernel_sizes == [[3, 3, 3]] * 6
+    assert patch == [128, 128, 128]
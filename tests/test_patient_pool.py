@@ -0,0 +1,40 @@
+import os
+import time
+
+import pytest
+
+from lizard.patient_pool import run_patients
+
+
+def job(kind, value):
+    if kind == "sleep":
+        time.sleep(value)
+    elif kind == "die":
+        os._exit(3)
+    elif kind == "raise":
+        raise ValueError(value)
+    return value
+
+
+def test_killed_and_dead_jobs_get_the_failed_value(capsys):
+    jobs = [("ok", 1), ("sleep", 30), ("die", 0), ("ok", 4)]
+    seen = {}
+    results = run_patients(job, jobs, num_workers=2, timeout=0.5, failed="failed",
+                           names=[f"patient {i}" for i in range(4)], on_result=seen.__setitem__)
+    assert results == [1, "failed", "failed", 4]
+    assert seen == dict(enumerate(results))
+    out = capsys.readouterr().out
+    assert "patient 1: killed after the 0.5 s patient timeout" in out
+    assert "patient 2: worker died (exit code 3)" in out
+
+
+def test_job_errors_stop_the_scheduled_run():
+    with pytest.raises(ValueError, match="bad case"):
+        run_patients(job, [("ok", 1), ("raise", "bad case")], num_workers=2, timeout=30)
+
+
+def test_job_over_the_budget_runs_alone(capsys):
+    results = run_patients(job, [("ok", n) for n in range(3)], num_workers=2, costs=[10, 500, 50],
+                           budget_mb=400, names=["a", "b", "c"])
+    assert results == [0, 1, 2]
+    assert "b: estimated 500 MB exceeds the node budget (400 MB), running it alone" in capsys.readouterr().out
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from lizard.prefetch_pipeline import run_pipelined
+
+
+def run_with_timeout(func, timeout=10):
+    # The failure this guards against is a hang, so never block the test run on it
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "run_pipelined did not return"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def test_results_in_job_order_with_failed_stages():
+    def load(n):
+        if n == 2:
+            raise ValueError("unreadable")
+        return n
+
+    def compute(args, n):
+        if n == 4:
+            raise ValueError("bad volume")
+        return n * 10
+
+    seen = []
+    jobs = [(n,) for n in range(7)]
+    results = run_with_timeout(lambda: run_pipelined(load, compute, lambda args, v: v + 1, jobs, prefetch=2,
+                                                     write_queue=1, on_result=lambda i, r: seen.append(i),
+                                                     failed="failed"))
+    assert results == [1, 11, "failed", 31, "failed", 51, 61]
+    assert seen == list(range(7))
+
+
+@pytest.mark.parametrize("prefetch", [1, 3])
+def test_on_result_error_is_raised_in_the_caller(prefetch):
+    def on_result(i, result):
+        if i == 1:
+            raise OSError("checkpoint disk full")
+
+    # More jobs than the queues hold, so a dead writer would leave the caller blocked
+    jobs = [(n,) for n in range(20)]
+    with pytest.raises(OSError, match="checkpoint disk full"):
+        run_with_timeout(lambda: run_pipelined(lambda n: n, lambda args, n: n, lambda args, n: n, jobs,
+                                               prefetch=prefetch, write_queue=1, on_result=on_result))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from lizard.separable_resample import resample_separable
+
+# Input direction: y flipped and x/z swapped, so the axis mapping is exercised too
+PERMUTED = (0.0, 0.0, 1.0, 0.0, -1.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def make_image(array, direction=None):
+    img = sitk.GetImageFromArray(array)
+    img.SetSpacing((0.8, 0.9, 2.5))
+    img.SetOrigin((-15.0, 12.0, -40.0))
+    if direction is not None:
+        img.SetDirection(direction)
+    return img
+
+
+def make_resampler(img, interpolator, pixel_type=sitk.sitkUnknown, default=-1000):
+    # Output box overlaps the input only partly, so default-valued borders are covered as well
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetOutputSpacing((1.1, 0.7, 1.3))
+    resampler.SetSize((40, 36, 50))
+    resampler.SetOutputOrigin((-30.37, -10.21, -48.13))
+    resampler.SetOutputDirection((1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0))
+    resampler.SetInterpolator(interpolator)
+    resampler.SetDefaultPixelValue(default)
+    resampler.SetOutputPixelType(pixel_type)
+    return resampler
+
+
+@pytest.mark.parametrize("direction", [None, PERMUTED])
+@pytest.mark.parametrize("pixel_type, atol", [(sitk.sitkFloat32, 1e-4), (sitk.sitkInt16, 1)])
+def test_linear_matches_itk(direction, pixel_type, atol):
+    array = np.random.RandomState(5).uniform(-100, 250, size=(30, 40, 44)).astype(np.float32)
+    img = make_image(array, direction)
+    resampler = make_resampler(img, sitk.sitkLinear, pixel_type)
+    out = resample_separable(resampler, img)
+    expected = resampler.Execute(img)
+    assert out.GetPixelID() == expected.GetPixelID()
+    assert out.GetOrigin() == expected.GetOrigin()
+    assert out.GetSpacing() == pytest.approx(expected.GetSpacing())
+    np.testing.assert_allclose(sitk.GetArrayViewFromImage(out), sitk.GetArrayViewFromImage(expected),
+                               rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize("direction", [None, PERMUTED])
+def test_nearest_labels_are_identical(direction):
+    labels = np.random.RandomState(6).randint(0, 3, size=(30, 40, 44)).astype(np.uint8)
+    img = make_image(labels, direction)
+    resampler = make_resampler(img, sitk.sitkNearestNeighbor, default=0)
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(resample_separable(resampler, img)),
+                                  sitk.GetArrayFromImage(resampler.Execute(img)))
+
+
+def test_unsupported_grids_fall_back():
+    img = make_image(np.zeros((4, 5, 6), dtype=np.float32))
+    resampler = make_resampler(img, sitk.sitkLinear)
+    resampler.SetTransform(sitk.Euler3DTransform((0, 0, 0), 0.0, 0.0, 0.3))
+    assert resample_separable(resampler, img) is None
+    resampler = make_resampler(img, sitk.sitkBSpline)
+    assert resample_separable(resampler, img) is None
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from lizard.slab_resample import resample_to_file
+
+
+def make_resampler(img, interpolator, pixel_type=sitk.sitkUnknown):
+    # Finer, slightly shifted output grid so every slab interpolates between input slices
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetOutputSpacing((1.1, 1.1, 1.3))
+    resampler.SetSize((30, 28, 70))
+    resampler.SetOutputOrigin([o + 0.37 for o in img.GetOrigin()])
+    resampler.SetOutputDirection(img.GetDirection())
+    resampler.SetInterpolator(interpolator)
+    resampler.SetDefaultPixelValue(-1000)
+    resampler.SetOutputPixelType(pixel_type)
+    return resampler
+
+
+@pytest.mark.parametrize("interpolator, is_label", [(sitk.sitkLinear, False), (sitk.sitkNearestNeighbor, True)])
+@pytest.mark.parametrize("suffix", [".nii.gz", ".nii"])
+def test_budgeted_resample_is_bit_identical_for_images(tmp_path, interpolator, is_label, suffix):
+    rng = np.random.RandomState(4)
+    if is_label:
+        array = rng.randint(0, 3, size=(40, 32, 34)).astype(np.uint8)
+    else:
+        array = rng.uniform(-100, 250, size=(40, 32, 34)).astype(np.float32)
+    img = sitk.GetImageFromArray(array)
+    img.SetSpacing((1.0, 1.0, 2.5))
+    img.SetOrigin((-15.0, -16.0, -50.0))
+    resampler = make_resampler(img, interpolator)
+    expected = sitk.GetArrayFromImage(resampler.Execute(img))
+
+    path = str(tmp_path / ("out" + suffix))
+    # About 8 output slices per slab: many slabs, the last one partial
+    slice_mb = 30 * 28 * expected.itemsize / 1024**2
+    size = resample_to_file(resampler, img, path, is_label=is_label, budget_mb=16 * slice_mb,
+                            codec="pgzip", compact=False, threads=2)
+    assert size == (30, 28, 70)
+
+    back = sitk.ReadImage(path)
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(back), expected)
+    assert back.GetOrigin() == pytest.approx(resampler.GetOutputOrigin())
+    assert back.GetSpacing() == pytest.approx(resampler.GetOutputSpacing())
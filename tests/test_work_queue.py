@@ -0,0 +1,97 @@
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+from lizard.work_queue import WorkQueue, run_queue
+
+NUM_JOBS = 12
+
+
+def square(log_path, n):
+    # O_APPEND writes of one short line do not interleave between processes
+    with open(log_path, 'a') as f:
+        f.write(f"{n}\n")
+    time.sleep(0.01)
+    return n * n
+
+
+def worker(queue_dir, log_path, reduce_path, out_path):
+    queue = WorkQueue(queue_dir, lease=30)
+    jobs = [(log_path, n) for n in range(NUM_JOBS)]
+    names = [f"job{n}" for n in range(NUM_JOBS)]
+    keys = ["k"] * NUM_JOBS
+    try:
+        results = run_queue(square, jobs, names, keys, queue, poll_interval=0.05)
+
+        def reduce():
+            with open(reduce_path, 'a') as f:
+                f.write(f"{os.getpid()}\n")
+
+        queue.reduce_once("run", reduce)
+    finally:
+        queue.close()
+    with open(out_path, 'w') as f:
+        json.dump(results, f)
+
+
+def test_workers_split_the_jobs_and_reduce_once(tmp_path):
+    queue_dir, log_path, reduce_path = str(tmp_path / "queue"), str(tmp_path / "log"), str(tmp_path / "reduce")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=worker, args=(queue_dir, log_path, reduce_path, str(tmp_path / f"out{i}")))
+             for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    expected = [n * n for n in range(NUM_JOBS)]
+    for i in range(3):
+        with open(tmp_path / f"out{i}") as f:
+            # Every worker returns all results, including the ones others produced
+            assert json.load(f) == expected
+    with open(log_path) as f:
+        assert sorted(int(line) for line in f) == list(range(NUM_JOBS))
+    with open(reduce_path) as f:
+        assert len(f.read().split()) == 1
+    assert os.listdir(os.path.join(queue_dir, "claims")) == []
+
+
+def write_claim(queue, name, host, pid, age=0):
+    path = queue._claim_path(name)
+    with open(path, 'w') as f:
+        json.dump({"worker": f"{host}:{pid}", "host": host, "pid": pid, "claimed_at": time.time() - age}, f)
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+
+
+def dead_pid():
+    p = multiprocessing.get_context("fork").Process(target=time.sleep, args=(0,))
+    p.start()
+    p.join()
+    return p.pid
+
+
+def test_claim_of_dead_local_process_is_taken_over(tmp_path):
+    queue = WorkQueue(str(tmp_path), lease=30)
+    write_claim(queue, "job", socket.gethostname(), dead_pid())
+    try:
+        assert queue.claim("job")
+    finally:
+        queue.close()
+
+
+def test_claim_with_expired_heartbeat_is_taken_over(tmp_path):
+    queue = WorkQueue(str(tmp_path), lease=30)
+    write_claim(queue, "old", "other-host", 1, age=60)
+    write_claim(queue, "fresh", "other-host", 1, age=5)
+    try:
+        assert queue.claim("old")
+        # A live claim of another host is left alone
+        assert not queue.claim("fresh")
+    finally:
+        queue.close()
+    assert not os.path.exists(queue._claim_path("old"))
+    assert os.path.exists(queue._claim_path("fresh"))